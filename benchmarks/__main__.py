@@ -0,0 +1,325 @@
+import argparse
+import asyncio
+import datetime
+import importlib.metadata
+import io
+import json
+import logging
+import os
+import platform
+import sys
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from daiolog import QueueHandler, QueueListener, JsonFormatter, BatchStreamHandler, set_transport
+
+from .transport import NullHandler, run as run_transport
+
+SCENARIOS = ('caller', 'listener', 'threads', 'processes', 'asyncio')
+
+EXTRAS = {
+    'none': {},
+    'small': {'request_id': uuid.UUID(int=1), 'user_id': 42},
+    'large': {
+        'request_id': uuid.UUID(int=1),
+        'amount': Decimal('10.25'),
+        'at': datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc),
+        'tags': {'a', 'b', 'c'},
+        'headers': {'header-%d' % i: 'value-%d' % i for i in range(16)},
+        'items': [{'id': i, 'price': i * 1.5, 'name': 'item-%d' % i} for i in range(8)],
+    },
+}
+
+
+def percentiles(samples) -> dict:
+    samples = sorted(samples)
+    if not samples:
+        return {}
+    last = len(samples) - 1
+    return {
+        'mean': sum(samples) / len(samples),
+        'p50': samples[int(last * 0.5)],
+        'p90': samples[int(last * 0.9)],
+        'p99': samples[int(last * 0.99)],
+        'p999': samples[int(last * 0.999)],
+        'max': samples[-1],
+    }
+
+
+def make_logger(name: str) -> logging.Logger:
+    logger = logging.getLogger('benchmarks.%s' % name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers = [QueueHandler()]
+    return logger
+
+
+def drain(queue) -> None:
+    try:
+        while True:
+            queue.get_nowait()
+    except Exception:
+        pass
+
+
+def log_call(logger: logging.Logger, extra: dict, exception: bool):
+    if not exception:
+        return lambda i: logger.info('Benchmark record %s', i, extra=extra)
+    try:
+        raise ValueError('Benchmark error')
+    except ValueError:
+        exc_info = sys.exc_info()
+    return lambda i: logger.error('Benchmark record %s', i, extra=extra, exc_info=exc_info)
+
+
+def bench_caller(records: int, warmup: int):
+    """Caller side latency of logger calls through QueueHandler, listener is not running."""
+    logger = make_logger('caller')
+    queue = logger.handlers[0].queue
+    perf_counter_ns = time.perf_counter_ns
+    for extras, exception in [(name, False) for name in EXTRAS] + [('small', True)]:
+        call = log_call(logger, EXTRAS[extras], exception)
+        for i in range(warmup):
+            call(i)
+        drain(queue)
+        samples = []
+        for i in range(records):
+            started = perf_counter_ns()
+            call(i)
+            samples.append(perf_counter_ns() - started)
+        drain(queue)
+        yield {'extras': extras, 'exception': exception, 'records': records, 'caller_ns': percentiles(samples)}
+
+
+class Capture(logging.Handler):
+
+    def __init__(self, handler: QueueHandler, envelopes: list):
+        super().__init__()
+        self.handler = handler
+        self.envelopes = envelopes
+
+    def emit(self, record):
+        self.envelopes.append(self.handler.prepare(record))
+
+
+def bench_listener(records: int, warmup: int, batch_size: int = 256):
+    """Listener throughput of JsonFormatter and UniversalJSONEncoder on prepared records."""
+    handler = QueueHandler()
+    listener = QueueListener()
+    sink = BatchStreamHandler(stream=io.StringIO())
+    sink.setFormatter(JsonFormatter())
+    handlers = listener.handlers
+    listener.handlers = (sink,)
+    perf_counter_ns = time.perf_counter_ns
+    try:
+        for extras, exception in [(name, False) for name in EXTRAS] + [('small', True)]:
+            logger = make_logger('listener')
+            envelopes = []
+            logger.handlers = [Capture(handler, envelopes)]
+            call = log_call(logger, EXTRAS[extras], exception)
+            for i in range(warmup + records):
+                call(i)
+            batches = [envelopes[i:i + batch_size] for i in range(0, len(envelopes), batch_size)]
+            warmup_batches = max(warmup // batch_size, 1)
+            for batch in batches[:warmup_batches]:
+                listener.handle_batch(batch)
+            sink.setStream(io.StringIO())
+            samples = []
+            started = perf_counter_ns()
+            for batch in batches[warmup_batches:]:
+                batch_started = perf_counter_ns()
+                listener.handle_batch(batch)
+                samples.append((perf_counter_ns() - batch_started) / len(batch))
+            elapsed = (perf_counter_ns() - started) / 1e9
+            count = sum(len(batch) for batch in batches[warmup_batches:])
+            yield {
+                'extras': extras,
+                'exception': exception,
+                'records': count,
+                'records_per_sec': count / elapsed,
+                'bytes_per_record': len(sink.stream.getvalue().encode()) / count,
+                'record_ns': percentiles(samples),
+            }
+    finally:
+        listener.handlers = handlers
+
+
+def bench_threads(records: int, warmup: int, counts=(1, 2, 4, 8)):
+    """Caller latency and end-to-end throughput with several threads logging to a running listener."""
+    listener = QueueListener()
+    null_handler = NullHandler()
+    handlers = listener.handlers
+    listener.handlers = (null_handler,)
+    batch_size = listener.batch_size
+    listener.batch_size = 256
+    try:
+        for count in counts:
+            logger = make_logger('threads')
+            call = log_call(logger, EXTRAS['small'], False)
+            for i in range(warmup):
+                call(i)
+            drain(logger.handlers[0].queue)
+            null_handler.count = 0
+            per_thread = records // count
+            samples = [[] for _ in range(count)]
+
+            def produce(samples):
+                perf_counter_ns = time.perf_counter_ns
+                for i in range(per_thread):
+                    started = perf_counter_ns()
+                    call(i)
+                    samples.append(perf_counter_ns() - started)
+
+            threads = [threading.Thread(target=produce, args=(samples[i],)) for i in range(count)]
+            started = time.perf_counter()
+            listener.start()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            listener.stop()
+            elapsed = time.perf_counter() - started
+            yield {
+                'threads': count,
+                'records': null_handler.count,
+                'records_per_sec': null_handler.count / elapsed,
+                'caller_ns': percentiles([sample for thread in samples for sample in thread]),
+            }
+    finally:
+        listener.handlers = handlers
+        listener.batch_size = batch_size
+
+
+def bench_processes(records: int, warmup: int, counts=(1, 2, 4), transports=('process', 'shm')):
+    """Caller latency and throughput with worker processes, see benchmarks.transport."""
+    listener = QueueListener()
+    state = listener.handlers, listener._default_handlers, listener.batch_size
+    try:
+        for transport in transports:
+            for count in counts:
+                result = run_transport(transport, count, records // count)
+                result['processes'] = count
+                yield result
+    finally:
+        set_transport('thread', 0)
+        listener.handlers, listener._default_handlers, listener.batch_size = state
+
+
+def bench_asyncio(records: int, warmup: int, rates=(0, 1000, 5000), duration: float = 2.0, interval: float = 0.001):
+    """Event loop lag while a coroutine logs at a fixed rate, rate 0 is the baseline."""
+    listener = QueueListener()
+    null_handler = NullHandler()
+    handlers = listener.handlers
+    listener.handlers = (null_handler,)
+
+    async def scenario(rate: int) -> dict:
+        loop = asyncio.get_running_loop()
+        logger = make_logger('asyncio')
+        lags = []
+        stopped = loop.time() + duration
+
+        async def probe():
+            while loop.time() < stopped:
+                started = loop.time()
+                await asyncio.sleep(interval)
+                lags.append(max(loop.time() - started - interval, 0.0) * 1e6)
+
+        async def produce():
+            if not rate:
+                return
+            period = 0.01
+            per_tick = max(int(rate * period), 1)
+            i = 0
+            while loop.time() < stopped:
+                for _ in range(per_tick):
+                    logger.info('Benchmark record %s', i, extra=EXTRAS['small'])
+                    i += 1
+                await asyncio.sleep(period)
+
+        await asyncio.gather(probe(), produce())
+        return {'rate': rate, 'samples': len(lags), 'loop_lag_us': percentiles(lags)}
+
+    try:
+        for rate in rates:
+            null_handler.count = 0
+            listener.start()
+            try:
+                result = asyncio.run(scenario(rate))
+            finally:
+                listener.stop()
+            result['records'] = null_handler.count
+            yield result
+    finally:
+        listener.handlers = handlers
+
+
+BENCHMARKS = {
+    'caller': bench_caller,
+    'listener': bench_listener,
+    'threads': bench_threads,
+    'processes': bench_processes,
+    'asyncio': bench_asyncio,
+}
+
+
+def describe(result: dict) -> str:
+    params = ' '.join('%s=%s' % (key, value) for key, value in result.items() if not isinstance(value, dict))
+    stats = ' '.join(
+        '%s %s' % (key, ' '.join('%s=%.0f' % item for item in value.items()))
+        for key, value in result.items() if isinstance(value, dict)
+    )
+    return '%s %s' % (params, stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario', help=', '.join(SCENARIOS))
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--warmup', type=int, default=5000)
+    parser.add_argument('--quick', action='store_true', help='run with 10x fewer records')
+    parser.add_argument('--output', help='write results as JSON to the file')
+    args = parser.parse_args()
+    for scenario in args.scenarios:
+        if scenario not in BENCHMARKS:
+            parser.error('unknown scenario %r, expected one of %s' % (scenario, ', '.join(SCENARIOS)))
+    if args.quick:
+        args.records //= 10
+        args.warmup //= 10
+
+    try:
+        version = importlib.metadata.version('daiolog')
+    except importlib.metadata.PackageNotFoundError:
+        version = None
+
+    report = {
+        'meta': {
+            'version': version,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'records': args.records,
+            'warmup': args.warmup,
+            'started': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        },
+        'results': {},
+    }
+    for scenario in args.scenarios or SCENARIOS:
+        print('# %s' % scenario, file=sys.stderr)
+        results = report['results'][scenario] = []
+        for result in BENCHMARKS[scenario](args.records, args.warmup):
+            results.append(result)
+            print(describe(result), file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+import io
+import logging
+import timeit
+
+from daiolog import QueueHandler, QueueListener, set_metrics
+
+NUMBER = 50_000
+
+
+def main():
+    logger = logging.getLogger('benchmarks.metrics')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = QueueHandler()
+    logger.handlers = [handler]
+    listener = QueueListener(stream=io.StringIO(), batch_size=256)
+
+    for enabled in (False, True):
+        set_metrics(enabled)
+        listener.start()
+        listener.stop()  # applies metrics settings to the listener and its handlers
+        emit = min(timeit.repeat(
+            lambda: [logger.info('Benchmark record %s', i, extra={'index': i}) for i in range(NUMBER)],
+            number=1, repeat=5,
+        ))
+        records = []
+        while len(records) < NUMBER * 5:
+            records.append(handler.queue.get_nowait())
+        listener.handlers[0].setStream(io.StringIO())
+        batches = [records[i:i + 256] for i in range(0, NUMBER, 256)]
+        handle = min(timeit.repeat(lambda: [listener.handle_batch(batch) for batch in batches], number=1, repeat=5))
+        print('metrics %-5s caller %8.1f ns/record listener %8.1f ns/record' % (
+            'on' if enabled else 'off', emit / NUMBER * 1e9, handle / NUMBER * 1e9))
+    set_metrics(False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+import logging
+import time
+import timeit
+
+from daiolog import JsonFormatter
+from daiolog.formatters import TimestampRenderer
+
+NUMBER = 200_000
+
+
+def make_records(count: int, rate: int):
+    start = time.time()
+    records = []
+    for i in range(count):
+        created = start + i / rate
+        records.append(logging.makeLogRecord({
+            'created': created,
+            'msecs': int((created - int(created)) * 1000) + 0.0,
+        }))
+    return records
+
+
+def main():
+    formatter = JsonFormatter()
+    renderer = TimestampRenderer()
+    records = make_records(NUMBER, rate=5000)
+
+    for name, render in (('Formatter.formatTime', formatter.formatTime), ('TimestampRenderer', renderer.render)):
+        elapsed = min(timeit.repeat(lambda: [render(record) for record in records], number=1, repeat=5))
+        print('%-22s %8.1f ns/record' % (name, elapsed / NUMBER * 1e9))
+
+
+if __name__ == '__main__':
+    main()
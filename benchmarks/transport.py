@@ -0,0 +1,79 @@
+import argparse
+import logging
+import multiprocessing
+import statistics
+import time
+
+from daiolog import QueueHandler, QueueListener, set_transport
+
+
+class NullHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+
+    def handle(self, record):
+        self.count += 1
+
+    def handle_batch(self, records):
+        self.count += len(records)
+
+
+def produce(records: int, results):
+    logger = logging.getLogger('benchmarks.transport')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers = [QueueHandler()]
+    latencies = []
+    for i in range(records):
+        started = time.perf_counter_ns()
+        logger.info('Benchmark record %s', i, extra={'index': i, 'producer': 'benchmark'})
+        latencies.append(time.perf_counter_ns() - started)
+    latencies.sort()
+    results.put((latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]))
+
+
+def run(transport: str, processes: int, records: int) -> dict:
+    set_transport(transport)
+    null_handler = NullHandler()
+    listener = QueueListener()
+    listener.handlers = (null_handler,)
+    listener._default_handlers = listener.handlers
+    listener.batch_size = 256
+    results = multiprocessing.SimpleQueue()
+    producers = [multiprocessing.Process(target=produce, args=(records, results)) for _ in range(processes)]
+
+    started = time.perf_counter()
+    listener.start()
+    for producer in producers:
+        producer.start()
+    for producer in producers:
+        producer.join()
+    listener.stop()
+    elapsed = time.perf_counter() - started
+
+    latencies = [results.get() for _ in producers]
+    return {
+        'transport': transport,
+        'records': null_handler.count,
+        'records_per_sec': null_handler.count / elapsed,
+        'caller_p50_us': statistics.median(p50 for p50, _ in latencies) / 1000,
+        'caller_p99_us': max(p99 for _, p99 in latencies) / 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.transport')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--records', type=int, default=20000)
+    args = parser.parse_args()
+
+    for transport in ('process', 'shm'):
+        result = run(transport, args.processes, args.records)
+        print('%(transport)-8s %(records)8d records %(records_per_sec)10.0f rec/s '
+              'caller p50 %(caller_p50_us)7.1f us p99 %(caller_p99_us)7.1f us' % result)
+
+
+if __name__ == '__main__':
+    main()
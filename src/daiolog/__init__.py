@@ -1,5 +1,12 @@
-from .handler import QueueHandler
+from .handler import QueueHandler, set_transport, set_sinks, set_listener_options, set_metrics, set_fork_policy, \
+    set_priority
 from .json_encoder import UniversalJSONEncoder
 from .formatters import JsonFormatter
+from .binary import BinaryFormatter, BinaryFileSink
 from .listener import QueueListener
 from .decorators import entrypoint
+from .sinks import BatchStreamHandler, RotatingFileSink
+from .aio import LoopLagProbe
+from .metrics import prometheus_text
+from .ratelimit import RateLimiter
+from .context import bind_context, bound_context, clear_context
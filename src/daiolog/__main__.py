@@ -0,0 +1,78 @@
+import argparse
+import signal
+import sys
+
+from . import handler
+from .aggregator import LogCollector
+from .listener import QueueListener
+from .reader import BinaryReader, open_binary_log
+from .serializers import get_serializer
+
+
+def collect(args: argparse.Namespace) -> None:
+    if args.output:
+        handler.set_sinks([{
+            'class': 'daiolog.RotatingFileSink',
+            'filename': args.output,
+            'max_bytes': args.max_bytes,
+            'interval': args.interval,
+            'backup_count': args.backup_count,
+        }])
+    listener = QueueListener(batch_size=args.batch_size, linger=args.linger)
+    collector = LogCollector(args.socket, handler.queue)
+
+    def terminate(*_):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, terminate)
+    listener.start()
+    collector.start()
+    try:
+        signal.pause()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        collector.stop()
+        listener.stop()
+
+
+def decode(args: argparse.Namespace) -> None:
+    dumps = get_serializer(args.serializer).dumps
+    output = sys.stdout
+    for filename in args.files:
+        stream = sys.stdin.buffer if filename == '-' else open_binary_log(filename)
+        try:
+            for record in BinaryReader(stream):
+                output.write(dumps(record))
+                output.write('\n')
+        finally:
+            if stream is not sys.stdin.buffer:
+                stream.close()
+    output.flush()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m daiolog')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parser_collect = commands.add_parser('collect', help='collect records from worker processes over a unix socket')
+    parser_collect.add_argument('--socket', required=True, help='path of the unix datagram socket')
+    parser_collect.add_argument('--output', help='log file, sys.stderr by default')
+    parser_collect.add_argument('--max-bytes', type=int, default=0, help='rotate log file by size')
+    parser_collect.add_argument('--interval', type=float, default=0, help='rotate log file every N seconds')
+    parser_collect.add_argument('--backup-count', type=int, default=0, help='number of rotated files to keep')
+    parser_collect.add_argument('--batch-size', type=int, default=512)
+    parser_collect.add_argument('--linger', type=float, default=0.05)
+    parser_collect.set_defaults(func=collect)
+
+    parser_decode = commands.add_parser('decode', help='convert BinaryFormatter frames to JSON lines')
+    parser_decode.add_argument('files', nargs='+', help='binary log files, gzipped segments or - for stdin')
+    parser_decode.add_argument('--serializer', default='auto', help='auto, json or orjson')
+    parser_decode.set_defaults(func=decode)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,200 @@
+import errno
+import io
+import os
+import pickle
+import select
+import socket
+import threading
+import time
+from operator import attrgetter
+from queue import Empty, Full
+from typing import Any, Optional
+
+from .context import restore_context
+from .json_encoder import UniversalJSONEncoder
+from .records import LogEnvelope
+from .tracebacks import primitive_traceback
+
+__all__ = ['SocketQueue', 'LogCollector', 'RecordTooLarge', 'pack', 'unpack']
+
+MAX_DATAGRAM_SIZE = 1 << 20
+_PRIMITIVES = frozenset([str, int, float, bool, type(None)])
+_EXTRA = LogEnvelope.__slots__.index('extra')
+_EXC_FRAMES = LogEnvelope.__slots__.index('exc_frames')
+_CONTEXT = LogEnvelope.__slots__.index('context')
+_fields = attrgetter(*LogEnvelope.__slots__)
+
+
+class RecordTooLarge(Exception):
+    """The packed record does not fit into one datagram of the transport."""
+
+
+def _primitive(value: Any) -> Any:
+    # subclasses like IntEnum or numpy floats would be pickled as globals which unpack() rejects
+    if isinstance(value, str):
+        return str.__str__(value)
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    return None
+
+
+def _sanitize_key(key: Any) -> Any:
+    if type(key) in _PRIMITIVES:
+        return key
+    if isinstance(key, (str, int, float)):
+        return _primitive(key)
+    return str(key)
+
+
+def _sanitize(value: Any) -> Any:
+    if type(value) in _PRIMITIVES:
+        return value
+    if isinstance(value, dict):
+        return {_sanitize_key(key): _sanitize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_sanitize(item) for item in value]
+    if isinstance(value, (str, int, float)):
+        return _primitive(value)
+    return _sanitize(UniversalJSONEncoder.convert(value))
+
+
+def pack(record: LogEnvelope) -> bytes:
+    fields = list(_fields(record))
+    if record.exc_frames is not None:
+        fields[_EXC_FRAMES] = primitive_traceback(record.exc_frames)
+    fields[_EXTRA] = _sanitize(record.extra)
+    if record.context is not None:
+        fields[_CONTEXT] = (record.context.key, _sanitize(record.context.fields))
+    return pickle.dumps(tuple(fields), pickle.HIGHEST_PROTOCOL)
+
+
+class _PrimitiveUnpickler(pickle.Unpickler):
+
+    def find_class(self, module, name):
+        raise pickle.UnpicklingError('Global %s.%s is forbidden' % (module, name))
+
+
+def unpack(data: bytes) -> LogEnvelope:
+    fields = _PrimitiveUnpickler(io.BytesIO(data)).load()
+    if type(fields) is not tuple or len(fields) != len(LogEnvelope.__slots__):
+        raise ValueError('Malformed log record')
+    context = fields[_CONTEXT]
+    if context is not None:
+        if type(context) is not tuple or len(context) != 2 or type(context[0]) is not tuple \
+                or type(context[1]) is not dict:
+            raise ValueError('Malformed log record')
+        fields = fields[:_CONTEXT] + (restore_context(*context),) + fields[_CONTEXT + 1:]
+    return LogEnvelope(*fields)
+
+
+class SocketQueue:
+    remote = True
+
+    def __init__(self, maxsize: int = 0, address: Optional[str] = None):
+        if address is None:
+            raise ValueError('Socket transport requires address of the collector socket')
+        self.maxsize = maxsize
+        self.address = address
+        self._socket = None
+        self._pid = None
+
+    def put_nowait(self, item: Any) -> None:
+        self.put(item, False)
+
+    def put(self, item: Any, block: bool = True, timeout: Optional[float] = None) -> None:
+        if item is None:  # QueueListener sentinel, there is no local listener
+            return
+        data = pack(item)
+        if len(data) > MAX_DATAGRAM_SIZE:
+            raise RecordTooLarge(len(data))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                self._connect().send(data, socket.MSG_DONTWAIT)
+                return
+            except BlockingIOError:
+                pass
+            except OSError as exc:
+                if exc.errno == errno.EMSGSIZE:
+                    # the datagram is larger than the send buffer of the socket
+                    raise RecordTooLarge(len(data)) from None
+                self._close()
+                raise Full
+            if not block:
+                raise Full
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise Full
+            select.select([], [self._socket], [], remaining)
+
+    def get_nowait(self) -> Any:
+        raise Empty
+
+    def _connect(self) -> socket.socket:
+        if self._socket is None or self._pid != os.getpid():
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            try:
+                sock.connect(self.address)
+            except OSError:
+                sock.close()
+                raise
+            self._socket, self._pid = sock, os.getpid()
+        return self._socket
+
+    def _close(self) -> None:
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+class LogCollector:
+
+    def __init__(self, address: str, queue: Any):
+        self.address = address
+        self.queue = queue
+        self.received = 0
+        self.rejected = 0
+        self._socket = None
+        self._thread = None
+        self._stopping = False
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self.address)
+        os.chmod(self.address, 0o600)
+        self._stopping = False
+        self._thread = threading.Thread(target=self._receive, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stopping = True
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(b'', self.address)
+        self._thread.join()
+        self._thread = None
+        self._socket.close()
+        self._socket = None
+        os.unlink(self.address)
+
+    def _receive(self) -> None:
+        while True:
+            data = self._socket.recv(MAX_DATAGRAM_SIZE)
+            if not data:
+                if self._stopping:
+                    break
+                continue
+            try:
+                record = unpack(data)
+            except Exception:
+                self.rejected += 1
+                continue
+            self.received += 1
+            self.queue.put(record)
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+from typing import Optional
+
+__all__ = ['LoopLagProbe']
+
+
+class LoopLagProbe:
+
+    def __init__(self, interval: float = 0.1, report_interval: float = 60.0, logger: str = 'daiolog.loop_lag'):
+        self.interval = interval
+        self.report_interval = report_interval
+        self.logger = logging.getLogger(logger)
+        self._task: Optional[asyncio.Task] = None
+        self._reset()
+
+    def start(self) -> 'LoopLagProbe':
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self.report()
+
+    def stats(self) -> dict:
+        return {
+            'samples': self._samples,
+            'mean_ms': self._total / self._samples * 1000 if self._samples else 0.0,
+            'max_ms': self._max * 1000,
+        }
+
+    def report(self) -> None:
+        if self._samples:
+            self.logger.info('Event loop lag', extra={'loop_lag': self.stats()})
+        self._reset()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        report_at = loop.time() + self.report_interval
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            lag = max(now - started - self.interval, 0.0)
+            self._samples += 1
+            self._total += lag
+            self._max = max(self._max, lag)
+            if now >= report_at:
+                self.report()
+                report_at = now + self.report_interval
+
+    def _reset(self) -> None:
+        self._samples = 0
+        self._total = 0.0
+        self._max = 0.0
@@ -0,0 +1,275 @@
+import functools
+import struct
+from logging import LogRecord
+from typing import Any, Iterable, Optional
+
+from .formatters import JsonFormatter, lru_cache_info
+from .json_encoder import UniversalJSONEncoder
+from .records import LogEnvelope
+from .sinks import RotatingFileSink
+
+__all__ = ['FORMAT_VERSION', 'Packer', 'BinaryFormatter', 'BinaryFileSink']
+
+# a frame is a big-endian uint32 size and a MessagePack map of the record,
+# an array [FORMAT_VERSION, keys] is a header with the key dictionary of the following frames
+FORMAT_VERSION = 1
+
+MAX_DEPTH = 512
+
+_frame_size = struct.Struct('>I')
+_uint8, _uint16, _uint32, _uint64 = struct.Struct('>B'), struct.Struct('>H'), struct.Struct('>I'), struct.Struct('>Q')
+_int8, _int16, _int32, _int64 = struct.Struct('>b'), struct.Struct('>h'), struct.Struct('>i'), struct.Struct('>q')
+_float64 = struct.Struct('>d')
+
+
+def _json_key(key: Any) -> str:
+    # keys are converted like json.dumps does, int keys of a map are indexes of the key dictionary
+    if isinstance(key, str):
+        return str.__str__(key)
+    if key is True:
+        return 'true'
+    if key is False:
+        return 'false'
+    if key is None:
+        return 'null'
+    if isinstance(key, int):
+        return int.__repr__(key)
+    if isinstance(key, float):
+        return {'nan': 'NaN', 'inf': 'Infinity', '-inf': '-Infinity'}.get(repr(key), float.__repr__(key))
+    raise TypeError('keys must be str, int, float, bool or None, not %s' % type(key).__name__)
+
+
+def _frame(payload: bytes) -> bytes:
+    return _frame_size.pack(len(payload)) + payload
+
+
+class Packer:
+    """MessagePack encoder of JSON compatible values, keys found in the key dictionary are written as its indexes."""
+
+    def __init__(self, keys: Iterable[str] = ()):
+        self.keys = tuple(dict.fromkeys(keys))
+        self._keys = {}
+        for index, key in enumerate(self.keys):
+            buffer = bytearray()
+            self._pack_int(index, buffer)
+            self._keys[key] = bytes(buffer)
+
+    def pack(self, obj: Any) -> bytes:
+        buffer = bytearray()
+        self.pack_into(obj, buffer)
+        return bytes(buffer)
+
+    def pack_key(self, key: Any) -> bytes:
+        buffer = bytearray()
+        self._pack_key(key, buffer)
+        return bytes(buffer)
+
+    def pack_into(self, obj: Any, buffer: bytearray, depth: int = 0) -> None:
+        value_type = type(obj)
+        if value_type is str:
+            self._pack_str(obj, buffer)
+        elif obj is None:
+            buffer.append(0xc0)
+        elif obj is True:
+            buffer.append(0xc3)
+        elif obj is False:
+            buffer.append(0xc2)
+        elif value_type is int:
+            self._pack_int(obj, buffer)
+        elif value_type is float:
+            buffer.append(0xcb)
+            buffer += _float64.pack(obj)
+        elif value_type is dict:
+            self._pack_map(obj, buffer, depth)
+        elif value_type is list or value_type is tuple:
+            self._pack_array(obj, buffer, depth)
+        # subclasses are encoded like json does, other types with UniversalJSONEncoder converters
+        elif isinstance(obj, str):
+            self._pack_str(obj, buffer)
+        elif isinstance(obj, int):
+            self._pack_int(int.__index__(obj), buffer)
+        elif isinstance(obj, float):
+            buffer.append(0xcb)
+            buffer += _float64.pack(obj)
+        elif isinstance(obj, (list, tuple)):
+            self._pack_array(obj, buffer, depth)
+        elif isinstance(obj, dict):
+            self._pack_map(obj, buffer, depth)
+        else:
+            if depth >= MAX_DEPTH:
+                raise ValueError('Nesting of %s is deeper than %d' % (type(obj).__name__, MAX_DEPTH))
+            self.pack_into(UniversalJSONEncoder.convert(obj), buffer, depth + 1)
+
+    def pack_map_header(self, size: int, buffer: bytearray) -> None:
+        if size < 16:
+            buffer.append(0x80 | size)
+        elif size <= 0xffff:
+            buffer.append(0xde)
+            buffer += _uint16.pack(size)
+        else:
+            buffer.append(0xdf)
+            buffer += _uint32.pack(size)
+
+    def _pack_key(self, key: Any, buffer: bytearray) -> None:
+        if type(key) is not str:
+            key = _json_key(key)
+        encoded = self._keys.get(key)
+        if encoded is not None:
+            buffer += encoded
+        else:
+            self._pack_str(key, buffer)
+
+    def _pack_map(self, obj: dict, buffer: bytearray, depth: int) -> None:
+        if depth >= MAX_DEPTH:
+            raise ValueError('Nesting of dict is deeper than %d' % MAX_DEPTH)
+        self.pack_map_header(len(obj), buffer)
+        for key, value in obj.items():
+            self._pack_key(key, buffer)
+            self.pack_into(value, buffer, depth + 1)
+
+    def _pack_array(self, obj: Any, buffer: bytearray, depth: int) -> None:
+        if depth >= MAX_DEPTH:
+            raise ValueError('Nesting of list is deeper than %d' % MAX_DEPTH)
+        size = len(obj)
+        if size < 16:
+            buffer.append(0x90 | size)
+        elif size <= 0xffff:
+            buffer.append(0xdc)
+            buffer += _uint16.pack(size)
+        else:
+            buffer.append(0xdd)
+            buffer += _uint32.pack(size)
+        for value in obj:
+            self.pack_into(value, buffer, depth + 1)
+
+    @staticmethod
+    def _pack_str(obj: str, buffer: bytearray) -> None:
+        # lone surrogates are kept, json.dumps escapes them as well
+        data = obj.encode('utf-8', 'surrogatepass')
+        size = len(data)
+        if size < 32:
+            buffer.append(0xa0 | size)
+        elif size <= 0xff:
+            buffer.append(0xd9)
+            buffer.append(size)
+        elif size <= 0xffff:
+            buffer.append(0xda)
+            buffer += _uint16.pack(size)
+        else:
+            buffer.append(0xdb)
+            buffer += _uint32.pack(size)
+        buffer += data
+
+    @classmethod
+    def _pack_int(cls, obj: int, buffer: bytearray) -> None:
+        if 0 <= obj < 0x80:
+            buffer.append(obj)
+        elif -32 <= obj < 0:
+            buffer.append(obj & 0xff)
+        elif obj > 0:
+            if obj <= 0xff:
+                buffer.append(0xcc)
+                buffer += _uint8.pack(obj)
+            elif obj <= 0xffff:
+                buffer.append(0xcd)
+                buffer += _uint16.pack(obj)
+            elif obj <= 0xffffffff:
+                buffer.append(0xce)
+                buffer += _uint32.pack(obj)
+            elif obj <= 0xffffffffffffffff:
+                buffer.append(0xcf)
+                buffer += _uint64.pack(obj)
+            else:
+                cls._pack_str(int.__repr__(obj), buffer)
+        elif obj >= -0x80:
+            buffer.append(0xd0)
+            buffer += _int8.pack(obj)
+        elif obj >= -0x8000:
+            buffer.append(0xd1)
+            buffer += _int16.pack(obj)
+        elif obj >= -0x80000000:
+            buffer.append(0xd2)
+            buffer += _int32.pack(obj)
+        elif obj >= -0x8000000000000000:
+            buffer.append(0xd3)
+            buffer += _int64.pack(obj)
+        else:
+            cls._pack_str(int.__repr__(obj), buffer)
+
+
+class BinaryFormatter(JsonFormatter):
+    """
+    Length-prefixed MessagePack frames with the fields of JsonFormatter, `daiolog.reader` decodes them.
+    format() returns the JSON line of the record for handlers which write text.
+    """
+
+    def __init__(self, *args, keys: Optional[Iterable[str]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = []
+        for key, getter in self._plan:
+            fields.extend([key] if getter is not None else [key for key, _ in self._callsite_runs[key]])
+        self.packer = Packer(fields + [self._extra_key] if keys is None else keys)
+        self._binary_plan = tuple(
+            (self.packer.pack_key(key) if getter is not None else key, getter) for key, getter in self._plan
+        )
+        self._binary_extra_key = self.packer.pack_key(self._extra_key)
+        self._field_count = len(fields)
+        self._pack_callsite = functools.lru_cache(kwargs.get('callsite_cache_size', 1024))(self._pack_callsite)
+
+    def header(self) -> bytes:
+        """Frame with the key dictionary, precedes the frames of the formatter in a file."""
+        return _frame(self.packer.pack([FORMAT_VERSION, list(self.packer.keys)]))
+
+    def format_bytes(self, record: LogRecord) -> bytes:
+        packer = self.packer
+        extra = self._get_extra_fields(record)
+        context = record.context if isinstance(record, LogEnvelope) else None
+        if context is not None and context.fields:
+            extra = {**self._get_context_fields(context), **extra}
+        buffer = bytearray(_frame_size.size)
+        packer.pack_map_header(self._field_count + 1 if extra else self._field_count, buffer)
+        callsite = None
+        for key, getter in self._binary_plan:
+            if getter is not None:
+                buffer += key
+                packer.pack_into(getter(record), buffer)
+                continue
+            if callsite is None:
+                callsite = self._pack_callsite(record.name, record.pathname, record.funcName, record.lineno,
+                                               record.module)
+            buffer += callsite[key]
+        if extra:
+            buffer += self._binary_extra_key
+            packer.pack_into(extra, buffer)
+        _frame_size.pack_into(buffer, 0, len(buffer) - _frame_size.size)
+        return bytes(buffer)
+
+    def cache_info(self) -> dict:
+        return lru_cache_info(self._pack_callsite)
+
+    def _pack_callsite(self, name: str, pathname: str, funcName: str, lineno: int, module: str) -> tuple:  # noqa
+        values = {'logger_name': name, 'pathname': pathname, 'module': module, 'function': funcName, 'line': lineno}
+        fragments = []
+        for run in self._callsite_runs:
+            buffer = bytearray()
+            for key, field in run:
+                self.packer._pack_key(key, buffer)
+                self.packer.pack_into(values[field], buffer)
+            fragments.append(bytes(buffer))
+        return tuple(fragments)
+
+
+class BinaryFileSink(RotatingFileSink):
+    """RotatingFileSink of BinaryFormatter frames, every opened file starts with the key dictionary."""
+    terminator = ''
+
+    def __init__(self, filename: str, *args, **kwargs):
+        super().__init__(filename, *args, **kwargs)
+        self.setFormatter(BinaryFormatter())
+
+    def output_fd(self) -> Optional[int]:
+        return None if self.stream is None else self.stream.fileno()
+
+    def file_header(self) -> bytes:
+        # a new process may append to the file with another key dictionary
+        return self.formatter.header()
@@ -0,0 +1,90 @@
+import contextlib
+import itertools
+import os
+import threading
+from contextvars import ContextVar, Token
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .records import LOG_RECORD_BUILT_IN_ATTRS
+
+__all__ = ['BoundContext', 'get_context', 'bind_context', 'reset_context', 'bound_context', 'clear_context',
+           'restore_context']
+
+MAX_RESTORED = 1024
+
+_keys = itertools.count()
+# a pid is reused by later processes, the nonce tells their contexts apart
+_nonce = int.from_bytes(os.urandom(8), 'little')
+_restored: Dict[Tuple[int, int, int], 'BoundContext'] = {}
+_restored_lock = threading.Lock()
+
+
+class BoundContext:
+    """Immutable fields shared by records, formatters cache the encoded fields in `fragments`."""
+    __slots__ = ('fields', 'key', 'fragments')
+
+    def __init__(self, fields: Dict[str, Any], key: Optional[Tuple[int, int, int]] = None):
+        self.fields = fields
+        self.key = key if key is not None else (os.getpid(), _nonce, next(_keys))
+        self.fragments = {}
+
+    def __reduce__(self):
+        return restore_context, (self.key, self.fields)
+
+    def __repr__(self):
+        return '<BoundContext: %r>' % (self.fields,)
+
+
+def restore_context(key: Tuple[int, int, int], fields: Dict[str, Any]) -> BoundContext:
+    # records of one context received from another process share one instance and its fragments
+    context = _restored.get(key)
+    if context is None:
+        with _restored_lock:
+            if len(_restored) >= MAX_RESTORED:
+                del _restored[next(iter(_restored))]
+            context = _restored[key] = BoundContext(fields, key)
+    return context
+
+
+def _after_fork_in_child() -> None:
+    global _nonce
+    _nonce = int.from_bytes(os.urandom(8), 'little')
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+_context: ContextVar[Optional[BoundContext]] = ContextVar('daiolog_context', default=None)
+
+
+def get_context() -> Optional[BoundContext]:
+    return _context.get()
+
+
+def bind_context(**fields: Any) -> Token:
+    reserved = LOG_RECORD_BUILT_IN_ATTRS.intersection(fields)
+    if reserved:
+        # like extra of Logger.makeRecord, the fields are set as attributes of records
+        raise KeyError('Attempt to overwrite %s in LogRecord' % ', '.join(map(repr, sorted(reserved))))
+    current = _context.get()
+    if current is not None:
+        fields = {**current.fields, **fields}
+    return _context.set(BoundContext(fields))
+
+
+def reset_context(token: Token) -> None:
+    _context.reset(token)
+
+
+def clear_context() -> None:
+    _context.set(None)
+
+
+@contextlib.contextmanager
+def bound_context(**fields: Any) -> Iterator[BoundContext]:
+    token = bind_context(**fields)
+    try:
+        yield _context.get()
+    finally:
+        _context.reset(token)
@@ -1,30 +1,68 @@
 import functools
+import inspect
 import logging.config
 import typing as t
 
 from daiolog import QueueListener
+from . import handler as _handler
+from .aio import LoopLagProbe
 
 __all__ = ['entrypoint']
 
 
 class EntrypointDecorator:
 
-    def __init__(self, config: t.Union[str, dict, t.Callable[..., t.Union[str, dict]]]):
+    def __init__(self, config: t.Union[str, dict, t.Callable[..., t.Union[str, dict]]], *,
+                 loop_lag_interval: t.Optional[float] = None, loop_lag_report_interval: float = 60.0,
+                 listener_process: bool = False):
         self._config = config
+        self._listener_process = listener_process
+        self._loop_lag_interval = loop_lag_interval
+        self._loop_lag_report_interval = loop_lag_report_interval
 
     def __call__(self, func: t.Callable):
+        if inspect.iscoroutinefunction(func):
+            return self._wrap_coroutine_function(func)
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            listener = QueueListener()
             self._load_logging_config()
+            listeners = self._listeners()
             try:
-                listener.start()
+                for listener in listeners:
+                    listener.start(process=self._listener_process)
                 return func(*args, **kwargs)
             finally:
-                listener.stop()
+                for listener in listeners:
+                    listener.stop()
 
         return wrapper
 
+    def _wrap_coroutine_function(self, func: t.Callable):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            self._load_logging_config()
+            listeners = self._listeners()
+            probe = None
+            try:
+                for listener in listeners:
+                    listener.start(process=self._listener_process)
+                if self._loop_lag_interval:
+                    probe = LoopLagProbe(self._loop_lag_interval, self._loop_lag_report_interval).start()
+                return await func(*args, **kwargs)
+            finally:
+                if probe is not None:
+                    await probe.stop()
+                for listener in listeners:
+                    await listener.drain()
+
+        return wrapper
+
+    @staticmethod
+    def _listeners() -> t.List[QueueListener]:
+        # one listener per channel named by the handlers of the logging config
+        return [QueueListener(channel=channel) for channel in list(_handler.channels)]
+
     def _load_logging_config(self, config=None):
         if config is None:
             config = self._config
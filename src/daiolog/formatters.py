@@ -1,58 +1,239 @@
-import json
+import functools
 import time
 from logging import Formatter, LogRecord
+from operator import attrgetter, methodcaller
+from typing import Iterable, Mapping, Optional
 
-from . import UniversalJSONEncoder
+from .context import BoundContext
+from .json_encoder import UniversalJSONEncoder
+from .records import LOG_RECORD_BUILT_IN_ATTRS, LogEnvelope
+from .serializers import get_serializer
 
 
-LOG_RECORD_BUILT_IN_ATTRS = [
-    'asctime', 'created', 'exc_info', 'exc_text', 'filename', 'args',
-    'funcName', 'id', 'levelname', 'levelno', 'lineno', 'module', 'msg',
-    'msecs', 'msecs', 'message', 'name', 'pathname', 'process', 'stack_info',
-    'processName', 'relativeCreated', 'thread', 'threadName', 'extra',
-    # Also exclude legacy 'props'
-    'props', 'taskName',
-]
+DEFAULT_FIELDS = (
+    'logger_name', 'level', 'timestamp', 'message', 'pathname', 'module', 'function', 'line', 'traceback',
+)
+
+_TEXT, _BYTES = 0, 1
+
+# fields which are the same for every record of a callsite
+CALLSITE_FIELDS = frozenset(['logger_name', 'pathname', 'module', 'function', 'line'])
+
+
+def lru_cache_info(function) -> dict:
+    info = function.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'hits': info.hits,
+        'misses': info.misses,
+        'size': info.currsize,
+        'maxsize': info.maxsize,
+        'hit_rate': info.hits / lookups if lookups else 0.0,
+    }
+
+
+class TimestampRenderer:
+
+    def __init__(self, precision: str = 'ms'):
+        if precision == 'ms':
+            self.render = self._render_msecs
+        elif precision == 'us':
+            self.render = self._render_usecs
+        else:
+            raise ValueError('Unknown timestamp precision %r, expected ms or us' % precision)
+        self._cache = (None, '')
+
+    def __call__(self, record: LogRecord) -> str:
+        return self.render(record)
+
+    def _get_prefix(self, created: float) -> str:
+        second = int(created)
+        cached_second, prefix = self._cache
+        if second != cached_second:
+            prefix = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(created))
+            self._cache = (second, prefix)
+        return prefix
+
+    def _render_msecs(self, record: LogRecord) -> str:
+        return '%s.%03d+00:00' % (self._get_prefix(record.created), record.msecs)
+
+    def _render_usecs(self, record: LogRecord) -> str:
+        created = record.created
+        return '%s.%06d+00:00' % (self._get_prefix(created), (created - int(created)) * 1e6)
 
 
 class JsonFormatter(Formatter):
 
+    accepts_envelopes = True
     converter = time.gmtime
     default_time_format = '%Y-%m-%dT%H:%M:%S'
     default_msec_format = '%s.%03d+00:00'
 
+    def __init__(self, fmt=None, datefmt=None, style='%', validate=True, *,
+                 fields: Optional[Iterable[str]] = None,
+                 rename: Optional[Mapping[str, str]] = None,
+                 omit: Optional[Iterable[str]] = None,
+                 exclude: Optional[Iterable[str]] = None,
+                 timestamp_precision: str = 'ms',
+                 serializer: str = 'auto',
+                 callsite_cache_size: int = 1024,
+                 **kwargs):
+        super().__init__(fmt, datefmt, style, validate, **kwargs)
+        if (self.converter is time.gmtime
+                and self.default_time_format == JsonFormatter.default_time_format
+                and self.default_msec_format == JsonFormatter.default_msec_format
+                and type(self).formatTime is Formatter.formatTime):
+            format_time = TimestampRenderer(timestamp_precision).render
+        else:
+            format_time = self.formatTime
+        getters = {
+            'logger_name': attrgetter('name'),
+            'level': attrgetter('levelname'),
+            'timestamp': format_time,
+            'timestamp_ns': self._get_timestamp_ns,
+            'message': methodcaller('getMessage'),
+            'pathname': attrgetter('pathname'),
+            'module': attrgetter('module'),
+            'function': attrgetter('funcName'),
+            'line': attrgetter('lineno'),
+            'traceback': self._get_traceback,
+        }
+        fields = DEFAULT_FIELDS if fields is None else tuple(fields)
+        rename = dict(rename or {})
+        omit = frozenset(omit or ())
+        unknown = (set(fields) | omit | set(rename)) - set(getters) - {'extra'}
+        if unknown:
+            raise ValueError('Unknown JsonFormatter fields: %s' % ', '.join(sorted(unknown)))
+
+        self._extra_key = rename.get('extra', 'extra')
+        self._excluded = LOG_RECORD_BUILT_IN_ATTRS | frozenset(exclude or ())
+        self.serializer = get_serializer(serializer)
+
+        # fields are encoded in order, a run of callsite fields is one fragment cached per callsite
+        serializer = self.serializer
+        plan = []
+        self._callsite_runs = []
+        for field in dict.fromkeys(fields):
+            if field in omit:
+                continue
+            key = rename.get(field, field)
+            if field not in CALLSITE_FIELDS:
+                plan.append((key, getters[field]))
+                continue
+            if not plan or plan[-1][1] is not None:
+                plan.append((len(self._callsite_runs), None))
+                self._callsite_runs.append([])
+            self._callsite_runs[-1].append((key, field))
+        self._plan = tuple(plan)
+        segments = [
+            (serializer.dumps(key) + serializer.key_separator if getter is not None else key, getter)
+            for key, getter in plan
+        ]
+        extra_prefix = serializer.dumps(self._extra_key) + serializer.key_separator
+        # the same plan for str and for utf-8 bytes output, indexed by _TEXT and _BYTES
+        self._segments = (
+            tuple(segments),
+            tuple((key.encode() if getter is not None else key, getter) for key, getter in segments),
+        )
+        self._syntax = (
+            (serializer.item_separator, '{', '}', extra_prefix, 'null'),
+            (serializer.item_separator.encode(), b'{', b'}', extra_prefix.encode(), b'null'),
+        )
+        self._encoders = (
+            (serializer.dumps, serializer.encode_string),
+            (serializer.dumpb, serializer.encode_string_bytes),
+        )
+        self._encode_callsite = functools.lru_cache(callsite_cache_size)(self._encode_callsite)
+
     def format(self, record: LogRecord) -> str:
+        return self._format(record, _TEXT)
 
-        result = self._get_main_fields(record)
-        if extra := self._get_extra_fields(record):
-            result['extra'] = extra
+    def format_bytes(self, record: LogRecord) -> bytes:
+        """Format the record as UTF-8 encoded JSON without the intermediate str."""
+        return self._format(record, _BYTES)
 
-        return json.dumps(result, cls=UniversalJSONEncoder)
+    def cache_info(self) -> dict:
+        return lru_cache_info(self._encode_callsite)
 
-    @staticmethod
-    def _get_extra_fields(record: LogRecord) -> dict:
+    def _format(self, record: LogRecord, mode: int):
+        separator, opening, closing, extra_prefix, _ = self._syntax[mode]
+        chunks = self._encode_main_fields(record, mode)
+
+        extra = self._get_extra_fields(record)
+        fragment = None
+        context = record.context if isinstance(record, LogEnvelope) else None
+        if context is not None:
+            if not extra or context.fields.keys().isdisjoint(extra):
+                # the context is encoded once and goes into the extra object as is
+                fragment = self._get_context_fragment(context, mode)
+            else:
+                extra = {**self._get_context_fields(context), **extra}
+        if extra:
+            encoded = self._encoders[mode][0](extra)
+            if fragment:
+                encoded = opening + fragment + separator + encoded[1:]
+            chunks.append(extra_prefix + encoded)
+        elif fragment:
+            chunks.append(extra_prefix + opening + fragment + closing)
+
+        return opening + separator.join(chunks) + closing
+
+    def _encode_main_fields(self, record: LogRecord, mode: int) -> list:
+        callsite = self._encode_callsite(record.name, record.pathname, record.funcName, record.lineno, record.module)
+        callsite = callsite[mode]
+        dumps, encode_string = self._encoders[mode]
+        null = self._syntax[mode][4]
+        chunks = []
+        for key, getter in self._segments[mode]:
+            if getter is None:
+                chunks.append(callsite[key])
+                continue
+            value = getter(record)
+            if type(value) is str:
+                chunks.append(key + encode_string(value))
+            else:
+                chunks.append(key + (null if value is None else dumps(value)))
+        return chunks
+
+    def _encode_callsite(self, name: str, pathname: str, funcName: str, lineno: int, module: str) -> tuple:  # noqa
+        values = {'logger_name': name, 'pathname': pathname, 'module': module, 'function': funcName, 'line': lineno}
+        fragments = tuple(
+            self.serializer.dumps({key: values[field] for key, field in run})[1:-1]
+            for run in self._callsite_runs
+        )
+        return fragments, tuple(fragment.encode() for fragment in fragments)
+
+    def _get_context_fragment(self, context: BoundContext, mode: int):
+        cached = context.fragments.get(self)
+        if cached is None or cached[0] != UniversalJSONEncoder._version:
+            fields = self._get_context_fields(context)
+            fragment = self.serializer.dumps(fields)[1:-1] if fields else ''
+            cached = context.fragments[self] = (UniversalJSONEncoder._version, fragment, fragment.encode())
+        return cached[1 + mode]
+
+    def _get_context_fields(self, context: BoundContext) -> dict:
+        excluded = self._excluded
+        return {key: value for key, value in context.fields.items() if key not in excluded}
+
+    def _get_extra_fields(self, record: LogRecord) -> dict:
+        excluded = self._excluded
+        if isinstance(record, LogEnvelope):
+            items = record.extra.items()
+        else:
+            items = record.__dict__.items()
         return {
             key: value
-            for key, value in record.__dict__.items()
-            if key not in LOG_RECORD_BUILT_IN_ATTRS
+            for key, value in items
+            if key not in excluded
         }
 
-    def _get_main_fields(self, record: LogRecord) -> dict:
+    @staticmethod
+    def _get_timestamp_ns(record: LogRecord) -> int:
+        return int(record.created * 1_000_000_000)
+
+    def _get_traceback(self, record: LogRecord) -> Optional[str]:
         if record.exc_text:
-            traceback = record.exc_text
+            return record.exc_text
         elif record.exc_info:
-            traceback = self.formatException(record.exc_info)
-        else:
-            traceback = record.stack_info
-        data = {
-            'logger_name': record.name,
-            'level': record.levelname,
-            'timestamp': self.formatTime(record),
-            'message': record.getMessage(),
-            'pathname': record.pathname,
-            'module': record.module,
-            'function': record.funcName,
-            'line': record.lineno,
-            'traceback': traceback,
-        }
-        return data
+            return self.formatException(record.exc_info)
+        return record.stack_info
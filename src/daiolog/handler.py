@@ -1,24 +1,363 @@
-import copy
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+import weakref
+from collections import Counter
 from logging import LogRecord, Formatter
 from logging.handlers import QueueHandler as BuildInQueueHandler
-from multiprocessing import Queue
-from typing import Any
+from queue import Empty, Full, Queue, SimpleQueue
+from typing import Any, Optional, Sequence
 
-queue = Queue()
+from .aggregator import RecordTooLarge, SocketQueue
+from .context import get_context
+from .metrics import HandlerMetrics
+from .ratelimit import RateLimiter
+from .records import LogEnvelope, is_immutable
+from .tracebacks import capture_traceback
+from .shm import SharedMemoryQueue
+
+__all__ = ['QueueHandler', 'Channel', 'TRANSPORTS', 'OVERFLOW_POLICIES', 'FORK_POLICIES', 'DEFAULT_CHANNEL', 'get_channel',
+           'set_transport', 'set_sinks', 'set_listener_options', 'set_metrics', 'set_fork_policy', 'set_priority',
+           'LISTENER_OPTIONS', 'WAKEUP']
+
+
+def _thread_queue(capacity: int, address: Optional[str] = None) -> Any:
+    return Queue(capacity) if capacity > 0 else SimpleQueue()
+
+
+def _process_queue(capacity: int, address: Optional[str] = None) -> Any:
+    return multiprocessing.Queue(capacity)
+
+
+TRANSPORTS = {
+    'thread': _thread_queue,
+    'process': _process_queue,
+    'socket': SocketQueue,
+    'shm': SharedMemoryQueue,
+}
+
+OVERFLOW_POLICIES = ('block', 'drop_newest', 'drop_oldest', 'keep_warning')
+
+FORK_POLICIES = ('parent', 'fresh')
+
+LISTENER_OPTIONS = ('batch_size', 'linger', 'traceback_cache_size')
+
+DEFAULT_CHANNEL = 'default'
+
+
+class _Wakeup:
+    """Put into the queue after a record of the priority lane, the listener drains the lane when it gets it."""
+
+    def __reduce__(self):
+        return 'WAKEUP'
+
+    def __repr__(self):
+        return '<WAKEUP>'
+
+
+WAKEUP = _Wakeup()
+
+
+class Channel:
+    """Queue and sinks of one pipeline, every channel is drained by its own QueueListener."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.transport = 'thread'
+        self.capacity = 0
+        self.address = None
+        self.queue = SimpleQueue()
+        self.sinks = None
+        self.listener_options = None
+        self.remote = False
+        self.priority_level = None
+        self.priority_queue = None
+        self.listening = False
+        self.sequence = itertools.count()
+
+
+channels = {DEFAULT_CHANNEL: Channel(DEFAULT_CHANNEL)}
+metrics_enabled = False
+metrics_report_interval = None
+fork_policy = 'parent'
 formatter = Formatter()
+_handlers = weakref.WeakSet()
+
+
+def __getattr__(name: str) -> Any:
+    # transport, capacity, address, queue and sinks of the default channel
+    if name in ('transport', 'capacity', 'address', 'queue', 'sinks'):
+        return getattr(channels[DEFAULT_CHANNEL], name)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+def get_channel(name: str = DEFAULT_CHANNEL) -> Channel:
+    channel = channels.get(name)
+    if channel is None:
+        channel = channels[name] = Channel(name)
+    return channel
+
+
+def _priority_queue(channel: Channel) -> Any:
+    if channel.priority_level is None:
+        return None
+    if channel.transport not in ('thread', 'process'):
+        raise ValueError('Priority lane requires thread or process transport, got %r' % channel.transport)
+    # unbounded, records of the lane are never dropped
+    return TRANSPORTS[channel.transport](0)
+
+
+def _update_handlers(channel: Channel) -> None:
+    for handler in _handlers:
+        if handler.channel == channel.name:
+            handler.queue = channel.queue
+            handler.priority_level = channel.priority_level
+            handler.priority_queue = channel.priority_queue
+
+
+def set_transport(name: Optional[str] = None, maxsize: Optional[int] = None, path: Optional[str] = None,
+                  channel: str = DEFAULT_CHANNEL) -> Any:
+    channel = get_channel(channel)
+    if name is None:
+        name = channel.transport
+    if name not in TRANSPORTS:
+        raise ValueError('Unknown transport %r, expected one of %s' % (name, ', '.join(TRANSPORTS)))
+    if maxsize is None:
+        maxsize = channel.capacity
+    if name != 'socket':
+        path = None
+    elif path is None:
+        path = channel.address
+    if name != channel.transport or maxsize != channel.capacity or path != channel.address:
+        if channel.priority_level is not None and name not in ('thread', 'process'):
+            raise ValueError('Priority lane requires thread or process transport, got %r' % name)
+        channel.queue = TRANSPORTS[name](maxsize, path)
+        if name != channel.transport:
+            channel.transport = name
+            channel.priority_queue = _priority_queue(channel)
+        channel.capacity = maxsize
+        channel.address = path
+        _update_handlers(channel)
+    return channel.queue
+
+
+def set_sinks(specs: Optional[Sequence[dict]], channel: str = DEFAULT_CHANNEL) -> None:
+    get_channel(channel).sinks = None if specs is None else [{key: spec[key] for key in spec} for spec in specs]
+
+
+def set_listener_options(options: Optional[dict], channel: str = DEFAULT_CHANNEL) -> None:
+    if options is not None:
+        unknown = set(options) - set(LISTENER_OPTIONS)
+        if unknown:
+            raise ValueError('Unknown listener options %s, expected %s' % (
+                ', '.join(sorted(unknown)), ', '.join(LISTENER_OPTIONS)))
+        options = {key: options[key] for key in options}
+    get_channel(channel).listener_options = options
+
+
+def set_priority(level: Optional[Any] = logging.ERROR, channel: str = DEFAULT_CHANNEL) -> None:
+    channel = get_channel(channel)
+    level = None if level is None else logging._checkLevel(level)
+    if level == channel.priority_level:
+        return
+    if channel.listening:
+        # the listener drains the priority queue it got when it was started
+        raise RuntimeError('Priority lane of channel %r can not be changed while its listener runs' % channel.name)
+    enabled = channel.priority_level is not None
+    channel.priority_level = level
+    try:
+        if level is None or not enabled:
+            channel.priority_queue = _priority_queue(channel)
+    except ValueError:
+        channel.priority_level = None
+        raise
+    _update_handlers(channel)
+
+
+def set_metrics(enabled: bool = True, interval: Optional[float] = None) -> None:
+    global metrics_enabled, metrics_report_interval
+    metrics_enabled = enabled
+    metrics_report_interval = interval if enabled else None
+    for handler in _handlers:
+        if not enabled:
+            handler.metrics = None
+        elif handler.metrics is None:
+            handler.metrics = HandlerMetrics()
+
+
+def set_fork_policy(policy: str = 'parent') -> None:
+    global fork_policy
+    if policy not in FORK_POLICIES:
+        raise ValueError('Unknown fork policy %r, expected one of %s' % (policy, ', '.join(FORK_POLICIES)))
+    fork_policy = policy
+
+
+def _after_fork_in_child() -> None:
+    for channel in channels.values():
+        if fork_policy == 'parent' and channel.transport != 'thread':
+            # records of the child go to the listener of the parent process
+            for queue in (channel.queue, channel.priority_queue):
+                after_fork = getattr(queue, '_after_fork', None)
+                if after_fork is not None:
+                    after_fork()
+            channel.remote = True
+            continue
+        # the inherited queue may hold locks and records of the parent
+        channel.queue = TRANSPORTS[channel.transport](channel.capacity, channel.address)
+        channel.priority_queue = _priority_queue(channel)
+        channel.remote = False
+        _update_handlers(channel)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
 
 
 class QueueHandler(BuildInQueueHandler):
-    
-    def __init__(self, _=None):
-        super().__init__(queue)
+
+    def __init__(self, _=None, *, transport: Optional[str] = None, capacity: Optional[int] = None,
+                 address: Optional[str] = None, overflow: str = 'drop_newest', timeout: Optional[float] = 1.0,
+                 sinks: Optional[Sequence[dict]] = None, listener: Optional[dict] = None,
+                 rate_limit: Optional[float] = None, rate_burst: Optional[int] = None, rate_window: float = 1.0,
+                 defer_interpolation: bool = False, lazy_tracebacks: bool = True, channel: str = DEFAULT_CHANNEL,
+                 priority_level: Optional[Any] = None, sequence: bool = False):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('Unknown overflow policy %r, expected one of %s' % (
+                overflow, ', '.join(OVERFLOW_POLICIES)))
+        if address is not None and transport is None:
+            transport = 'socket'
+        if transport is not None or capacity is not None or address is not None:
+            set_transport(transport, capacity, address, channel)
+        if sinks is not None:
+            set_sinks(sinks, channel)
+        if listener is not None:
+            set_listener_options(listener, channel)
+        if priority_level is not None:
+            set_priority(priority_level, channel)
+        super().__init__(get_channel(channel).queue)
+        self.channel = channel
+        self.priority_level = get_channel(channel).priority_level
+        self.priority_queue = get_channel(channel).priority_queue
+        self.sequence = sequence
+        self.overflow = overflow
+        self.timeout = timeout
+        self.dropped = Counter()
+        self._pending_dropped = 0
+        self.metrics = HandlerMetrics() if metrics_enabled else None
+        self.rate_limiter = RateLimiter(rate_limit, rate_burst, rate_window) if rate_limit else None
+        self.defer_interpolation = defer_interpolation
+        self.lazy_tracebacks = lazy_tracebacks
+        _handlers.add(self)
+
+    def emit(self, record: LogRecord) -> None:
+        if self.sequence:
+            # order of enqueue across the lanes of the channel, next() of itertools.count is atomic
+            record.sequence = next(channels[self.channel].sequence)
+        if self.rate_limiter is None:
+            return self._emit(record)
+        for record in self.rate_limiter.acquire(record):
+            self._emit(record)
+
+    def flush(self) -> None:
+        if self.rate_limiter is not None:
+            self.acquire()
+            try:
+                for record in self.rate_limiter.flush():
+                    self._emit(record)
+            finally:
+                self.release()
+
+    def _emit(self, record: LogRecord) -> None:
+        metrics = self.metrics
+        if metrics is None:
+            return super().emit(record)
+        started = time.perf_counter()
+        super().emit(record)
+        metrics.enqueue_time.observe(time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        return {
+            'enqueued': self.metrics.enqueue_time.count if self.metrics is not None else None,
+            'dropped': dict(self.dropped),
+            'suppressed': self.rate_limiter.suppressed if self.rate_limiter is not None else None,
+            'enqueue_time': self.metrics.enqueue_time.snapshot() if self.metrics is not None else None,
+        }
 
     def prepare(self, record: LogRecord) -> Any:
-        msg = record.getMessage()
-        exc_text = formatter.formatException(record.exc_info) if record.exc_info else None
-        record = copy.copy(record)
-        record.msg = msg
-        record.args = None
-        record.exc_text = exc_text
-        record.exc_info = None
-        return record
+        exc_text = exc_frames = None
+        if record.exc_info:
+            if self.lazy_tracebacks:
+                # rendered by the listener, see QueueListener.prepare
+                exc_frames = capture_traceback(record.exc_info)
+            if exc_frames is None:
+                exc_text = formatter.formatException(record.exc_info)
+        if self.defer_interpolation and record.args and type(record.msg) is str and is_immutable(record.args):
+            # interpolated by the listener, immutable args can not change until then
+            return LogEnvelope.from_record(record, record.msg, exc_text, record.args, exc_frames, get_context())
+        return LogEnvelope.from_record(record, record.getMessage(), exc_text, None, exc_frames, get_context())
+
+    def enqueue(self, record: Any) -> None:
+        if self.priority_level is not None and record.levelno >= self.priority_level:
+            return self._enqueue_priority(record)
+        try:
+            self.queue.put_nowait(record)
+        except RecordTooLarge:
+            self.dropped['too_large'] += 1
+            return
+        except Full:
+            if not self._enqueue_overflow(record):
+                self.dropped[self.overflow] += 1
+                self._pending_dropped += 1
+            return
+        if self._pending_dropped:
+            self._enqueue_dropped_report()
+
+    def _enqueue_overflow(self, record: Any) -> bool:
+        if self.overflow == 'drop_newest':
+            return False
+        if self.overflow == 'drop_oldest':
+            try:
+                oldest = self.queue.get_nowait()
+            except Empty:
+                pass
+            else:
+                if oldest is None:  # QueueListener sentinel must survive
+                    self.queue.put(oldest)
+                    return False
+                if oldest is not WAKEUP:
+                    self.dropped[self.overflow] += 1
+                    self._pending_dropped += 1
+            try:
+                self.queue.put_nowait(record)
+            except Full:
+                return False
+            return True
+        if self.overflow == 'keep_warning' and record.levelno < logging.WARNING:
+            return False
+        try:
+            self.queue.put(record, True, self.timeout)
+        except Full:
+            return False
+        return True
+
+    def _enqueue_priority(self, record: Any) -> None:
+        self.priority_queue.put_nowait(record)
+        try:
+            self.queue.put_nowait(WAKEUP)
+        except Full:
+            pass  # the listener is busy with a full queue and checks the lane between batches
+
+    def _enqueue_dropped_report(self) -> None:
+        record = LogRecord(
+            'daiolog', logging.WARNING, __file__, 0,
+            '%s records dropped by queue overflow policy %r', (self._pending_dropped, self.overflow), None,
+            func='enqueue',
+        )
+        record.dropped = self._pending_dropped
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except Full:
+            return
+        self._pending_dropped = 0
@@ -1,30 +1,60 @@
+import dataclasses
+import enum
 import json
+import pathlib
 import typing
+import uuid
 import warnings
 import datetime as dt
+from decimal import Decimal
 
 
 class UniversalJSONEncoder(json.JSONEncoder):
     _encoders = {
         dt.date: lambda x: x.isoformat(),
         dt.datetime: lambda x: x.isoformat(),
-        set: list
+        dt.time: lambda x: x.isoformat(),
+        set: list,
+        frozenset: list,
+        tuple: list,  # NamedTuple
+        Decimal: str,
+        uuid.UUID: str,
+        enum.Enum: lambda x: x.value,
+        pathlib.PurePath: str,
+        bytes: lambda x: x.decode('utf-8', 'backslashreplace'),
     }
+    _cache = {}
+    _version = 0
 
     def default(self, obj):
+        return self.convert(obj)
+
+    @classmethod
+    def convert(cls, obj):
         try:
-            return json.JSONEncoder.default(self, obj)
-        except TypeError:
-            pass
+            converter = cls._cache[type(obj)]
+        except KeyError:
+            converter = cls._cache[type(obj)] = cls._resolve(type(obj))
 
-        if type(obj) in UniversalJSONEncoder._encoders:
+        if converter is not None:
             try:
-                return UniversalJSONEncoder._encoders[type(obj)](obj)
+                return converter(obj)
             except:  # noqa
                 warnings.warn("Encoding function %s used for type %s raised an exception. Trying something else." % \
-                              (UniversalJSONEncoder._encoders[type(obj)].__name__, type(obj)))
+                              (converter.__name__, type(obj)))
         return repr(obj)
 
+    @classmethod
+    def _resolve(cls, type_: typing.Type) -> typing.Optional[typing.Callable]:
+        for base in type_.__mro__:
+            if base in cls._encoders:
+                return cls._encoders[base]
+        if dataclasses.is_dataclass(type_):
+            return dataclasses.asdict
+        return None
+
     @classmethod
     def register_converter(cls, type: typing.Type, converter):  # noqa
         cls._encoders[type] = converter
+        cls._cache.clear()
+        UniversalJSONEncoder._version += 1
@@ -1,32 +1,441 @@
-from logging import StreamHandler
+import asyncio
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from collections import Counter
+import logging
+from logging import Formatter, Handler, LogRecord
+from logging.config import BaseConfigurator
 from logging.handlers import QueueListener as BuildInQueueListener
-from .handler import queue
+from queue import Empty
+from typing import Any, List, Optional, Sequence, Tuple, Union
+
+from . import handler as _handler
 from .formatters import JsonFormatter
+from .metrics import Histogram, ListenerMetrics
+from .records import LogEnvelope
+from .sinks import BatchStreamHandler
+from .tracebacks import TracebackRenderer
+
+
+def _build(spec: dict):
+    spec = dict(spec)
+    factory = spec.pop('()', None) or spec.pop('class')
+    if isinstance(factory, str):
+        factory = BaseConfigurator({}).resolve(factory)
+    return factory(**spec)
+
+
+def build_sink(spec: Union[dict, Handler]) -> Handler:
+    if isinstance(spec, Handler):
+        return spec
+    spec = dict(spec)
+    formatter = spec.pop('formatter', None)
+    level = spec.pop('level', 1)
+    handler = _build(spec)
+    if formatter is None:
+        formatter = handler.formatter or JsonFormatter()
+    elif not isinstance(formatter, Formatter):
+        formatter = _build(formatter)
+    handler.setFormatter(formatter)
+    handler.setLevel(level)
+    return handler
+
+
+def _plain(value: Any) -> Any:
+    # dictConfig wraps nested specs into Converting* containers, the child process gets plain ones
+    if isinstance(value, dict):
+        return {key: _plain(value[key]) for key in value}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+def _run_process(queue: Any, priority_queue: Any, specs: Optional[list], options: dict) -> None:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent stops the child with the sentinel
+    for reader in (queue, priority_queue):
+        # the child is the only reader, a killed predecessor may have held the reader lock
+        if getattr(reader, '_rlock', None) is not None:
+            reader._rlock = multiprocessing.Lock()
+    listener = type.__call__(QueueListener, **options)  # a private instance, not the singleton of the parent
+    listener.queue = queue
+    listener.priority_queue = priority_queue
+    if specs is not None:
+        listener.handlers = tuple(build_sink(spec) for spec in specs)
+    listener._needs_records = not all(getattr(handler, 'accepts_envelopes', False) for handler in listener.handlers)
+    try:
+        listener._monitor()
+    finally:
+        for handler in listener.handlers:
+            handler.flush()
+            handler.close()
 
 
 class MetaSingleton(type):
     _instances = {}
 
     def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = super(MetaSingleton, cls).__call__(*args, **kwargs)
-        return cls._instances[cls]
+        key = cls, kwargs.get('channel', _handler.DEFAULT_CHANNEL)
+        if key not in cls._instances:
+            cls._instances[key] = super(MetaSingleton, cls).__call__(*args, **kwargs)
+        return cls._instances[key]
 
 
 class QueueListener(BuildInQueueListener, metaclass=MetaSingleton):
+    restart_delay = 1.0
+    stop_timeout = 30.0
 
-    def __init__(self, *, stream=None, respect_handler_level=False):
-        handler = StreamHandler(stream=stream)
+    def __init__(self, *, stream=None, respect_handler_level=False, batch_size=1, linger=0.0,
+                 traceback_cache_size=256, channel=_handler.DEFAULT_CHANNEL):
+        handler = BatchStreamHandler(stream=stream)
         handler.setFormatter(JsonFormatter())
         handler.setLevel(1)
-        super().__init__(queue, handler, respect_handler_level=respect_handler_level)
+        super().__init__(_handler.get_channel(channel).queue, handler, respect_handler_level=respect_handler_level)
+        self.channel = channel
+        self.priority_queue = _handler.get_channel(channel).priority_queue
+        self.priority_records = 0
+        self.batch_size = batch_size
+        self.linger = linger
+        self.batch_sizes = Counter()
+        self._needs_records = True
+        self._default_handlers = self.handlers
+        self._sink_specs = None
+        self.metrics = None
+        self.report_interval = None
+        self._report_at = None
+        self.tracebacks = TracebackRenderer(traceback_cache_size)
+        self.process = None
+        self.restarts = 0
+        self._stopping = False
 
-    def start(self) -> None:
+    def start(self, process: bool = False) -> None:
         if self._thread is None:
-            super().start()
+            channel = _handler.get_channel(self.channel)
+            if channel.remote or getattr(channel.queue, 'remote', False):
+                return
+            if channel.listener_options is not None:
+                self._apply_options(channel.listener_options)
+            if process:
+                self._start_process()
+            else:
+                self._start_thread(channel)
+            channel.listening = True
+
+    def _start_thread(self, channel: _handler.Channel) -> None:
+        self.queue = channel.queue
+        self.priority_queue = channel.priority_queue
+        if channel.sinks is not self._sink_specs:
+            self._sink_specs = channel.sinks
+            self.handlers = self._default_handlers if self._sink_specs is None else tuple(
+                build_sink(spec) for spec in self._sink_specs
+            )
+        self._needs_records = not all(getattr(handler, 'accepts_envelopes', False) for handler in self.handlers)
+        self._setup_metrics()
+        super().start()
+
+    def _apply_options(self, options: dict) -> None:
+        # options of the channel from the config of its handlers override the arguments of the listener
+        self.batch_size = options.get('batch_size', self.batch_size)
+        self.linger = options.get('linger', self.linger)
+        size = options.get('traceback_cache_size')
+        if size is not None and size != self.tracebacks.cache_info()['maxsize']:
+            self.tracebacks = TracebackRenderer(size)
 
     def stop(self) -> None:
         if self._thread is not None:
+            _handler.get_channel(self.channel).listening = False
+            for handler in self._channel_handlers():
+                handler.flush()  # publish pending summaries of rate limited records
+            if self.process is not None:
+                return self._stop_process()
             super().stop()
+            if self._sink_specs is not None:
+                for handler in self.handlers:
+                    handler.close()
+                self.handlers = self._default_handlers
+                self._sink_specs = None
+
+    def _start_process(self) -> None:
+        channel = _handler.get_channel(self.channel)
+        if channel.transport not in ('thread', 'process'):
+            raise ValueError('Listener process requires thread or process transport, got %r' % channel.transport)
+        if channel.transport == 'thread':
+            _handler.set_transport('process', channel=self.channel)
+        self.queue = channel.queue
+        self.priority_queue = channel.priority_queue
+        self._stopping = False
+        self._spawn()
+        self._thread = threading.Thread(target=self._supervise, daemon=True)
+        self._thread.start()
+
+    def _spawn(self) -> None:
+        options = {
+            'respect_handler_level': self.respect_handler_level,
+            'batch_size': self.batch_size,
+            'linger': self.linger,
+            'traceback_cache_size': self.tracebacks.cache_info()['maxsize'],
+            'channel': self.channel,
+        }
+        sinks = _handler.get_channel(self.channel).sinks
+        specs = None if sinks is None else _plain(sinks)
+        self.process = multiprocessing.Process(
+            target=_run_process, args=(self.queue, self.priority_queue, specs, options), name='daiolog-listener-%s' % self.channel,
+            daemon=True,
+        )
+        _spawning.listener = True
+        try:
+            self.process.start()
+        finally:
+            _spawning.listener = False
+
+    def _supervise(self) -> None:
+        while True:
+            self.process.join()
+            # exit code 0 means the child has consumed the sentinel
+            if self.process.exitcode == 0 or self._stopping:
+                break
+            self.restarts += 1
+            time.sleep(self.restart_delay)
+            self._spawn()
+
+    def _stop_process(self) -> None:
+        self.enqueue_sentinel()
+        self._thread.join(self.stop_timeout)
+        if self._thread.is_alive():
+            self._stopping = True
+            self.process.terminate()
+            self._thread.join()
+        self._thread = None
+        self.process = None
+
+    def _after_fork_in_child(self, restart: bool = True) -> None:
+        # the thread and the process of the parent do not exist in the child
+        running = restart and self._thread is not None
+        self._thread = None
+        self.process = None
+        self.metrics = None
+        _handler.get_channel(self.channel).listening = False
+        for handler in self.handlers:
+            # the lock may have been held by the listener thread of the parent
+            handler.createLock()
+            after_fork = getattr(handler, '_after_fork_in_child', None)
+            if after_fork is not None:
+                after_fork()
+        if running:
+            self.start()
+
+    async def drain(self) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, self.stop)
+
+    def prepare(self, record):
+        if isinstance(record, LogEnvelope):
+            if record.exc_frames is not None:
+                record.exc_text = self.tracebacks.render(record.exc_frames)
+                record.exc_frames = None
+            if self._needs_records:
+                return record.to_record()
+        return record
+
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+    def batch_stats(self) -> dict:
+        batches = sum(self.batch_sizes.values())
+        records = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            'batches': batches,
+            'records': records,
+            'max': max(self.batch_sizes, default=0),
+            'mean': records / batches if batches else 0.0,
+            'sizes': dict(sorted(self.batch_sizes.items())),
+        }
+
+    def stats(self, buckets: bool = False) -> dict:
+        metrics = self.metrics
+        if metrics is None:
+            return {'enabled': False, 'queue_depth': self._queue_depth(), 'priority_records': self.priority_records,
+                    **self.batch_stats()}
+        enqueue_time = Histogram()
+        dropped = Counter()
+        for handler in self._channel_handlers():
+            dropped.update(handler.dropped)
+            if handler.metrics is not None:
+                enqueue_time.merge(handler.metrics.enqueue_time)
+        uptime = time.monotonic() - metrics.started
+        return {
+            'enabled': True,
+            'uptime': uptime,
+            'queue_depth': self._queue_depth(),
+            'priority_records': self.priority_records,
+            'enqueued': enqueue_time.count,
+            'dropped': dict(dropped),
+            'records': metrics.records,
+            'batches': metrics.batches,
+            'bytes': metrics.bytes,
+            'records_per_sec': metrics.records / uptime if uptime > 0 else 0.0,
+            'format_seconds': metrics.format_seconds,
+            'format_time_per_record': metrics.format_seconds / metrics.records if metrics.records else 0.0,
+            'write_seconds': metrics.write_seconds,
+            'write_time': metrics.write_time.snapshot(buckets),
+            'latency': metrics.latency.snapshot(buckets),
+            'enqueue_time': enqueue_time.snapshot(buckets),
+            'traceback_cache': self.tracebacks.cache_info(),
+            'callsite_cache': self._callsite_cache_info(),
+        }
+
+    def handle(self, record) -> None:
+        if self.metrics is not None:
+            return self.handle_batch([record])
+        super().handle(record)
+
+    def handle_batch(self, records: Sequence[LogRecord]) -> None:
+        records = [self.prepare(record) for record in records]
+        self.batch_sizes[len(records)] += 1
+        metrics = self.metrics
+        for handler in self.handlers:
+            if self.respect_handler_level:
+                batch = [record for record in records if record.levelno >= handler.level]
+            else:
+                batch = records
+            if not batch:
+                continue
+            if hasattr(handler, 'handle_batch'):
+                handler.handle_batch(batch)
+            elif metrics is not None:
+                started = time.perf_counter()
+                for record in batch:
+                    handler.handle(record)
+                metrics.observe_write(time.perf_counter() - started)
+            else:
+                for record in batch:
+                    handler.handle(record)
+        if metrics is not None:
+            metrics.observe_batch(records)
+            if self._report_at is not None and time.monotonic() >= self._report_at:
+                self._report()
+
+    def _setup_metrics(self) -> None:
+        if not _handler.metrics_enabled:
+            self.metrics = self.report_interval = self._report_at = None
+        else:
+            if self.metrics is None:
+                self.metrics = ListenerMetrics()
+            self.report_interval = _handler.metrics_report_interval
+            self._report_at = time.monotonic() + self.report_interval if self.report_interval else None
+        for handler in self.handlers:
+            if hasattr(handler, 'handle_batch'):
+                handler.metrics = self.metrics
+
+    def _report(self) -> None:
+        self._report_at = time.monotonic() + self.report_interval
+        record = LogRecord('daiolog.metrics', logging.INFO, __file__, 0, 'Logging pipeline stats', None, None,
+                           func='_report')
+        record.stats = self.stats()
+        self.handle_batch([record])
+
+    def _callsite_cache_info(self) -> dict:
+        hits = misses = size = 0
+        for handler in self.handlers:
+            cache_info = getattr(handler.formatter, 'cache_info', None)
+            if cache_info is not None:
+                info = cache_info()
+                hits += info['hits']
+                misses += info['misses']
+                size += info['size']
+        lookups = hits + misses
+        return {'hits': hits, 'misses': misses, 'size': size, 'hit_rate': hits / lookups if lookups else 0.0}
+
+    def _channel_handlers(self) -> list:
+        return [handler for handler in list(_handler._handlers) if handler.channel == self.channel]
+
+    def _queue_depth(self):
+        try:
+            return self.queue.qsize()
+        except (AttributeError, NotImplementedError):
+            return None
+
+    def _monitor(self) -> None:
+        try:
+            if self.batch_size <= 1 and self.priority_queue is None:
+                while True:
+                    record = self._dequeue()
+                    if record is self._sentinel:
+                        break
+                    self.handle(record)
+                return
+            while True:
+                batch, stopped = self._drain()
+                if self.priority_queue is not None:
+                    # records of the priority lane go before the backlog, each drain is handled as its own batch
+                    self._handle_priority()
+                if batch:
+                    self.handle_batch(batch)
+                if stopped:
+                    break
+        finally:
+            self._flush_handlers()
+
+    def _dequeue(self) -> Any:
+        try:
+            return self.queue.get_nowait()
+        except Empty:
+            # the queue is idle, data buffered by the sinks is written before waiting for records
+            self._flush_handlers()
+            return self.dequeue(True)
+
+    def _flush_handlers(self) -> None:
+        for handler in self.handlers:
+            handler.flush()
+
+    def _handle_priority(self) -> None:
+        batch = []
+        while True:
+            try:
+                batch.append(self.priority_queue.get_nowait())
+            except Empty:
+                break
+        if batch:
+            self.priority_records += len(batch)
+            self.handle_batch(batch)
+            # sinks buffer batches until the queue is idle, records of the lane are written at once
+            self._flush_handlers()
+
+    def _drain(self) -> Tuple[List[LogRecord], bool]:
+        record = self._dequeue()
+        if record is self._sentinel:
+            return [], True
+        if record is _handler.WAKEUP:
+            return [], False
+        batch = [record]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if timeout > 0:
+                    record = self.queue.get(True, timeout)
+                else:
+                    record = self.queue.get_nowait()
+            except Empty:
+                break
+            if record is self._sentinel:
+                return batch, True
+            if record is _handler.WAKEUP:
+                break  # do not linger, the priority lane has records
+            batch.append(record)
+        return batch, False
+
+
+_spawning = threading.local()
+
+
+def _after_fork_in_child() -> None:
+    # a forked listener process does not run the listeners of the parent
+    restart = not getattr(_spawning, 'listener', False)
+    for listener in list(MetaSingleton._instances.values()):
+        listener._after_fork_in_child(restart)
 
 
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,165 @@
+import time
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, Optional
+
+__all__ = ['Histogram', 'HandlerMetrics', 'ListenerMetrics', 'prometheus_text']
+
+
+# seconds, upper bounds of prometheus style buckets
+DEFAULT_BUCKETS = (
+    0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class Histogram:
+
+    def __init__(self, bounds: Iterable[float] = DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'Histogram') -> 'Histogram':
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return self.max
+
+    def cumulative(self) -> Dict[str, int]:
+        buckets = {}
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            buckets[repr(bound)] = seen
+        buckets['+Inf'] = self.count
+        return buckets
+
+    def snapshot(self, buckets: bool = False) -> dict:
+        rv = {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+        }
+        if buckets:
+            rv['buckets'] = self.cumulative()
+        return rv
+
+
+class HandlerMetrics:
+
+    def __init__(self):
+        self.enqueue_time = Histogram()
+
+
+class ListenerMetrics:
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.records = 0
+        self.batches = 0
+        self.bytes = 0
+        self.format_seconds = 0.0
+        self.write_seconds = 0.0
+        self.write_time = Histogram()
+        self.latency = Histogram()
+
+    def observe_write(self, seconds: float, data: Any = None, encoding: str = 'utf-8') -> None:
+        self.write_seconds += seconds
+        self.write_time.observe(seconds)
+        if isinstance(data, str):
+            # str.isascii() is O(1) in CPython, only non-ascii batches are encoded to be measured
+            self.bytes += len(data) if data.isascii() else len(data.encode(encoding, 'replace'))
+        elif data is not None:
+            self.bytes += len(data)
+
+    def observe_batch(self, records: Iterable[Any]) -> None:
+        now = time.time()
+        observe = self.latency.observe
+        count = 0
+        for record in records:
+            observe(max(now - record.created, 0.0))
+            count += 1
+        self.records += count
+        self.batches += 1
+
+
+_COUNTERS = (
+    ('records', 'records_total', 'Records written by the listener'),
+    ('batches', 'batches_total', 'Batches handled by the listener'),
+    ('bytes', 'bytes_total', 'Bytes written by batch sinks'),
+    ('enqueued', 'enqueued_total', 'Records enqueued by handlers'),
+    ('format_seconds', 'format_seconds_total', 'Time spent formatting records'),
+)
+
+_HISTOGRAMS = (
+    ('latency', 'latency_seconds', 'Time from record creation to write'),
+    # its sum is the time spent blocked on writes
+    ('write_time', 'write_seconds', 'Duration of a sink write'),
+    ('enqueue_time', 'enqueue_seconds', 'Caller time spent in QueueHandler.emit'),
+)
+
+
+def prometheus_text(stats: Optional[dict] = None, prefix: str = 'daiolog') -> str:
+    if stats is None:
+        from .listener import QueueListener
+        stats = QueueListener().stats(buckets=True)
+    lines = []
+    for key, name, description in _COUNTERS:
+        if key in stats:
+            lines.append('# HELP %s_%s %s' % (prefix, name, description))
+            lines.append('# TYPE %s_%s counter' % (prefix, name))
+            lines.append('%s_%s %r' % (prefix, name, stats[key]))
+    if stats.get('queue_depth') is not None:
+        lines.append('# HELP %s_queue_depth Records waiting in the queue' % prefix)
+        lines.append('# TYPE %s_queue_depth gauge' % prefix)
+        lines.append('%s_queue_depth %d' % (prefix, stats['queue_depth']))
+    if stats.get('dropped'):
+        lines.append('# HELP %s_dropped_total Records dropped by overflow policy' % prefix)
+        lines.append('# TYPE %s_dropped_total counter' % prefix)
+        for policy, count in sorted(stats['dropped'].items()):
+            lines.append('%s_dropped_total{policy="%s"} %d' % (prefix, policy, count))
+    caches = [(cache, stats[key]) for cache, key in (('callsite', 'callsite_cache'), ('traceback', 'traceback_cache'))
+              if stats.get(key)]
+    for name, description in (('hits', 'Cache hits'), ('misses', 'Cache misses')):
+        if caches:
+            lines.append('# HELP %s_cache_%s_total %s' % (prefix, name, description))
+            lines.append('# TYPE %s_cache_%s_total counter' % (prefix, name))
+        for cache, info in caches:
+            lines.append('%s_cache_%s_total{cache="%s"} %d' % (prefix, name, cache, info[name]))
+    for key, name, description in _HISTOGRAMS:
+        histogram = stats.get(key)
+        if not histogram or 'buckets' not in histogram:
+            continue
+        lines.append('# HELP %s_%s %s' % (prefix, name, description))
+        lines.append('# TYPE %s_%s histogram' % (prefix, name))
+        for bound, count in histogram['buckets'].items():
+            lines.append('%s_%s_bucket{le="%s"} %d' % (prefix, name, bound, count))
+        lines.append('%s_%s_sum %r' % (prefix, name, histogram['sum']))
+        lines.append('%s_%s_count %d' % (prefix, name, histogram['count']))
+    lines.append('')
+    return '\n'.join(lines)
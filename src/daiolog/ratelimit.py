@@ -0,0 +1,70 @@
+import copy
+from logging import LogRecord
+from typing import Dict, List, Optional, Tuple
+
+__all__ = ['RateLimiter']
+
+
+class _Bucket:
+    __slots__ = ('tokens', 'updated', 'suppressed', 'first', 'last')
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+        self.suppressed = 0
+        self.first = 0.0
+        self.last: Optional[LogRecord] = None
+
+
+class RateLimiter:
+
+    def __init__(self, rate: float = 10.0, burst: Optional[int] = None, window: float = 1.0, max_keys: int = 10000):
+        if rate <= 0:
+            raise ValueError('rate must be positive, got %r' % rate)
+        self.rate = rate
+        self.burst = burst if burst is not None else max(int(rate), 1)
+        self.window = window
+        self.max_keys = max_keys
+        self.suppressed = 0
+        self._buckets: Dict[Tuple[str, str, int], _Bucket] = {}
+
+    def acquire(self, record: LogRecord) -> List[LogRecord]:
+        key = (record.name, record.pathname, record.lineno)
+        now = record.created
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            records = self._evict() if len(self._buckets) >= self.max_keys else []
+            self._buckets[key] = _Bucket(self.burst - 1, now)
+            records.append(record)
+            return records
+        bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+        bucket.updated = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            if bucket.suppressed:
+                return [self._collapse(bucket), record]
+            return [record]
+        self.suppressed += 1
+        if not bucket.suppressed:
+            bucket.first = now
+        bucket.suppressed += 1
+        bucket.last = record
+        if now - bucket.first >= self.window:
+            return [self._collapse(bucket)]
+        return []
+
+    def flush(self) -> List[LogRecord]:
+        return [self._collapse(bucket) for bucket in self._buckets.values() if bucket.suppressed]
+
+    def _collapse(self, bucket: _Bucket) -> LogRecord:
+        record = copy.copy(bucket.last)
+        record.repeated = bucket.suppressed
+        record.first_created = bucket.first
+        record.last_created = bucket.last.created
+        bucket.suppressed = 0
+        bucket.last = None
+        return record
+
+    def _evict(self) -> List[LogRecord]:
+        bucket = self._buckets.pop(next(iter(self._buckets)))
+        return [self._collapse(bucket)] if bucket.suppressed else []
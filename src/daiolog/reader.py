@@ -0,0 +1,153 @@
+import gzip
+import struct
+from typing import Any, BinaryIO, Iterator, Sequence, Tuple
+
+from .binary import FORMAT_VERSION
+
+__all__ = ['unpackb', 'read_frames', 'BinaryReader', 'open_binary_log']
+
+_frame_size = struct.Struct('>I')
+
+_NUMBERS = {
+    0xca: struct.Struct('>f'),
+    0xcb: struct.Struct('>d'),
+    0xcc: struct.Struct('>B'),
+    0xcd: struct.Struct('>H'),
+    0xce: struct.Struct('>I'),
+    0xcf: struct.Struct('>Q'),
+    0xd0: struct.Struct('>b'),
+    0xd1: struct.Struct('>h'),
+    0xd2: struct.Struct('>i'),
+    0xd3: struct.Struct('>q'),
+}
+
+# type code: struct of the size, kind
+_SIZED = {
+    0xc4: (struct.Struct('>B'), 'bin'),
+    0xc5: (struct.Struct('>H'), 'bin'),
+    0xc6: (struct.Struct('>I'), 'bin'),
+    0xd9: (struct.Struct('>B'), 'str'),
+    0xda: (struct.Struct('>H'), 'str'),
+    0xdb: (struct.Struct('>I'), 'str'),
+    0xdc: (struct.Struct('>H'), 'array'),
+    0xdd: (struct.Struct('>I'), 'array'),
+    0xde: (struct.Struct('>H'), 'map'),
+    0xdf: (struct.Struct('>I'), 'map'),
+}
+
+_CONSTANTS = {0xc0: None, 0xc2: False, 0xc3: True}
+
+
+def unpackb(data: bytes, keys: Sequence[str] = ()) -> Any:
+    """Decode one MessagePack object, int keys of maps are indexes of `keys`."""
+    try:
+        obj, offset = _unpack(data, 0, keys)
+    except (IndexError, struct.error):
+        raise ValueError('Truncated MessagePack data') from None
+    if offset != len(data):
+        raise ValueError('Extra data after MessagePack object at offset %d' % offset)
+    return obj
+
+
+def _unpack(data: bytes, offset: int, keys: Sequence[str]) -> Tuple[Any, int]:
+    code = data[offset]
+    offset += 1
+    if code < 0x80:
+        return code, offset
+    if code >= 0xe0:
+        return code - 0x100, offset
+    if code >= 0xa0 and code < 0xc0:
+        return _unpack_str(data, offset, code & 0x1f)
+    if code >= 0x90 and code < 0xa0:
+        return _unpack_array(data, offset, code & 0x0f, keys)
+    if code < 0x90:
+        return _unpack_map(data, offset, code & 0x0f, keys)
+    if code in _CONSTANTS:
+        return _CONSTANTS[code], offset
+    number = _NUMBERS.get(code)
+    if number is not None:
+        return number.unpack_from(data, offset)[0], offset + number.size
+    if code not in _SIZED:
+        raise ValueError('Unsupported MessagePack type 0x%02x at offset %d' % (code, offset - 1))
+    size, kind = _SIZED[code]
+    length = size.unpack_from(data, offset)[0]
+    offset += size.size
+    if kind == 'str':
+        return _unpack_str(data, offset, length)
+    if kind == 'array':
+        return _unpack_array(data, offset, length, keys)
+    if kind == 'map':
+        return _unpack_map(data, offset, length, keys)
+    end = offset + length
+    if end > len(data):
+        raise IndexError(end)
+    return bytes(data[offset:end]), end
+
+
+def _unpack_str(data: bytes, offset: int, length: int) -> Tuple[str, int]:
+    end = offset + length
+    if end > len(data):
+        raise IndexError(end)
+    return bytes(data[offset:end]).decode('utf-8', 'surrogatepass'), end
+
+
+def _unpack_array(data: bytes, offset: int, length: int, keys: Sequence[str]) -> Tuple[list, int]:
+    items = []
+    for _ in range(length):
+        item, offset = _unpack(data, offset, keys)
+        items.append(item)
+    return items, offset
+
+
+def _unpack_map(data: bytes, offset: int, length: int, keys: Sequence[str]) -> Tuple[dict, int]:
+    items = {}
+    for _ in range(length):
+        key, offset = _unpack(data, offset, keys)
+        if type(key) is int:
+            try:
+                key = keys[key]
+            except IndexError:
+                raise ValueError('Key %d is not in the key dictionary' % key) from None
+        value, offset = _unpack(data, offset, keys)
+        items[key] = value
+    return items, offset
+
+
+def read_frames(stream: BinaryIO) -> Iterator[bytes]:
+    while True:
+        prefix = stream.read(_frame_size.size)
+        if not prefix:
+            return
+        if len(prefix) < _frame_size.size:
+            raise ValueError('Truncated frame size')
+        size = _frame_size.unpack(prefix)[0]
+        payload = stream.read(size)
+        if len(payload) < size:
+            raise ValueError('Truncated frame, expected %d bytes, got %d' % (size, len(payload)))
+        yield payload
+
+
+class BinaryReader:
+    """Records of BinaryFormatter frames as dicts, a header frame replaces the key dictionary."""
+
+    def __init__(self, stream: BinaryIO, keys: Sequence[str] = ()):
+        self.stream = stream
+        self.keys = tuple(keys)
+
+    def __iter__(self) -> Iterator[dict]:
+        for payload in read_frames(self.stream):
+            obj = unpackb(payload, self.keys)
+            if type(obj) is list:
+                version, keys = obj
+                if version != FORMAT_VERSION:
+                    raise ValueError('Unsupported format version %r, expected %d' % (version, FORMAT_VERSION))
+                self.keys = tuple(keys)
+                continue
+            yield obj
+
+
+def open_binary_log(filename: str) -> BinaryIO:
+    # rotated segments of BinaryFileSink are gzipped
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rb')
+    return open(filename, 'rb')
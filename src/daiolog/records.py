@@ -0,0 +1,135 @@
+import logging
+import os
+import sys
+from logging import LogRecord
+from typing import TYPE_CHECKING, Any, Optional
+
+from .tracebacks import primitive_traceback
+
+if TYPE_CHECKING:
+    from .context import BoundContext
+
+__all__ = ['LOG_RECORD_BUILT_IN_ATTRS', 'LogEnvelope', 'is_immutable']
+
+
+LOG_RECORD_BUILT_IN_ATTRS = frozenset([
+    'asctime', 'created', 'exc_info', 'exc_text', 'filename', 'args',
+    'funcName', 'id', 'levelname', 'levelno', 'lineno', 'module', 'msg',
+    'msecs', 'message', 'name', 'pathname', 'process', 'stack_info',
+    'processName', 'relativeCreated', 'thread', 'threadName', 'extra',
+    # Also exclude legacy 'props'
+    'props', 'taskName',
+])
+
+
+_HAS_TASK_NAME = sys.version_info >= (3, 12)
+
+_IMMUTABLE_TYPES = frozenset([str, int, float, bool, type(None)])
+
+
+def is_immutable(value: Any) -> bool:
+    if type(value) is tuple:
+        return all(is_immutable(item) for item in value)
+    return type(value) in _IMMUTABLE_TYPES
+
+
+class LogEnvelope:
+    __slots__ = (
+        'name', 'levelno', 'levelname', 'created', 'msecs', 'msg', 'args',
+        'pathname', 'module', 'funcName', 'lineno', 'exc_text', 'exc_frames', 'stack_info', 'extra', 'context',
+        'process', 'processName', 'thread', 'threadName', 'taskName',
+    )
+
+    exc_info = None
+
+    def __init__(self, name: str, levelno: int, levelname: str, created: float, msecs: float, msg: Any,
+                 args: Optional[tuple], pathname: str, module: str, funcName: str, lineno: int,  # noqa
+                 exc_text: Optional[str], exc_frames: Optional[tuple], stack_info: Optional[str], extra: dict,
+                 context: Optional['BoundContext'] = None, process: Optional[int] = None,
+                 processName: Optional[str] = None, thread: Optional[int] = None,  # noqa
+                 threadName: Optional[str] = None, taskName: Optional[str] = None):  # noqa
+        self.name = name
+        self.levelno = levelno
+        self.levelname = levelname
+        self.created = created
+        self.msecs = msecs
+        self.msg = msg
+        self.args = args
+        self.pathname = pathname
+        self.module = module
+        self.funcName = funcName
+        self.lineno = lineno
+        self.exc_text = exc_text
+        self.exc_frames = exc_frames
+        self.stack_info = stack_info
+        self.extra = extra
+        self.context = context
+        self.process = process
+        self.processName = processName
+        self.thread = thread
+        self.threadName = threadName
+        self.taskName = taskName
+
+    @classmethod
+    def from_record(cls, record: LogRecord, msg: Any, exc_text: Optional[str],
+                    args: Optional[tuple] = None, exc_frames: Optional[tuple] = None,
+                    context: Optional['BoundContext'] = None) -> 'LogEnvelope':
+        return cls(
+            record.name, record.levelno, record.levelname, record.created, record.msecs, msg, args,
+            record.pathname, record.module, record.funcName, record.lineno,
+            exc_text, exc_frames, record.stack_info,
+            {
+                key: value
+                for key, value in record.__dict__.items()
+                if key not in LOG_RECORD_BUILT_IN_ATTRS
+            },
+            context, record.process, record.processName, record.thread, record.threadName,
+            getattr(record, 'taskName', None),
+        )
+
+    def getMessage(self) -> str:  # noqa
+        msg = str(self.msg)
+        if self.args:
+            msg = msg % self.args
+        return msg
+
+    def to_record(self) -> LogRecord:
+        record = LogRecord.__new__(LogRecord)
+        record.__dict__.update(
+            name=self.name,
+            msg=self.msg,
+            args=self.args,
+            levelname=self.levelname,
+            levelno=self.levelno,
+            pathname=self.pathname,
+            filename=os.path.basename(self.pathname),
+            module=self.module,
+            exc_info=None,
+            exc_text=self.exc_text,
+            stack_info=self.stack_info,
+            lineno=self.lineno,
+            funcName=self.funcName,
+            created=self.created,
+            msecs=self.msecs,
+            relativeCreated=(self.created - logging._startTime) * 1000,
+            thread=self.thread,
+            threadName=self.threadName,
+            processName=self.processName,
+            process=self.process,
+        )
+        if _HAS_TASK_NAME or self.taskName is not None:
+            # LogRecord has taskName since Python 3.12
+            record.taskName = self.taskName
+        if self.context is not None:
+            record.__dict__.update(self.context.fields)
+        record.__dict__.update(self.extra)
+        return record
+
+    def __reduce__(self):
+        fields = [getattr(self, name) for name in self.__slots__]
+        if self.exc_frames is not None:
+            fields[self.__slots__.index('exc_frames')] = primitive_traceback(self.exc_frames)
+        return self.__class__, tuple(fields)
+
+    def __repr__(self):
+        return '<LogEnvelope: %s, %s, %s, %s, "%s">' % (self.name, self.levelno, self.pathname, self.lineno, self.msg)
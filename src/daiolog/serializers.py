@@ -0,0 +1,114 @@
+import abc
+import enum
+import json
+import json.encoder
+import uuid
+from typing import Any
+
+from .json_encoder import UniversalJSONEncoder
+
+__all__ = ['Serializer', 'StdlibSerializer', 'OrjsonSerializer', 'SERIALIZERS', 'get_serializer']
+
+
+class _ProbeEnum(enum.Enum):
+    member = 'value'
+
+
+class Serializer(abc.ABC):
+    name = ''
+    item_separator = ', '
+    key_separator = ': '
+
+    @abc.abstractmethod
+    def dumps(self, obj: Any) -> str:
+        """JSON text of obj."""
+
+    def dumpb(self, obj: Any) -> bytes:
+        return self.dumps(obj).encode()
+
+    def encode_string(self, value: str) -> str:
+        return self.dumps(value)
+
+    def encode_string_bytes(self, value: str) -> bytes:
+        return self.encode_string(value).encode()
+
+
+class StdlibSerializer(Serializer):
+    name = 'json'
+
+    def __init__(self):
+        self._encode = json.JSONEncoder(default=UniversalJSONEncoder.convert).encode
+        self.encode_string = json.encoder.encode_basestring_ascii
+
+    def dumps(self, obj: Any) -> str:
+        return self._encode(obj)
+
+
+class OrjsonSerializer(Serializer):
+    name = 'orjson'
+    item_separator = ','
+    key_separator = ':'
+
+    def __init__(self):
+        import orjson
+
+        self._orjson_dumps = orjson.dumps
+        self._option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        self._fallback = StdlibSerializer()
+        self._version = None
+        self._compatible = False
+
+    def dumps(self, obj: Any) -> str:
+        return self.dumpb(obj).decode()
+
+    def dumpb(self, obj: Any) -> bytes:
+        if self._version != UniversalJSONEncoder._version:
+            self._version = UniversalJSONEncoder._version
+            self._compatible = self._is_compatible()
+        if self._compatible:
+            try:
+                return self._orjson_dumps(obj, default=UniversalJSONEncoder.convert, option=self._option)
+            except TypeError:
+                # orjson.JSONEncodeError: integers over 64 bits, circular references and alike
+                pass
+        return self._fallback.dumpb(obj)
+
+    def encode_string(self, value: str) -> str:
+        # escapes like orjson, strings with surrogates are left to orjson and its fallback
+        if value.isascii():
+            return json.encoder.encode_basestring(value)
+        return self.dumps(value)
+
+    def encode_string_bytes(self, value: str) -> bytes:
+        return self.dumpb(value)
+
+    @staticmethod
+    def _is_compatible() -> bool:
+        # orjson always renders UUID and Enum itself, converters must agree with it
+        if any(
+            issubclass(type_, (uuid.UUID, enum.Enum)) and type_ not in (uuid.UUID, enum.Enum)
+            for type_ in UniversalJSONEncoder._encoders
+        ):
+            return False
+        probe_uuid = uuid.UUID(int=1)
+        return (
+            UniversalJSONEncoder.convert(probe_uuid) == str(probe_uuid)
+            and UniversalJSONEncoder.convert(_ProbeEnum.member) == _ProbeEnum.member.value
+        )
+
+
+SERIALIZERS = {
+    StdlibSerializer.name: StdlibSerializer,
+    OrjsonSerializer.name: OrjsonSerializer,
+}
+
+
+def get_serializer(name: str = 'auto') -> Serializer:
+    if name == 'auto':
+        try:
+            return OrjsonSerializer()
+        except ImportError:
+            return StdlibSerializer()
+    if name not in SERIALIZERS:
+        raise ValueError('Unknown serializer %r, expected auto or one of %s' % (name, ', '.join(SERIALIZERS)))
+    return SERIALIZERS[name]()
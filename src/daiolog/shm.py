@@ -0,0 +1,240 @@
+import multiprocessing
+import os
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from queue import Empty, Full
+from typing import Any, List, Optional
+
+from .aggregator import RecordTooLarge, pack, unpack
+
+__all__ = ['SharedMemoryRing', 'SharedMemoryQueue']
+
+DEFAULT_RING_SIZE = 4 << 20
+REAP_INTERVAL = 1.0
+_POSITION = struct.Struct('<Q')
+_POSITIONS = struct.Struct('<QQ')  # head, tail
+_HEADER = struct.Struct('<QQQ')  # head, tail, size
+_LENGTH = struct.Struct('<I')
+_DATA_OFFSET = 64
+
+
+def _track(shm: shared_memory.SharedMemory) -> None:
+    resource_tracker.register(shm._name, 'shared_memory')
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedMemoryRing:
+
+    def __init__(self, size: int = DEFAULT_RING_SIZE, name: Optional[str] = None):
+        if name is None:
+            self._shm = shared_memory.SharedMemory(create=True, size=_DATA_OFFSET + size)
+            _HEADER.pack_into(self._shm.buf, 0, 0, 0, size)
+            # the consumer unlinks the segment when it attaches, see SharedMemoryQueue, until then the
+            # resource tracker unlinks it if no consumer ever attaches
+        else:
+            self._shm = shared_memory.SharedMemory(name)
+        self.name = self._shm.name
+        self.size = _HEADER.unpack_from(self._shm.buf, 0)[2]
+        self.pid = None
+        self._buf = self._shm.buf
+
+    def write(self, payload: bytes) -> bool:
+        buf, size = self._buf, self.size
+        head, tail = _POSITIONS.unpack_from(buf, 0)
+        length = len(payload)
+        needed = _LENGTH.size + length
+        if needed > size - (head - tail):
+            return False
+        start = _DATA_OFFSET + head % size
+        if start + needed <= _DATA_OFFSET + size:
+            _LENGTH.pack_into(buf, start, length)
+            buf[start + _LENGTH.size:start + needed] = payload
+        else:
+            self._copy_in(head, _LENGTH.pack(length) + payload)
+        _POSITION.pack_into(buf, 0, head + needed)  # publish after the data is written
+        return True
+
+    def empty(self) -> bool:
+        head, tail = _POSITIONS.unpack_from(self._buf, 0)
+        return head == tail
+
+    def read(self) -> Optional[bytes]:
+        buf, size = self._buf, self.size
+        head, tail = _POSITIONS.unpack_from(buf, 0)
+        if head == tail:
+            return None
+        start = _DATA_OFFSET + tail % size
+        if start + _LENGTH.size <= _DATA_OFFSET + size:
+            length, = _LENGTH.unpack_from(buf, start)
+        else:
+            length, = _LENGTH.unpack(self._copy_out(tail, _LENGTH.size))
+        start += _LENGTH.size
+        if start + length <= _DATA_OFFSET + size:
+            payload = bytes(buf[start:start + length])
+        else:
+            payload = self._copy_out(tail + _LENGTH.size, length)
+        _POSITION.pack_into(buf, 8, tail + _LENGTH.size + length)
+        return payload
+
+    def close(self, unlink: bool = False) -> None:
+        self._buf = None
+        self._shm.close()
+        if unlink:
+            self.unlink()
+
+    def unlink(self) -> None:
+        _track(self._shm)
+        self._shm.unlink()
+
+    def _copy_in(self, position: int, data: bytes) -> None:
+        start = _DATA_OFFSET + position % self.size
+        first = min(len(data), _DATA_OFFSET + self.size - start)
+        self._buf[start:start + first] = data[:first]
+        if first < len(data):
+            self._buf[_DATA_OFFSET:_DATA_OFFSET + len(data) - first] = data[first:]
+
+    def _copy_out(self, position: int, length: int) -> bytes:
+        start = _DATA_OFFSET + position % self.size
+        first = min(length, _DATA_OFFSET + self.size - start)
+        data = bytes(self._buf[start:start + first])
+        if first < length:
+            data += bytes(self._buf[_DATA_OFFSET:_DATA_OFFSET + length - first])
+        return data
+
+
+class SharedMemoryQueue:
+
+    def __init__(self, maxsize: int = 0, address: Optional[str] = None, poll_interval: float = 0.01):
+        self.ring_size = maxsize or DEFAULT_RING_SIZE
+        # producers started later share the resource tracker of the consumer
+        resource_tracker.ensure_running()
+        self.poll_interval = poll_interval
+        self._announcements = multiprocessing.SimpleQueue()
+        self._wakeup = multiprocessing.Semaphore(0)
+        self._sleeping = multiprocessing.Value('b', 0, lock=False)
+        self._lock = threading.Lock()
+        self._producer: Optional[SharedMemoryRing] = None
+        self._producer_pid = None
+        self._rings: List[SharedMemoryRing] = []
+        self._next = 0
+        self._pending_sentinel = False
+        self._reap_at = 0.0
+        self.rejected = 0
+
+    def put_nowait(self, item: Any) -> None:
+        self.put(item, False)
+
+    def put(self, item: Any, block: bool = True, timeout: Optional[float] = None) -> None:
+        data = b'' if item is None else pack(item)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            ring = self._get_producer_ring()
+            if _LENGTH.size + len(data) > ring.size:
+                raise RecordTooLarge(len(data))
+            while not ring.write(data):
+                if not block:
+                    raise Full
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise Full
+                time.sleep(0.0005)
+        if self._sleeping.value:
+            self._sleeping.value = 0
+            self._wakeup.release()
+
+    def get_nowait(self) -> Any:
+        return self.get(False)
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Any:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                return self._read()
+            except Empty:
+                if not block:
+                    raise
+            wait = self.poll_interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    raise Empty
+            self._sleeping.value = 1
+            self._wakeup.acquire(True, wait)
+
+    def _read(self) -> Any:
+        while True:
+            count = len(self._rings)
+            index = self._next
+            checked = 0
+            while checked < count:
+                data = self._rings[index].read()
+                if not data:
+                    if data is not None:
+                        # QueueListener sentinel, return it after the other rings are drained
+                        self._pending_sentinel = True
+                    index = (index + 1) % count
+                    checked += 1
+                    continue
+                self._next = (index + 1) % count
+                try:
+                    return unpack(data)
+                except Exception:
+                    # the record is dropped, the listener keeps reading the ring
+                    self.rejected += 1
+            # polling the announcements is a syscall, new producers are attached when the rings are drained
+            if not self._attach():
+                break
+        if self._pending_sentinel:
+            self._pending_sentinel = False
+            return None
+        self._reap()
+        raise Empty
+
+    def _attach(self) -> bool:
+        attached = False
+        while not self._announcements.empty():
+            name, pid = self._announcements.get()
+            ring = SharedMemoryRing(name=name)
+            # the consumer owns the segment, the mapping stays valid after unlink
+            ring.unlink()
+            ring.pid = pid
+            self._rings.append(ring)
+            attached = True
+        return attached
+
+    def _reap(self) -> None:
+        # rings of exited producers are unmapped once they are drained, prefork servers recycle workers
+        now = time.monotonic()
+        if now < self._reap_at:
+            return
+        self._reap_at = now + REAP_INTERVAL
+        rings = []
+        for ring in self._rings:
+            # the producer is checked first, it can not write to the ring after it has exited
+            if ring.pid != os.getpid() and not _is_alive(ring.pid) and ring.empty():
+                ring.close()
+            else:
+                rings.append(ring)
+        if len(rings) != len(self._rings):
+            self._rings = rings
+            self._next = 0
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def _get_producer_ring(self) -> SharedMemoryRing:
+        if self._producer_pid != os.getpid():
+            self._producer = SharedMemoryRing(self.ring_size)
+            self._producer_pid = os.getpid()
+            self._announcements.put((self._producer.name, self._producer_pid))
+        return self._producer
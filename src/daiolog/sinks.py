@@ -0,0 +1,310 @@
+import abc
+import codecs
+import glob
+import gzip
+import logging
+import os
+import select
+import shutil
+import sys
+import threading
+import time
+import traceback
+from logging import Handler, LogRecord, StreamHandler
+from queue import SimpleQueue
+from typing import Callable, List, Optional, Sequence, Union
+
+__all__ = ['BatchStreamHandler', 'RotatingFileSink', 'write_fd']
+
+
+def _segment_key(name: str) -> str:
+    return name[:-3] if name.endswith('.gz') else name
+
+
+def _is_utf8(encoding: Optional[str]) -> bool:
+    try:
+        return encoding is not None and codecs.lookup(encoding).name == 'utf-8'
+    except LookupError:
+        return False
+
+
+def write_fd(fd: int, data: Union[bytes, bytearray, memoryview]) -> None:
+    # os.write may write a part of the data to pipes, sockets and terminals
+    with memoryview(data) as view:
+        total = view.nbytes
+        written = 0
+        while written < total:
+            try:
+                written += os.write(fd, view[written:])
+            except BlockingIOError:
+                select.select([], [fd], [])
+
+
+class BatchHandlerMixin(abc.ABC):
+    terminator = '\n'
+    metrics = None
+
+    @property
+    def accepts_envelopes(self) -> bool:
+        return not self.filters and getattr(self.formatter, 'accepts_envelopes', False)
+
+    def emit(self, record: LogRecord) -> None:
+        # a record of the listener without batching is written like a batch of one
+        try:
+            if self.output_fd() is not None and hasattr(self.formatter, 'format_bytes'):
+                self.write(self.formatter.format_bytes(record) + self.terminator.encode())
+            else:
+                self.write(self.format(record) + self.terminator)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def handle_batch(self, records: Sequence[LogRecord]) -> None:
+        metrics = self.metrics
+        if metrics is not None:
+            started = time.perf_counter()
+        if self.output_fd() is not None and hasattr(self.formatter, 'format_bytes'):
+            data = self.format_batch_bytes(records)
+        else:
+            data = self.format_batch(records)
+        if metrics is not None:
+            formatted = time.perf_counter()
+            metrics.format_seconds += formatted - started
+        if not data:
+            return
+        self.acquire()
+        try:
+            self.write(data)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(records[-1])
+        finally:
+            self.release()
+        if metrics is not None:
+            metrics.observe_write(time.perf_counter() - formatted, data, getattr(self, 'encoding', None) or 'utf-8')
+
+    def format_batch(self, records: Sequence[LogRecord]) -> str:
+        chunks = self._format_records(records, self.format)
+        if not chunks:
+            return ''
+        chunks.append('')
+        return self.terminator.join(chunks)
+
+    def format_batch_bytes(self, records: Sequence[LogRecord]) -> bytes:
+        # UTF-8 lines of the formatter, joined into one buffer for one write to the file descriptor
+        chunks = self._format_records(records, self.formatter.format_bytes)
+        if not chunks:
+            return b''
+        chunks.append(b'')
+        return self.terminator.encode().join(chunks)
+
+    def _format_records(self, records: Sequence[LogRecord], format: Callable) -> List:  # noqa
+        chunks = []
+        for record in records:
+            rv = self.filter(record)
+            if not rv:
+                continue
+            if isinstance(rv, LogRecord):
+                record = rv
+            try:
+                chunks.append(format(record))
+            except RecursionError:
+                raise
+            except Exception:
+                self.handleError(record)
+        return chunks
+
+    def output_fd(self) -> Optional[int]:
+        """File descriptor for UTF-8 bytes of the batch, None to write str."""
+        return None
+
+    @abc.abstractmethod
+    def write(self, data: Union[str, bytes]) -> None:
+        """Write formatted records, bytes when output_fd() is not None."""
+
+
+class BatchStreamHandler(BatchHandlerMixin, StreamHandler):
+    _fd_stream = None
+    _fd = None
+
+    def output_fd(self) -> Optional[int]:
+        stream = self.stream
+        if stream is not self._fd_stream:
+            self._fd_stream, self._fd = stream, None
+            if _is_utf8(getattr(stream, 'encoding', None)):
+                try:
+                    self._fd = stream.fileno()
+                except (AttributeError, OSError, ValueError):
+                    pass
+        return self._fd
+
+    def write(self, data: Union[str, bytes]) -> None:
+        if isinstance(data, str):
+            self.stream.write(data)
+            self.flush()
+            return
+        fd = self.output_fd()
+        if fd is None:  # the stream was replaced after formatting
+            self.stream.write(data.decode())
+            self.flush()
+            return
+        self.flush()  # text written to the stream before goes first
+        write_fd(fd, data)
+
+
+class RotatingFileSink(BatchHandlerMixin, Handler):
+
+    def __init__(self, filename: str, max_bytes: int = 0, interval: float = 0, backup_count: int = 0,
+                 compress: bool = True, buffer_size: int = 1 << 20, encoding: str = 'utf-8'):
+        super().__init__()
+        self.filename = os.path.abspath(os.fspath(filename))
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backup_count = backup_count
+        self.compress = compress
+        self.buffer_size = buffer_size
+        self.encoding = encoding
+        self.stream = None
+        self._buffer = bytearray()
+        self._header_pending = False
+        self._size = 0
+        self._rollover_at = None
+        self._compressor = None
+        self._compress_queue = SimpleQueue()
+        self._open()
+
+    def output_fd(self) -> Optional[int]:
+        if self.stream is None or not _is_utf8(self.encoding):
+            return None
+        return self.stream.fileno()
+
+    def write(self, data: Union[str, bytes]) -> None:
+        payload = data.encode(self.encoding) if isinstance(data, str) else data
+        if self.should_rollover(len(payload)):
+            self.do_rollover()
+        if self.stream is None:
+            self._open()
+        if self._header_pending:
+            self._header_pending = False
+            header = self.file_header()
+            self._buffer += header
+            self._size += len(header)
+        if not self._buffer and len(payload) >= self.buffer_size:
+            write_fd(self.stream.fileno(), payload)
+        else:
+            # batches are collected up to buffer_size, QueueListener flushes the sink when its queue is empty
+            self._buffer += payload
+            if len(self._buffer) >= self.buffer_size:
+                self._write_buffer()
+        self._size += len(payload)
+
+    def file_header(self) -> bytes:
+        """Bytes written at the start of every opened file."""
+        return b''
+
+    def flush(self) -> None:
+        self.acquire()
+        try:
+            if self.stream is not None:
+                self._write_buffer()
+        except Exception:
+            # called by the listener when its queue is empty, a failed write must not stop it
+            if logging.raiseExceptions:
+                traceback.print_exc(file=sys.stderr)
+        finally:
+            self.release()
+
+    def close(self) -> None:
+        self.acquire()
+        try:
+            if self.stream is not None:
+                self._write_buffer()
+                self.stream.close()
+                self.stream = None
+            if self._compressor is not None:
+                self._compress_queue.put(None)
+                self._compressor.join()
+                self._compressor = None
+        finally:
+            self.release()
+            super().close()
+
+    def should_rollover(self, size: int) -> bool:
+        if self.max_bytes and self._size and self._size + size > self.max_bytes:
+            return True
+        return self._rollover_at is not None and time.time() >= self._rollover_at
+
+    def do_rollover(self) -> None:
+        if self.stream is not None:
+            self._write_buffer()
+            self.stream.close()
+            self.stream = None
+        segment = self._get_segment_name()
+        if os.path.exists(self.filename):
+            os.rename(self.filename, segment)
+            if self.compress:
+                self._start_compressor()
+                self._compress_queue.put(segment)
+            else:
+                self._remove_old_segments()
+        self._open()
+
+    def _open(self) -> None:
+        # data is buffered by the sink, it is written to the file with one os.write
+        self.stream = open(self.filename, 'ab', buffering=0)
+        self._size = self.stream.tell()
+        self._header_pending = True
+        if self.interval:
+            self._rollover_at = time.time() + self.interval
+
+    def _after_fork_in_child(self) -> None:
+        # the parent writes the data it has buffered
+        self._buffer.clear()
+
+    def _write_buffer(self) -> None:
+        if self._buffer:
+            try:
+                write_fd(self.stream.fileno(), self._buffer)
+            finally:
+                self._buffer.clear()
+
+    def _get_segment_name(self) -> str:
+        base = '%s.%s' % (self.filename, time.strftime('%Y%m%d-%H%M%S'))
+        segment, index = base, 0
+        while os.path.exists(segment) or os.path.exists(segment + '.gz'):
+            index += 1
+            segment = '%s.%03d' % (base, index)
+        return segment
+
+    def _start_compressor(self) -> None:
+        if self._compressor is None:
+            self._compressor = threading.Thread(target=self._compress_segments, daemon=True)
+            self._compressor.start()
+
+    def _compress_segments(self) -> None:
+        while True:
+            segment = self._compress_queue.get()
+            if segment is None:
+                break
+            if not os.path.exists(segment):  # already removed as an old segment
+                continue
+            try:
+                with open(segment, 'rb') as source, gzip.open(segment + '.gz', 'wb') as target:
+                    shutil.copyfileobj(source, target, self.buffer_size)
+                os.remove(segment)
+                self._remove_old_segments()
+            except Exception:
+                if logging.raiseExceptions:
+                    traceback.print_exc(file=sys.stderr)
+
+    def _remove_old_segments(self) -> None:
+        if self.backup_count <= 0:
+            return
+        segments = sorted(glob.glob(glob.escape(self.filename) + '.*'), key=_segment_key)
+        for segment in segments[:-self.backup_count]:
+            os.remove(segment)
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self.filename)
@@ -0,0 +1,103 @@
+import functools
+import linecache
+import sys
+import traceback
+from traceback import FrameSummary, StackSummary
+from types import CodeType
+from typing import Optional
+
+__all__ = ['capture_traceback', 'primitive_traceback', 'TracebackRenderer']
+
+_exception_groups = (BaseExceptionGroup,) if sys.version_info >= (3, 11) else ()  # noqa: F821
+
+
+def _get_position(code: CodeType, lasti: int, lineno: int) -> tuple:
+    if sys.version_info < (3, 11):
+        return lineno, None, None, None
+    positions = traceback._get_code_position(code, lasti)
+    if positions[0] is None:
+        return (lineno,) + positions[1:]
+    return positions
+
+
+def capture_traceback(exc_info) -> Optional[tuple]:
+    """
+    Capture the exception chain as segments (chain message, frames, exception lines) without source lines,
+    frames are (code, lasti, lineno). Returns None when the traceback has to be formatted eagerly.
+    """
+    if getattr(sys, 'tracebacklimit', None) is not None or exc_info[1] is None:
+        # logger.exception() outside of an except block is formatted eagerly as 'NoneType: None'
+        return None
+    segments = []
+    seen = set()
+    exc, tb = exc_info[1], exc_info[2]
+    while exc is not None:
+        if isinstance(exc, _exception_groups):
+            return None
+        seen.add(id(exc))
+        frames = []
+        while tb is not None:
+            frame = tb.tb_frame
+            linecache.lazycache(frame.f_code.co_filename, frame.f_globals)
+            frames.append((frame.f_code, tb.tb_lasti, tb.tb_lineno))
+            tb = tb.tb_next
+        cause, context = exc.__cause__, exc.__context__
+        if cause is not None and id(cause) not in seen:
+            message, chained = traceback._cause_message, cause
+        elif context is not None and not exc.__suppress_context__ and id(context) not in seen:
+            message, chained = traceback._context_message, context
+        else:
+            message, chained = None, None
+        segments.append((message, tuple(frames), tuple(traceback.format_exception_only(type(exc), exc))))
+        exc = chained
+        tb = exc.__traceback__ if exc is not None else None
+    segments.reverse()
+    return tuple(segments)
+
+
+def _primitive_frame(frame: tuple) -> tuple:
+    if not isinstance(frame[0], CodeType):
+        return frame
+    code, lasti, lineno = frame
+    return (code.co_filename, code.co_name) + _get_position(code, lasti, lineno)
+
+
+def primitive_traceback(segments: tuple) -> tuple:
+    return tuple(
+        (message, tuple(_primitive_frame(frame) for frame in frames), exception)
+        for message, frames, exception in segments
+    )
+
+
+def _frame_summary(frame: tuple) -> FrameSummary:
+    filename, name, lineno, end_lineno, colno, end_colno = _primitive_frame(frame)
+    if sys.version_info < (3, 11):
+        return FrameSummary(filename, lineno, name, lookup_line=False)
+    return FrameSummary(filename, lineno, name, lookup_line=False,
+                        end_lineno=end_lineno, colno=colno, end_colno=end_colno)
+
+
+class TracebackRenderer:
+
+    def __init__(self, maxsize: int = 256):
+        self._format_stack = functools.lru_cache(maxsize)(self._format_stack)
+
+    def render(self, segments: tuple) -> str:
+        chunks = []
+        for message, frames, exception in segments:
+            if message is not None:
+                chunks.append(message)
+            if frames:
+                chunks.append('Traceback (most recent call last):\n')
+                chunks.append(self._format_stack(frames))
+            chunks.extend(exception)
+        text = ''.join(chunks)
+        return text[:-1] if text.endswith('\n') else text
+
+    def cache_info(self) -> dict:
+        info = self._format_stack.cache_info()
+        return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'maxsize': info.maxsize}
+
+    @staticmethod
+    def _format_stack(frames: tuple) -> str:
+        return ''.join(StackSummary.from_list([_frame_summary(frame) for frame in frames]).format())
@@ -1,9 +1,26 @@
 import logging
 import typing as t
 
-
 import pytest
 
+from daiolog import QueueHandler
+from daiolog.records import LogEnvelope
+
+
+def make_record(msg: str = 'Test message', level: int = logging.INFO, *, args: t.Optional[tuple] = None,
+                lineno: int = 1, created: t.Optional[float] = None, **extra: t.Any) -> logging.LogRecord:
+    """Record of a logging call in tests, extra fields are set as its attributes."""
+    record = logging.LogRecord('tests', level, __file__, lineno, msg, args, None, func='test')
+    if created is not None:
+        record.created = created
+    record.__dict__.update(extra)
+    return record
+
+
+def make_envelope(msg: str = 'Test message', level: int = logging.INFO, **kwargs: t.Any) -> LogEnvelope:
+    return QueueHandler().prepare(make_record(msg, level, **kwargs))
+
+
 @pytest.fixture
 def list_handler():
     class ListHandler(logging.StreamHandler):
@@ -47,4 +64,4 @@ def list_logger_handler(list_handler) -> t.Callable[[t.Union[str, logging.Logger
         if handler in log.handlers:
             log.handlers.remove(handler)
         log.setLevel(level)
-        log.propagate = propagate
\ No newline at end of file
+        log.propagate = propagate
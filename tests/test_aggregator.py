@@ -0,0 +1,180 @@
+import json
+import logging
+import os
+import pickle
+import signal
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import dataclass
+from enum import Enum, IntEnum
+from decimal import Decimal
+from queue import Full, SimpleQueue
+
+import pytest
+
+from daiolog import QueueHandler, QueueListener, set_transport
+from daiolog.aggregator import LogCollector, RecordTooLarge, SocketQueue, pack, unpack
+from daiolog.records import LogEnvelope
+from tests.conftest import make_envelope
+
+
+@dataclass
+class Point:
+    x: int
+    y: int
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    yield str(tmp_path / 'collector.sock')
+    set_transport('thread', 0)
+
+
+def test_pack_unpack_envelope():
+    envelope = make_envelope('test %s', args=('arg',), lineno=10, uuid=uuid.UUID(int=1), amount=Decimal('1.50'), point=Point(1, 2), items=(1, {2}))
+
+    result = unpack(pack(envelope))
+
+    assert isinstance(result, LogEnvelope)
+    assert result.msg == 'test arg'
+    assert result.lineno == 10
+    assert result.extra == {
+        'uuid': '00000000-0000-0000-0000-000000000001',
+        'amount': '1.50',
+        'point': {'x': 1, 'y': 2},
+        'items': [1, [2]],
+    }
+
+
+class Level(IntEnum):
+    HIGH = 2
+
+
+class Color(str, Enum):
+    RED = 'red'
+
+
+class Ratio(float):
+    pass
+
+
+def test_pack_coerces_subclasses_of_primitives():
+    envelope = make_envelope(priority=Level.HIGH, color=Color.RED, ratio=Ratio(0.5), keys={Level.HIGH: 1, Color.RED: 2})
+
+    result = unpack(pack(envelope))
+
+    assert result.extra == {'priority': 2, 'color': 'red', 'ratio': 0.5, 'keys': {2: 1, 'red': 2}}
+    assert [type(value) for value in result.extra.values()] == [int, str, float, dict]
+
+
+def test_unpack_rejects_globals():
+    with pytest.raises(pickle.UnpicklingError):
+        unpack(pickle.dumps(Point(1, 2)))
+    with pytest.raises(ValueError):
+        unpack(pickle.dumps(('short', 'tuple')))
+
+
+def test_socket_queue_requires_address():
+    with pytest.raises(ValueError):
+        SocketQueue()
+
+
+def test_socket_queue_without_collector_is_full(socket_path):
+    queue = SocketQueue(address=socket_path)
+    with pytest.raises(Full):
+        queue.put_nowait(make_envelope())
+
+
+def test_collector_receives_records_from_handler(socket_path):
+    received = SimpleQueue()
+    collector = LogCollector(socket_path, received)
+    collector.start()
+    try:
+        handler = QueueHandler(address=socket_path)
+        assert isinstance(handler.queue, SocketQueue)
+        logger = logging.getLogger('test_collector_receives_records_from_handler')
+        logger.propagate = False
+        logger.handlers.append(handler)
+        logger.warning('Test warning', extra={'key': uuid.UUID(int=1)})
+        record = received.get(timeout=5)
+    finally:
+        collector.stop()
+
+    assert not os.path.exists(socket_path)
+    assert collector.received == 1
+    assert record.name == 'test_collector_receives_records_from_handler'
+    assert record.msg == 'Test warning'
+    assert record.extra == {'key': '00000000-0000-0000-0000-000000000001'}
+
+
+def test_collector_rejects_malformed_datagrams(socket_path):
+    import socket
+
+    received = SimpleQueue()
+    collector = LogCollector(socket_path, received)
+    collector.start()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(b'garbage', socket_path)
+            sock.sendto(b'', socket_path)
+            sock.sendto(pack(make_envelope()), socket_path)
+        record = received.get(timeout=5)
+    finally:
+        collector.stop()
+
+    assert record.msg == 'Test message'
+    assert collector.rejected == 1
+
+
+def test_socket_queue_reports_too_large_records(socket_path):
+    received = SimpleQueue()
+    collector = LogCollector(socket_path, received)
+    collector.start()
+    try:
+        handler = QueueHandler(address=socket_path)
+        handler.emit(logging.LogRecord('test_aggregator', logging.INFO, __file__, 1, 'x' * (300 << 10), None, None))
+        with pytest.raises(RecordTooLarge):
+            SocketQueue(address=socket_path).put(make_envelope(payload='x' * (2 << 20)))
+        handler.emit(logging.LogRecord('test_aggregator', logging.INFO, __file__, 1, 'small', None, None))
+        record = received.get(timeout=5)
+    finally:
+        collector.stop()
+
+    assert record.msg == 'small'
+    assert handler.dropped == {'too_large': 1}
+
+
+def test_listener_is_not_started_for_socket_transport(socket_path):
+    set_transport('socket', path=socket_path)
+    listener = QueueListener()
+    listener.start()
+    assert listener._thread is None
+    listener.stop()
+
+
+def test_collector_cli(tmp_path, socket_path):
+    output = str(tmp_path / 'app.log')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'daiolog', 'collect', '--socket', socket_path, '--output', output],
+        env=env,
+    )
+    try:
+        for _ in range(100):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.05)
+        queue = SocketQueue(address=socket_path)
+        for i in range(3):
+            queue.put(make_envelope(index=i))
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(10)
+
+    assert process.returncode == 0
+    with open(output) as file:
+        lines = [json.loads(line) for line in file]
+    assert [line['message'] for line in lines] == ['Test message'] * 3
+    assert [line['extra']['index'] for line in lines] == [0, 1, 2]
@@ -0,0 +1,130 @@
+import datetime as dt
+import enum
+import glob
+import io
+import json
+import pathlib
+from dataclasses import dataclass
+from decimal import Decimal
+from uuid import UUID
+
+import pytest
+
+from daiolog import BinaryFormatter, BinaryFileSink, JsonFormatter
+from daiolog.binary import Packer
+from daiolog.context import bound_context
+from daiolog.handler import QueueHandler
+from daiolog.reader import BinaryReader, open_binary_log, unpackb
+from tests.conftest import make_record
+
+
+def decode(formatter, *frames):
+    return list(BinaryReader(io.BytesIO(formatter.header() + b''.join(frames))))
+
+
+@dataclass
+class Point:
+    x: int
+    y: Decimal
+
+
+class Color(enum.Enum):
+    RED = 'red'
+
+
+class Priority(enum.IntEnum):
+    HIGH = 2
+
+
+@pytest.mark.parametrize('value', [
+    None, True, False, 0, 127, 128, -32, -33, 255, 256, 65536, 2 ** 32, 2 ** 63, -129, -2 ** 15 - 1, -2 ** 63,
+    1.5, -0.25, '', 'x' * 31, 'x' * 32, 'x' * 256, 'x' * 65536, 'привет', [], list(range(16)), list(range(65536)),
+    {}, {'key': 'value'}, {str(i): i for i in range(16)}, {'nested': [{'a': [1, {'b': None}]}]},
+])
+def test_packer_round_trip(value):
+    assert unpackb(Packer().pack(value)) == value
+
+
+def test_packer_key_dictionary():
+    packer = Packer(['message', 'extra'])
+    data = packer.pack({'message': 'text', 'extra': {'message': 1, 'other': 2}})
+
+    assert len(data) < len(Packer().pack({'message': 'text', 'extra': {'message': 1, 'other': 2}}))
+    assert unpackb(data, packer.keys) == {'message': 'text', 'extra': {'message': 1, 'other': 2}}
+
+
+def test_packer_converts_keys_like_json():
+    value = {1: 'int', 1.5: 'float', True: 'bool', None: 'none'}
+
+    assert unpackb(Packer(['1']).pack(value), ['1']) == json.loads(json.dumps(value))
+    with pytest.raises(TypeError):
+        Packer().pack({(1, 2): 'tuple'})
+
+
+def test_formatter_round_trips_with_converters():
+    record = make_record(
+        amount=Decimal('10.25'),
+        request_id=UUID(int=1),
+        at=dt.datetime(2024, 1, 1, tzinfo=dt.timezone.utc),
+        day=dt.date(2024, 1, 1),
+        tags={'a'},
+        color=Color.RED,
+        priority=Priority.HIGH,
+        path=pathlib.PurePosixPath('/tmp/app.log'),
+        raw=b'\xff',
+        point=Point(1, Decimal('2.5')),
+        pair=('a', 1),
+        codes={1: 'one'},
+        text='surrogate \ud800',
+    )
+    fields = ['logger_name', 'level', 'timestamp', 'message', 'line', 'traceback']
+    formatter = BinaryFormatter(fields=fields)
+
+    assert decode(formatter, formatter.format_bytes(record)) == [
+        json.loads(JsonFormatter(fields=fields, serializer='json').format(record)),
+    ]
+
+
+def test_formatter_schema_and_context():
+    formatter = BinaryFormatter(fields=['message', 'line', 'logger_name'], rename={'message': 'msg'})
+    handler = QueueHandler()
+    with bound_context(request_id='abc', user_id=1):
+        envelope = handler.prepare(make_record(user_id=2))
+
+    assert decode(formatter, formatter.format_bytes(envelope)) == [{
+        'msg': 'Test message', 'line': 1, 'logger_name': 'tests',
+        'extra': {'request_id': 'abc', 'user_id': 2},
+    }]
+    assert json.loads(formatter.format(envelope))['extra'] == {'request_id': 'abc', 'user_id': 2}
+
+
+def test_formatter_is_smaller_than_json():
+    record = make_record(request_id=UUID(int=1), user_id=42)
+
+    assert len(BinaryFormatter().format_bytes(record)) < len(JsonFormatter().format_bytes(record)) * 0.7
+
+
+def test_formatter_caches_callsite():
+    formatter = BinaryFormatter()
+    frames = [formatter.format_bytes(make_record()) for _ in range(3)]
+
+    assert formatter.cache_info()['hits'] == 2
+    assert len(decode(formatter, *frames)) == 3
+
+
+def test_binary_file_sink(tmp_path):
+    filename = str(tmp_path / 'app.log')
+    sink = BinaryFileSink(filename, max_bytes=200)
+
+    sink.handle(make_record('Test message %s', args=('first',)))
+    sink.handle_batch([make_record('Test message %s', args=('second',)), make_record('Test message %s', args=('third',))])
+    sink.close()
+    sink = BinaryFileSink(filename)
+    sink.handle(make_record('Test message %s', args=('fourth',)))
+    sink.close()
+
+    messages = []
+    for name in sorted(glob.glob(filename + '.*')) + [filename]:
+        with open_binary_log(name) as stream:
+            messages.append([record['message'] for record in BinaryReader(stream)])
+    assert messages == [['Test message first'], ['Test message second', 'Test message third', 'Test message fourth']]
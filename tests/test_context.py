@@ -0,0 +1,154 @@
+import asyncio
+import itertools
+import json
+import pickle
+import uuid
+
+import pytest
+
+import daiolog
+from daiolog import JsonFormatter, bind_context, bound_context, clear_context
+from daiolog.aggregator import pack, unpack
+from daiolog.context import get_context, reset_context
+from tests.conftest import make_envelope
+
+
+@pytest.fixture(params=['json', 'orjson'])
+def formatter(request):
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    return JsonFormatter(fields=['message'], serializer=request.param)
+
+
+def test_bind_context():
+    assert get_context() is None
+    token = bind_context(service='api', request_id=1)
+    try:
+        inner = bind_context(request_id=2)
+        assert get_context().fields == {'service': 'api', 'request_id': 2}
+        reset_context(inner)
+        assert get_context().fields == {'service': 'api', 'request_id': 1}
+    finally:
+        reset_context(token)
+    assert get_context() is None
+
+
+def test_bind_context_rejects_record_attributes():
+    for name in ('name', 'process', 'msg', 'message', 'extra'):
+        with pytest.raises(KeyError):
+            bind_context(**{name: 'api'})
+    with pytest.raises(KeyError):
+        with bound_context(service='api', levelname='x'):
+            pass
+    assert get_context() is None
+
+
+def test_clear_context():
+    with bound_context(service='api'):
+        clear_context()
+        assert get_context() is None
+
+
+def test_context_follows_asyncio_tasks():
+    async def handle(request_id):
+        with bound_context(request_id=request_id):
+            await asyncio.sleep(0)
+            return make_envelope().context.fields
+
+    async def main():
+        with bound_context(service='api'):
+            return await asyncio.gather(*(handle(i) for i in range(3)))
+
+    assert asyncio.run(main()) == [{'service': 'api', 'request_id': i} for i in range(3)]
+
+
+def test_envelope_shares_context():
+    with bound_context(service='api') as context:
+        first, second = make_envelope(), make_envelope()
+    assert first.context is context
+    assert second.context is context
+    assert make_envelope().context is None
+
+
+def test_formatter_splices_context(formatter):
+    with bound_context(service='api', request_id=uuid.UUID(int=1)):
+        envelope = make_envelope(user_id=42)
+    expected = envelope.to_record()
+
+    text = formatter.format(envelope)
+
+    assert json.loads(text) == {
+        'message': 'Test message',
+        'extra': {'service': 'api', 'request_id': str(uuid.UUID(int=1)), 'user_id': 42},
+    }
+    assert text == formatter.format(expected)
+    assert list(envelope.context.fragments) == [formatter]
+
+
+def test_formatter_context_without_extra(formatter):
+    with bound_context(service='api'):
+        envelope = make_envelope()
+
+    assert json.loads(formatter.format(envelope)) == {'message': 'Test message', 'extra': {'service': 'api'}}
+
+
+def test_formatter_record_extra_overrides_context(formatter):
+    with bound_context(service='api', user_id=1):
+        envelope = make_envelope(user_id=42)
+
+    assert json.loads(formatter.format(envelope))['extra'] == {'service': 'api', 'user_id': 42}
+
+
+def test_formatter_context_respects_schema():
+    formatter = JsonFormatter(fields=[], rename={'extra': 'ctx'}, exclude=['secret'], serializer='json')
+    with bound_context(service='api', secret='x'):
+        envelope = make_envelope()
+
+    assert formatter.format(envelope) == '{"ctx": {"service": "api"}}'
+    with bound_context(secret='x'):
+        assert formatter.format(make_envelope()) == '{}'
+
+
+def test_context_fragment_follows_converters(formatter):
+    class Tenant:
+        pass
+
+    with bound_context(tenant=Tenant()):
+        envelope = make_envelope()
+    formatter.format(envelope)
+    daiolog.UniversalJSONEncoder.register_converter(Tenant, lambda value: 'tenant')
+    try:
+        assert json.loads(formatter.format(envelope))['extra'] == {'tenant': 'tenant'}
+    finally:
+        del daiolog.UniversalJSONEncoder._encoders[Tenant]
+        daiolog.UniversalJSONEncoder._cache.clear()
+
+
+def test_context_survives_process_transports():
+    with bound_context(service='api', request_id=uuid.UUID(int=1)):
+        first, second = make_envelope(), make_envelope()
+
+    pickled = pickle.loads(pickle.dumps(first)), pickle.loads(pickle.dumps(second))
+    assert pickled[0].context is pickled[1].context
+    assert pickled[0].context.fields == first.context.fields
+
+    with bound_context(service='api', request_id=uuid.UUID(int=1)):
+        first, second = make_envelope(), make_envelope()
+    packed = unpack(pack(first)), unpack(pack(second))
+    assert packed[0].context is packed[1].context
+    assert packed[0].context.fields == {'service': 'api', 'request_id': str(uuid.UUID(int=1))}
+
+
+def test_context_of_reused_pid_is_not_restored_from_cache(mocker):
+    with bound_context(service='api'):
+        first = make_envelope()
+    # a later process with the same pid counts its contexts from zero again
+    mocker.patch('daiolog.context._keys', itertools.count(first.context.key[-1]))
+    daiolog.context._after_fork_in_child()
+    with bound_context(service='billing'):
+        second = make_envelope()
+
+    assert second.context.key[0] == first.context.key[0]
+    assert second.context.key != first.context.key
+    assert unpack(pack(first)).context.fields == {'service': 'api'}
+    assert unpack(pack(second)).context.fields == {'service': 'billing'}
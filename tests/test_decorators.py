@@ -1,10 +1,13 @@
+import asyncio
 import logging
 import pathlib
+import time
 
 import pytest
 
 import daiolog
 from daiolog import QueueListener
+from daiolog.records import LogEnvelope
 from os import path
 
 
@@ -57,7 +60,7 @@ class TestEntryPoint:
         assert listener._thread is None
         assert len(records) == 1
         log_rec = records[0]
-        assert isinstance(log_rec, logging.LogRecord)
+        assert isinstance(log_rec, LogEnvelope)
         assert log_rec.msg == 'Test info'
         assert log_rec.levelname == 'INFO'
         assert log_rec.name == 'test_dict_config'
@@ -84,7 +87,7 @@ class TestEntryPoint:
         assert listener._thread is None
         assert len(records) == 1
         log_rec = records[0]
-        assert isinstance(log_rec, logging.LogRecord)
+        assert isinstance(log_rec, LogEnvelope)
         assert log_rec.msg == 'Test info'
         assert log_rec.levelname == 'INFO'
         assert log_rec.name == 'test_file_config'
@@ -133,7 +136,7 @@ class TestEntryPoint:
         assert listener._thread is None
         assert len(records) == 1
         log_rec = records[0]
-        assert isinstance(log_rec, logging.LogRecord)
+        assert isinstance(log_rec, LogEnvelope)
         assert log_rec.msg == 'Test info'
         assert log_rec.levelname == 'INFO'
         assert log_rec.name == 'test_function_config'
@@ -185,7 +188,173 @@ class TestEntryPoint:
         assert listener._thread is None
         assert len(records) == 1
         log_rec = records[0]
-        assert isinstance(log_rec, logging.LogRecord)
+        assert isinstance(log_rec, LogEnvelope)
         assert log_rec.msg == 'Test info value1'
         assert log_rec.levelname == 'INFO'
         assert log_rec.name == 'test_method_decorate'
+
+    def test_coroutine_function(self, mocker):
+        records = []
+
+        def mock_emit(rec):
+            records.append(rec)
+
+        listener = QueueListener()
+        mocker.patch.object(listener.handlers[0], 'emit', mock_emit)
+
+        LOG_CONFIG = {
+            'version': 1,
+            'disable_existing_loggers': True,
+            'handlers': {
+                'default': {
+                    'level': 'INFO',
+                    'class': 'daiolog.QueueHandler',
+                },
+            },
+            'loggers': {
+                'test_coroutine_function': {
+                    'handlers': ['default'],
+                    'level': 'INFO',
+                    'propagate': False
+                },
+            }
+        }
+
+        @daiolog.entrypoint(LOG_CONFIG)
+        async def main(value):
+            logger = logging.getLogger('test_coroutine_function')
+            assert listener._thread is not None
+            await asyncio.sleep(0)
+            logger.info('Test info %s', value)
+            logger.debug('Test debug %s', value)
+            return value
+
+        assert asyncio.iscoroutinefunction(main)
+        assert asyncio.run(main('value1')) == 'value1'
+        assert listener._thread is None
+        assert len(records) == 1
+        log_rec = records[0]
+        assert log_rec.msg == 'Test info value1'
+        assert log_rec.name == 'test_coroutine_function'
+
+    def test_loop_lag_probe(self, mocker):
+        records = []
+
+        def mock_emit(rec):
+            records.append(rec)
+
+        listener = QueueListener()
+        mocker.patch.object(listener.handlers[0], 'emit', mock_emit)
+
+        LOG_CONFIG = {
+            'version': 1,
+            'disable_existing_loggers': True,
+            'handlers': {
+                'default': {
+                    'level': 'INFO',
+                    'class': 'daiolog.QueueHandler',
+                },
+            },
+            'loggers': {
+                'daiolog': {
+                    'handlers': ['default'],
+                    'level': 'INFO',
+                    'propagate': False
+                },
+            }
+        }
+
+        @daiolog.entrypoint(LOG_CONFIG, loop_lag_interval=0.01, loop_lag_report_interval=10)
+        async def main():
+            await asyncio.sleep(0.05)
+            time.sleep(0.1)
+            await asyncio.sleep(0.05)
+
+        asyncio.run(main())
+
+        assert len(records) == 1
+        log_rec = records[0]
+        assert log_rec.name == 'daiolog.loop_lag'
+        assert log_rec.msg == 'Event loop lag'
+        assert log_rec.extra['loop_lag']['samples'] > 1
+        assert log_rec.extra['loop_lag']['max_ms'] >= 50
+
+    def test_listener_process(self, tmp_path):
+        import json
+
+        filename = str(tmp_path / 'app.log')
+        LOG_CONFIG = {
+            'version': 1,
+            'disable_existing_loggers': False,
+            'handlers': {
+                'default': {
+                    '()': 'daiolog.QueueHandler',
+                    'sinks': [{'()': 'daiolog.RotatingFileSink', 'filename': filename}],
+                },
+            },
+            'loggers': {
+                'test_listener_process': {
+                    'handlers': ['default'],
+                    'level': 'INFO',
+                    'propagate': False
+                },
+            }
+        }
+
+        @daiolog.entrypoint(LOG_CONFIG, listener_process=True)
+        def main():
+            assert QueueListener().process.is_alive()
+            logging.getLogger('test_listener_process').info('Test info')
+
+        try:
+            main()
+        finally:
+            daiolog.set_sinks(None)
+            daiolog.set_transport('thread')
+
+        assert QueueListener().process is None
+        with open(filename) as file:
+            assert json.loads(file.read())['message'] == 'Test info'
+
+    def test_channels(self, tmp_path):
+        import json
+
+        filename = str(tmp_path / 'audit.log')
+        LOG_CONFIG = {
+            'version': 1,
+            'disable_existing_loggers': False,
+            'handlers': {
+                'audit': {
+                    '()': 'daiolog.QueueHandler',
+                    'channel': 'audit',
+                    'sinks': [{'()': 'daiolog.RotatingFileSink', 'filename': filename}],
+                    'listener': {'batch_size': 64, 'linger': 0.01, 'traceback_cache_size': 8},
+                },
+            },
+            'loggers': {
+                'test_channels': {
+                    'handlers': ['audit'],
+                    'level': 'INFO',
+                    'propagate': False
+                },
+            }
+        }
+
+        @daiolog.entrypoint(LOG_CONFIG)
+        def main():
+            listener = QueueListener(channel='audit')
+            assert listener._thread is not None
+            assert (listener.batch_size, listener.linger) == (64, 0.01)
+            assert listener.tracebacks.cache_info()['maxsize'] == 8
+            assert QueueListener().batch_size == 1
+            logging.getLogger('test_channels').info('Test audit')
+
+        try:
+            main()
+            assert QueueListener(channel='audit')._thread is None
+        finally:
+            QueueListener._instances.pop((QueueListener, 'audit'))
+            daiolog.handler.channels.pop('audit')
+
+        with open(filename) as file:
+            assert json.loads(file.read())['message'] == 'Test audit'
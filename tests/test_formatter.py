@@ -1,5 +1,9 @@
 import sys
+import enum
 import json
+import time
+import pathlib
+import typing as t
 import logging
 import datetime as dt
 from dataclasses import dataclass
@@ -9,6 +13,7 @@ from uuid import UUID
 import pytest
 
 from daiolog import JsonFormatter
+from daiolog.formatters import TimestampRenderer
 
 
 def test_formatter_return_json_serialize_string(list_logger_handler):
@@ -42,6 +47,19 @@ class TestValueObject:
     attr: int
 
 
+class Color(enum.Enum):
+    RED = 'red'
+
+
+class Priority(enum.IntEnum):
+    HIGH = 2
+
+
+class ValueTuple(t.NamedTuple):
+    a: int
+    b: str
+
+
 @pytest.mark.parametrize('value, result', (
         (123, 123),
         (123.456, 123.456),
@@ -56,10 +74,17 @@ class TestValueObject:
         (dt.datetime(2023, 1, 1, 1, 2, 3), '2023-01-01T01:02:03'),
         (dt.datetime(2023, 1, 1, 1, 2, 3, tzinfo=dt.timezone.utc), '2023-01-01T01:02:03+00:00'),
         ({1: '1', 2: '2'}, {'1': '1', '2': '2'}),
-        (Decimal(123).quantize(Decimal('0.00')), "Decimal('123.00')"),
-        (UUID(int=1), "UUID('00000000-0000-0000-0000-000000000001')"),
-        (TestValueObject(1), 'TestValueObject(attr=1)'),
-        (b'abc', "b'abc'"),
+        (Decimal(123).quantize(Decimal('0.00')), '123.00'),
+        (UUID(int=1), '00000000-0000-0000-0000-000000000001'),
+        (TestValueObject(1), {'attr': 1}),
+        (b'abc', 'abc'),
+        (b'\xff', '\\xff'),
+        (Color.RED, 'red'),
+        (Priority.HIGH, 2),
+        (pathlib.PurePosixPath('/tmp/file.log'), '/tmp/file.log'),
+        (ValueTuple(1, 'b'), [1, 'b']),
+        (frozenset([1]), [1]),
+        (dt.time(1, 2, 3), '01:02:03'),
 ))
 def test_extra_arguments_serialize(value, result, list_logger_handler):
 
@@ -160,3 +185,178 @@ def test_exc_info_priority_stack_info_serialize(list_logger_handler):
     assert record.stack_info is not None
     assert record.exc_text != record.stack_info
     assert result['traceback'] == record.exc_text
+
+
+def test_formatter_field_schema(list_logger_handler):
+    logger = logging.getLogger('test_formatter_field_schema')
+    log_records = list_logger_handler(logger)
+    formatter = JsonFormatter(
+        fields=['level', 'logger_name', 'message', 'pathname', 'module', 'line'],
+        rename={'logger_name': 'logger', 'extra': 'context'},
+        omit=['pathname', 'module'],
+        exclude=['secret'],
+    )
+
+    logger.info('test message %s', 'test-arg', extra={'key': 'value', 'secret': 'password'})
+    record = log_records.pop()
+    result = formatter.format(record)
+
+    assert list(json.loads(result)) == ['level', 'logger', 'message', 'line', 'context']
+    assert json.loads(result) == {
+        'level': 'INFO',
+        'logger': 'test_formatter_field_schema',
+        'message': 'test message test-arg',
+        'line': record.lineno,
+        'context': {'key': 'value'},
+    }
+
+
+@pytest.mark.parametrize('serializer', ['json', 'orjson'])
+def test_formatter_matches_serializer_output(serializer):
+    if serializer == 'orjson':
+        pytest.importorskip('orjson')
+    formatter = JsonFormatter(serializer=serializer)
+    record = logging.LogRecord('test_callsite', logging.INFO, '/srv/app/ä.py', 7, 'ünïcode "%s"\n\x00', ('☃',), None,
+                               func='fünc')
+    record.key = UUID(int=1)
+
+    expected = {
+        'logger_name': 'test_callsite',
+        'level': 'INFO',
+        'timestamp': formatter.formatTime(record),
+        'message': record.getMessage(),
+        'pathname': '/srv/app/ä.py',
+        'module': 'ä',
+        'function': 'fünc',
+        'line': 7,
+        'traceback': None,
+        'extra': {'key': UUID(int=1)},
+    }
+    assert formatter.format(record) == formatter.serializer.dumps(expected)
+
+
+def test_formatter_callsite_cache(list_logger_handler):
+    logger = logging.getLogger('test_formatter_callsite_cache')
+    log_records = list_logger_handler(logger)
+    formatter = JsonFormatter(fields=['line', 'message', 'logger_name', 'function', 'level'], callsite_cache_size=2)
+
+    for i in range(3):
+        logger.info('test message %s', i)
+    logger.info('other callsite')
+    results = [json.loads(formatter.format(record)) for record in log_records]
+
+    assert [result['message'] for result in results] == ['test message 0', 'test message 1', 'test message 2',
+                                                         'other callsite']
+    assert results[0]['line'] != results[3]['line']
+    assert list(results[0]) == ['line', 'message', 'logger_name', 'function', 'level']
+    assert formatter.cache_info() == {'hits': 2, 'misses': 2, 'size': 2, 'maxsize': 2, 'hit_rate': 0.5}
+
+
+def test_formatter_callsite_cache_disabled(list_logger_handler):
+    logger = logging.getLogger('test_formatter_callsite_cache_disabled')
+    log_records = list_logger_handler(logger)
+    formatter = JsonFormatter(callsite_cache_size=0)
+
+    logger.info('test message')
+    logger.info('test message')
+
+    assert json.loads(formatter.format(log_records[1]))['line'] == log_records[1].lineno
+    assert formatter.cache_info()['size'] == 0
+
+
+def test_formatter_unknown_field():
+    with pytest.raises(ValueError):
+        JsonFormatter(fields=['logger_name', 'unknown'])
+
+
+def test_formatter_dict_config():
+    import io
+    import logging.config
+
+    stream = io.StringIO()
+    logging.config.dictConfig({
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': {
+            'json': {
+                '()': 'daiolog.JsonFormatter',
+                'omit': ['pathname', 'module'],
+                'rename': {'logger_name': 'logger'},
+            },
+        },
+        'handlers': {
+            'stream': {
+                'class': 'logging.StreamHandler',
+                'formatter': 'json',
+                'stream': stream,
+            },
+        },
+        'loggers': {
+            'test_formatter_dict_config': {
+                'handlers': ['stream'],
+                'level': 'INFO',
+                'propagate': False,
+            },
+        },
+    })
+
+    logging.getLogger('test_formatter_dict_config').info('test message')
+
+    result = json.loads(stream.getvalue())
+    assert result['logger'] == 'test_formatter_dict_config'
+    assert result['message'] == 'test message'
+    assert 'pathname' not in result
+    assert 'module' not in result
+
+
+def test_timestamp_renderer_matches_format_time():
+    renderer = TimestampRenderer()
+    formatter = logging.Formatter()
+    formatter.converter = time.gmtime
+    formatter.default_time_format = JsonFormatter.default_time_format
+    formatter.default_msec_format = JsonFormatter.default_msec_format
+
+    record = logging.makeLogRecord({})
+    for created in (record.created, 0.0, 0.999, 1.0, 1673860903.511, 1673860903.9999, 1673860904.0005, 1.0):
+        record.created = created
+        record.msecs = int((created - int(created)) * 1000) + 0.0
+        assert renderer(record) == formatter.formatTime(record)
+
+
+def test_timestamp_renderer_reuses_second_prefix(mocker):
+    renderer = TimestampRenderer()
+    strftime = mocker.spy(time, 'strftime')
+    record = logging.makeLogRecord({})
+    for msecs in range(0, 1000, 100):
+        record.created = 1673860903 + msecs / 1000
+        record.msecs = msecs
+        renderer(record)
+
+    assert strftime.call_count == 1
+    assert renderer(record) == '2023-01-16T09:21:43.900+00:00'
+
+
+def test_timestamp_renderer_microseconds():
+    renderer = TimestampRenderer('us')
+    record = logging.makeLogRecord({'created': 1673860903.511234})
+    assert renderer(record) == '2023-01-16T09:21:43.511234+00:00'
+
+
+def test_formatter_timestamp_ns_field():
+    formatter = JsonFormatter(fields=['timestamp', 'timestamp_ns'], timestamp_precision='us')
+    record = logging.makeLogRecord({'created': 1673860903.5})
+
+    assert json.loads(formatter.format(record)) == {
+        'timestamp': '2023-01-16T09:21:43.500000+00:00',
+        'timestamp_ns': 1673860903500000000,
+    }
+
+
+def test_formatter_custom_time_format():
+    class LocalTimeFormatter(JsonFormatter):
+        default_msec_format = '%s.%03d'
+
+    formatter = LocalTimeFormatter(fields=['timestamp'])
+    record = logging.makeLogRecord({'created': 1673860903.5, 'msecs': 500.0})
+
+    assert json.loads(formatter.format(record)) == {'timestamp': '2023-01-16T09:21:43.500'}
@@ -1,9 +1,15 @@
 import sys
 import logging
-import os
-import threading
+import pickle
+from queue import SimpleQueue
 
-from daiolog import QueueHandler
+import pytest
+
+import daiolog
+from daiolog import QueueHandler, set_transport
+from daiolog.records import LogEnvelope
+from daiolog.tracebacks import TracebackRenderer
+from tests.conftest import make_record
 
 
 def test_handlers_use_one_instance_of_queue():
@@ -24,7 +30,7 @@ def test_handled_log_record_attributes():
 
     rec = handler.queue.get()
 
-    assert isinstance(rec, logging.LogRecord)
+    assert isinstance(rec, LogEnvelope)
     assert rec.name == 'test_handled_log_record_attributes'
     assert rec.msg == 'test ZeroDivision test-arg1 test-arg2'
     assert rec.args is None
@@ -32,27 +38,28 @@ def test_handled_log_record_attributes():
     assert rec.levelname == 'ERROR'
     assert rec.levelno == 40
     assert rec.pathname == __file__
-    assert rec.filename == 'test_handler.py'
     assert rec.module == 'test_handler'
     assert rec.exc_info is None
+    assert rec.exc_text is None
+    exc_text = TracebackRenderer().render(rec.exc_frames)
     if sys.version_info > (3, 11):
-        assert rec.lineno == 22
-        assert rec.exc_text == (
+        assert rec.lineno == 28
+        assert exc_text == (
             'Traceback (most recent call last):\n'
             '  File '
             f'"{__file__}", '
-            'line 20, in test_handled_log_record_attributes\n'
+            'line 26, in test_handled_log_record_attributes\n'
             '    1 / 0\n'
             '    ~~^~~\n'
             'ZeroDivisionError: division by zero'
         )
     else:
-        assert rec.lineno == 22
-        assert rec.exc_text == (
+        assert rec.lineno == 28
+        assert exc_text == (
             'Traceback (most recent call last):\n'
             '  File '
             f'"{__file__}", '
-            'line 20, in test_handled_log_record_attributes\n'
+            'line 26, in test_handled_log_record_attributes\n'
             '    1 / 0\n'
             'ZeroDivisionError: division by zero'
         )
@@ -60,9 +67,309 @@ def test_handled_log_record_attributes():
     assert rec.funcName == 'test_handled_log_record_attributes'
     assert isinstance(rec.created, float)
     assert isinstance(rec.msecs, float)
-    assert rec.thread == threading.get_ident()
-    assert rec.threadName == threading.current_thread().name
-    assert rec.processName == 'MainProcess'
-    assert rec.process == os.getpid()
-    assert getattr(rec, 'extra1') == 123
-    assert getattr(rec, 'extra2') is True
+    assert rec.extra == {'extra1': 123, 'extra2': True}
+
+
+def test_default_transport_is_in_process():
+    handler = QueueHandler()
+    assert isinstance(handler.queue, SimpleQueue)
+    while not handler.queue.empty():
+        handler.queue.get_nowait()
+
+    record = logging.LogRecord('test_default_transport_is_in_process', logging.INFO, __file__, 1, 'msg', None, None)
+    handler.emit(record)
+    rec = handler.queue.get_nowait()
+
+    assert rec.msg == 'msg'
+    assert rec is not record
+
+
+def test_set_transport_replaces_queue_of_existing_handlers():
+    handler = QueueHandler()
+    try:
+        queue = set_transport('process')
+        assert handler.queue is queue
+        assert QueueHandler().queue is queue
+        assert not isinstance(queue, SimpleQueue)
+    finally:
+        set_transport('thread')
+    assert isinstance(handler.queue, SimpleQueue)
+
+
+def test_handler_transport_argument():
+    try:
+        handler = QueueHandler(transport='process')
+        assert handler.queue is daiolog.handler.queue
+        assert daiolog.handler.transport == 'process'
+    finally:
+        set_transport('thread')
+
+
+def test_channels_have_own_queues():
+    try:
+        audit = QueueHandler(channel='audit', capacity=10)
+        assert audit.queue is daiolog.handler.get_channel('audit').queue
+        assert audit.queue is not QueueHandler().queue
+        assert daiolog.handler.capacity == 0
+
+        queue = set_transport('process', channel='audit')
+        assert audit.queue is queue
+        assert isinstance(QueueHandler().queue, SimpleQueue)
+    finally:
+        daiolog.handler.channels.pop('audit')
+
+
+def test_unknown_transport():
+    with pytest.raises(ValueError):
+        set_transport('unknown')
+
+
+@pytest.fixture
+def bounded_queue():
+    yield set_transport('thread', 2)
+    set_transport('thread', 0)
+
+
+def drain(queue):
+    result = []
+    while not queue.empty():
+        result.append(queue.get_nowait().msg)
+    return result
+
+
+def test_overflow_drop_newest(bounded_queue):
+    handler = QueueHandler(overflow='drop_newest')
+    for msg in ('one', 'two', 'three'):
+        handler.emit(make_record(msg))
+
+    assert drain(bounded_queue) == ['one', 'two']
+    assert handler.dropped == {'drop_newest': 1}
+
+
+def test_overflow_does_not_block_by_default(bounded_queue, mocker):
+    put = mocker.spy(bounded_queue, 'put')
+    handler = QueueHandler()
+    for msg in ('one', 'two', 'three'):
+        handler.emit(make_record(msg))
+
+    assert all(call.kwargs == {'block': False} for call in put.call_args_list)
+    assert handler.dropped == {'drop_newest': 1}
+
+
+def test_overflow_drop_oldest(bounded_queue):
+    handler = QueueHandler(overflow='drop_oldest')
+    for msg in ('one', 'two', 'three', 'four'):
+        handler.emit(make_record(msg))
+
+    assert drain(bounded_queue) == ['three', 'four']
+    assert handler.dropped == {'drop_oldest': 2}
+
+
+def test_overflow_keep_warning(bounded_queue):
+    handler = QueueHandler(overflow='keep_warning', timeout=0.01)
+    handler.emit(make_record('one'))
+    handler.emit(make_record('two'))
+    handler.emit(make_record('three'))
+    handler.emit(make_record('warning', logging.WARNING))
+
+    assert drain(bounded_queue) == ['one', 'two']
+    assert handler.dropped == {'keep_warning': 2}
+
+
+def test_overflow_block_with_timeout(bounded_queue, mocker):
+    handler = QueueHandler(overflow='block', timeout=0.01)
+    put = mocker.spy(bounded_queue, 'put')
+    for msg in ('one', 'two', 'three'):
+        handler.emit(make_record(msg))
+
+    assert put.call_args.args[1:] == (True, 0.01)
+    assert drain(bounded_queue) == ['one', 'two']
+    assert handler.dropped == {'block': 1}
+
+
+def test_overflow_reports_dropped_records(bounded_queue):
+    handler = QueueHandler(overflow='drop_newest')
+    for msg in ('one', 'two', 'three', 'four'):
+        handler.emit(make_record(msg))
+    assert drain(bounded_queue) == ['one', 'two']
+
+    handler.emit(make_record('five'))
+    report = [bounded_queue.get_nowait(), bounded_queue.get_nowait()][1]
+
+    assert report.name == 'daiolog'
+    assert report.levelno == logging.WARNING
+    assert report.msg == "2 records dropped by queue overflow policy 'drop_newest'"
+    assert report.extra == {'dropped': 2}
+    assert handler.dropped == {'drop_newest': 2}
+
+    handler.emit(make_record('six'))
+    assert drain(bounded_queue) == ['six']
+
+
+def test_handler_capacity_argument():
+    try:
+        handler = QueueHandler(capacity=10)
+        assert handler.queue.maxsize == 10
+        assert daiolog.handler.capacity == 10
+    finally:
+        set_transport('thread', 0)
+
+
+def test_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        QueueHandler(overflow='unknown')
+
+
+def test_envelope_to_record():
+    logger = logging.getLogger('test_envelope_to_record')
+    handler = QueueHandler()
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 10, 'test %s', ('arg',), None,
+                               func='test_envelope_to_record', extra={'extra1': 123})
+
+    rec = handler.prepare(record).to_record()
+
+    assert isinstance(rec, logging.LogRecord)
+    assert rec.getMessage() == 'test arg'
+    assert rec.args is None
+    assert rec.filename == 'test_handler.py'
+    assert rec.created == record.created
+    assert rec.extra1 == 123
+    assert logging.Formatter('%(name)s %(levelname)s %(filename)s:%(lineno)d %(message)s').format(rec) == (
+        'test_envelope_to_record INFO test_handler.py:10 test arg'
+    )
+    assert (rec.process, rec.processName, rec.thread, rec.threadName) == (
+        record.process, record.processName, record.thread, record.threadName,
+    )
+    assert logging.Formatter('%(process)d %(thread)d').format(rec) == '%d %d' % (record.process, record.thread)
+
+
+def test_envelope_to_record_keeps_task_name():
+    logger = logging.getLogger('test_envelope_to_record_keeps_task_name')
+    handler = QueueHandler()
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 10, 'test', None, None)
+    record.taskName = 'Task-1'
+
+    rec = pickle.loads(pickle.dumps(handler.prepare(record))).to_record()
+
+    assert rec.taskName == 'Task-1'
+    if sys.version_info < (3, 12):
+        record = logger.makeRecord(logger.name, logging.INFO, __file__, 10, 'test', None, None)
+        assert not hasattr(handler.prepare(record).to_record(), 'taskName')
+
+
+def test_envelope_pickle_is_smaller_than_record():
+    logger = logging.getLogger('test_envelope_pickle_is_smaller_than_record')
+    handler = QueueHandler()
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 10, 'test', None, None, extra={'extra1': 123})
+
+    envelope = handler.prepare(record)
+    restored = pickle.loads(pickle.dumps(envelope))
+
+    assert len(pickle.dumps(envelope)) < len(pickle.dumps(record))
+    assert [getattr(restored, name) for name in LogEnvelope.__slots__] == [
+        getattr(envelope, name) for name in LogEnvelope.__slots__
+    ]
+
+
+def test_deferred_interpolation_of_immutable_args():
+    logger = logging.getLogger('test_deferred_interpolation_of_immutable_args')
+    handler = QueueHandler(defer_interpolation=True)
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 10, 'test %s %d %.1f %s %s',
+                               ('arg', 1, 2.5, None, ('a', 1)), None)
+
+    envelope = handler.prepare(record)
+    restored = pickle.loads(pickle.dumps(envelope))
+
+    assert envelope.msg == 'test %s %d %.1f %s %s'
+    assert envelope.getMessage() == record.getMessage()
+    assert restored.getMessage() == record.getMessage()
+    assert envelope.to_record().getMessage() == record.getMessage()
+
+
+def test_deferred_interpolation_formats_mutable_args_eagerly():
+    logger = logging.getLogger('test_deferred_interpolation_formats_mutable_args_eagerly')
+    handler = QueueHandler(defer_interpolation=True)
+    items = ['a']
+    records = [
+        logger.makeRecord(logger.name, logging.INFO, __file__, 10, 'test %s', (items,), None),
+        logger.makeRecord(logger.name, logging.INFO, __file__, 10, 'test %(a)s', ({'a': 1},), None),
+        logger.makeRecord(logger.name, logging.INFO, __file__, 10, 'test %s', (('a', ['b']),), None),
+    ]
+
+    envelopes = [handler.prepare(record) for record in records]
+    items.append('b')
+
+    assert [(envelope.msg, envelope.args) for envelope in envelopes] == [
+        ("test ['a']", None), ('test 1', None), ("test ('a', ['b'])", None),
+    ]
+
+
+def test_interpolation_is_eager_by_default():
+    logger = logging.getLogger('test_interpolation_is_eager_by_default')
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 10, 'test %s', ('arg',), None)
+
+    envelope = QueueHandler().prepare(record)
+
+    assert (envelope.msg, envelope.args) == ('test arg', None)
+
+
+def test_unknown_fork_policy():
+    with pytest.raises(ValueError):
+        daiolog.set_fork_policy('unknown')
+
+
+def test_unknown_listener_option():
+    with pytest.raises(ValueError):
+        QueueHandler(listener={'batch_size': 64, 'size': 1})
+    assert daiolog.handler.get_channel().listener_options is None
+
+
+def test_priority_lane():
+    try:
+        handler = QueueHandler(channel='audit', priority_level='ERROR')
+        channel = daiolog.handler.get_channel('audit')
+        assert channel.priority_level == logging.ERROR
+        for level in (logging.INFO, logging.ERROR, logging.CRITICAL):
+            handler.emit(make_record(logging.getLevelName(level), level))
+
+        assert drain(channel.priority_queue) == ['ERROR', 'CRITICAL']
+        assert handler.queue.get_nowait().msg == 'INFO'
+        wakeup = daiolog.handler.WAKEUP
+        assert [handler.queue.get_nowait(), handler.queue.get_nowait()] == [wakeup, wakeup]
+
+        daiolog.set_priority(None, channel='audit')
+        assert handler.priority_queue is None
+        handler.emit(make_record('ERROR', logging.ERROR))
+        assert drain(handler.queue) == ['ERROR']
+    finally:
+        daiolog.handler.channels.pop('audit')
+
+
+def test_priority_lane_follows_transport():
+    try:
+        handler = QueueHandler(channel='audit', priority_level=logging.WARNING)
+        set_transport('process', channel='audit')
+        assert handler.priority_queue is daiolog.handler.get_channel('audit').priority_queue
+        assert not isinstance(handler.priority_queue, SimpleQueue)
+        with pytest.raises(ValueError):
+            set_transport('shm', channel='audit')
+    finally:
+        daiolog.handler.channels.pop('audit')
+
+
+def test_sequence_stamp():
+    try:
+        handler = QueueHandler(channel='audit', priority_level=logging.ERROR, sequence=True)
+        for level in (logging.INFO, logging.ERROR, logging.INFO):
+            handler.emit(make_record('msg', level))
+
+        channel = daiolog.handler.get_channel('audit')
+        assert channel.priority_queue.get_nowait().extra['sequence'] == 1
+        records = [handler.queue.get_nowait() for _ in range(3)]
+        assert [record.extra['sequence'] for record in records if record is not daiolog.handler.WAKEUP] == [0, 2]
+    finally:
+        daiolog.handler.channels.pop('audit')
+
+
+def test_wakeup_survives_pickle():
+    assert pickle.loads(pickle.dumps(daiolog.handler.WAKEUP)) is daiolog.handler.WAKEUP
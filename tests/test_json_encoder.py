@@ -1,11 +1,66 @@
+import datetime as dt
 import json
 from uuid import UUID
 
+import pytest
+
 from daiolog import UniversalJSONEncoder
 
 
-def test_register_converter():
+@pytest.fixture
+def encoders(mocker):
+    mocker.patch.dict(UniversalJSONEncoder._encoders)
+    mocker.patch.dict(UniversalJSONEncoder._cache)
+
+
+def test_register_converter(encoders):
     data = {'uuid': UUID(int=1)}
-    assert json.dumps(data, cls=UniversalJSONEncoder) == '{"uuid": "UUID(\'00000000-0000-0000-0000-000000000001\')"}'
-    UniversalJSONEncoder.register_converter(UUID, str)
     assert json.dumps(data, cls=UniversalJSONEncoder) == '{"uuid": "00000000-0000-0000-0000-000000000001"}'
+    UniversalJSONEncoder.register_converter(UUID, lambda x: x.int)
+    assert json.dumps(data, cls=UniversalJSONEncoder) == '{"uuid": 1}'
+
+
+def test_converter_applies_to_subclasses(encoders):
+    class Base:
+        pass
+
+    class Child(Base):
+        pass
+
+    UniversalJSONEncoder.register_converter(Base, lambda x: type(x).__name__)
+    assert json.dumps([Base(), Child()], cls=UniversalJSONEncoder) == '["Base", "Child"]'
+
+    UniversalJSONEncoder.register_converter(Child, lambda x: 'child')
+    assert json.dumps([Base(), Child()], cls=UniversalJSONEncoder) == '["Base", "child"]'
+
+
+def test_datetime_subclass_converter():
+    class DateTime(dt.datetime):
+        pass
+
+    value = DateTime(2023, 1, 1, 1, 2, 3)
+    assert json.dumps(value, cls=UniversalJSONEncoder) == '"2023-01-01T01:02:03"'
+
+
+def test_converter_lookup_is_cached(encoders, mocker):
+    class Value:
+        pass
+
+    UniversalJSONEncoder.register_converter(Value, lambda x: 'value')
+    resolve = mocker.spy(UniversalJSONEncoder, '_resolve')
+    json.dumps([Value(), Value(), Value()], cls=UniversalJSONEncoder)
+
+    assert resolve.call_count == 1
+
+
+def test_failed_converter_falls_back_to_repr(encoders):
+    class Value:
+        def __repr__(self):
+            return 'Value()'
+
+    def converter(_):
+        raise ValueError
+
+    UniversalJSONEncoder.register_converter(Value, converter)
+    with pytest.warns(UserWarning):
+        assert json.dumps(Value(), cls=UniversalJSONEncoder) == '"Value()"'
@@ -1,9 +1,18 @@
+import io
+import json
 import logging
 import logging.config
+import os
 import sys
+from collections import Counter
 from threading import Thread
 
-from daiolog import QueueListener, QueueHandler, JsonFormatter
+import pytest
+
+import daiolog
+from daiolog import QueueListener, QueueHandler, JsonFormatter, set_transport, set_sinks
+from daiolog import BatchStreamHandler, RotatingFileSink
+from daiolog.records import LogEnvelope
 from multiprocessing import Process
 
 
@@ -29,7 +38,7 @@ def test_success_publish_log_to_queue_listener(mocker):
 
     log_record = records.pop()
 
-    assert isinstance(log_record, logging.LogRecord)
+    assert isinstance(log_record, LogEnvelope)
     assert log_record.msg == 'Test info log'
     assert log_record.levelname == 'INFO'
     assert log_record.name == 'test_success_publish_log_to_queue_listener'
@@ -45,6 +54,25 @@ def test_default_listener_handler():
     assert handler.stream is sys.stderr
 
 
+def test_default_listener_writes_bytes_to_fd(mocker, tmp_path):
+    import daiolog.sinks
+
+    write = mocker.spy(daiolog.sinks, 'write_fd')
+    listener = QueueListener()
+    with open(tmp_path / 'app.log', 'w', encoding='utf-8') as stream:
+        mocker.patch.object(listener.handlers[0], 'stream', stream)
+        logger = logging.getLogger('test_default_listener_writes_bytes_to_fd')
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        logger.handlers = [QueueHandler()]
+        listener.start()
+        logger.info('Test fd')
+        listener.stop()
+
+    assert write.call_count == 1
+    assert json.loads((tmp_path / 'app.log').read_text())['message'] == 'Test fd'
+
+
 def test_custom_stream():
     QueueListener._instances.clear()
     listener = QueueListener(stream=sys.stdout)
@@ -56,6 +84,17 @@ def test_singleton_listener():
     assert QueueListener() is QueueListener()
 
 
+def test_listener_per_channel():
+    try:
+        listener = QueueListener(channel='audit')
+        assert listener is QueueListener(channel='audit')
+        assert listener is not QueueListener()
+        assert listener.queue is QueueHandler(channel='audit').queue
+    finally:
+        QueueListener._instances.pop((QueueListener, 'audit'))
+        daiolog.handler.channels.pop('audit')
+
+
 def test_idempotence_start_listener():
     listener = QueueListener()
     listener.start()
@@ -135,3 +174,621 @@ def test_load_dict_logging_config(mocker):
     assert records[1].msg == 'Finish main'
 
 
+def test_batch_listener_drains_queue(mocker):
+    batches = []
+    listener = QueueListener()
+    mocker.patch.object(listener, 'batch_size', 64)
+    mocker.patch.object(listener, 'linger', 0.1)
+    mocker.patch.object(listener, 'batch_sizes', Counter())
+    mocker.patch.object(listener.handlers[0], 'handle_batch', lambda records: batches.append(list(records)))
+
+    logger = logging.getLogger('test_batch_listener_drains_queue')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers.append(QueueHandler())
+
+    for i in range(10):
+        logger.info('Test batch %s', i)
+    listener.start()
+    listener.stop()
+
+    messages = [record.msg for batch in batches for record in batch]
+    assert messages == [f'Test batch {i}' for i in range(10)]
+    stats = listener.batch_stats()
+    assert stats['records'] == 10
+    assert stats['batches'] == len(batches)
+    assert stats['max'] == max(len(batch) for batch in batches)
+
+
+def test_batch_listener_respects_batch_size(mocker):
+    listener = QueueListener()
+    mocker.patch.object(listener, 'batch_size', 3)
+    mocker.patch.object(listener, 'linger', 0.1)
+    mocker.patch.object(listener, 'batch_sizes', Counter())
+    mocker.patch.object(listener.handlers[0], 'handle_batch')
+
+    logger = logging.getLogger('test_batch_listener_respects_batch_size')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers.append(QueueHandler())
+
+    for i in range(7):
+        logger.info('Test batch %s', i)
+    listener.start()
+    listener.stop()
+
+    assert listener.batch_stats()['records'] == 7
+    assert listener.batch_stats()['max'] <= 3
+
+
+def test_priority_lane_bypasses_backlog(mocker):
+    batches = []
+    listener = QueueListener(channel='audit', batch_size=64)
+    mocker.patch.object(listener.handlers[0], 'handle_batch', lambda records: batches.append(list(records)))
+
+    logger = logging.getLogger('test_priority_lane_bypasses_backlog')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers = [QueueHandler(channel='audit', priority_level=logging.ERROR, sequence=True)]
+    try:
+        for i in range(200):
+            logger.info('Test backlog %s', i)
+        logger.error('Test error')
+        listener.start()
+        listener.stop()
+    finally:
+        QueueListener._instances.pop((QueueListener, 'audit'))
+        daiolog.handler.channels.pop('audit')
+
+    assert [record.msg for record in batches[0]] == ['Test error']
+    assert batches[0][0].extra['sequence'] == 200
+    assert [record.msg for batch in batches[1:] for record in batch] == ['Test backlog %s' % i for i in range(200)]
+    assert listener.stats()['priority_records'] == 1
+
+
+def test_priority_lane_is_written_before_backlog(mocker, tmp_path):
+    filename = str(tmp_path / 'audit.log')
+    written = []
+    listener = QueueListener(channel='audit', batch_size=64)
+    handle_batch = listener.handle_batch
+
+    def check_file(records):
+        if records[0].levelno < logging.ERROR and not written:
+            written.extend(line['message'] for line in _read_json_lines(filename))
+        handle_batch(records)
+
+    mocker.patch.object(listener, 'handle_batch', check_file)
+    logger = logging.getLogger('test_priority_lane_is_written_before_backlog')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers = [QueueHandler(channel='audit', priority_level=logging.ERROR,
+                                    sinks=[{'()': 'daiolog.RotatingFileSink', 'filename': filename}])]
+    try:
+        for i in range(200):
+            logger.info('Test backlog %s', i)
+        logger.error('Test error')
+        listener.start()
+        listener.stop()
+    finally:
+        QueueListener._instances.pop((QueueListener, 'audit'))
+        daiolog.handler.channels.pop('audit')
+
+    assert written == ['Test error']
+    assert len(_read_json_lines(filename)) == 201
+
+
+def test_priority_lane_can_not_change_while_listener_runs():
+    listener = QueueListener(channel='audit')
+    try:
+        listener.start()
+        with pytest.raises(RuntimeError):
+            daiolog.set_priority(logging.ERROR, channel='audit')
+        listener.stop()
+        daiolog.set_priority(logging.ERROR, channel='audit')
+    finally:
+        listener.stop()
+        QueueListener._instances.pop((QueueListener, 'audit'))
+        daiolog.handler.channels.pop('audit')
+
+
+def _log_from_child_process():
+    logger = logging.getLogger('test_process_transport')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers.append(QueueHandler())
+    logger.info('Test child log')
+
+
+def test_process_transport(mocker):
+    records = []
+
+    def mock_emit(rec):
+        records.append(rec)
+
+    listener = QueueListener()
+    mocker.patch.object(listener.handlers[0], 'emit', mock_emit)
+
+    set_transport('process')
+    try:
+        listener.start()
+        process = Process(target=_log_from_child_process)
+        process.start()
+        process.join()
+        listener.stop()
+    finally:
+        set_transport('thread')
+
+    assert [rec.msg for rec in records] == ['Test child log']
+
+
+def test_stop_listener_with_full_queue(mocker):
+    listener = QueueListener()
+    mocker.patch.object(listener.handlers[0], 'emit')
+    queue = set_transport('thread', 1)
+    try:
+        handler = QueueHandler(overflow='drop_newest')
+        handler.emit(logging.LogRecord('test_stop_listener_with_full_queue', logging.INFO, __file__, 1, 'msg', None, None))
+        assert queue.full()
+        listener.start()
+        listener.stop()
+    finally:
+        set_transport('thread', 0)
+
+    assert listener._thread is None
+    assert listener.handlers[0].emit.call_count == 1
+
+
+def test_listener_rebuilds_log_records_for_plain_handlers(mocker, list_handler):
+    import io
+
+    plain_handler = list_handler(stream=io.StringIO())
+    listener = QueueListener()
+    mocker.patch.object(listener, 'handlers', (listener.handlers[0], plain_handler))
+    mocker.patch.object(listener.handlers[0], 'emit')
+
+    logger = logging.getLogger('test_listener_rebuilds_log_records_for_plain_handlers')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers.append(QueueHandler())
+
+    listener.start()
+    logger.info('Test info log', extra={'extra1': 1})
+    listener.stop()
+
+    log_record = plain_handler.record_history.pop()
+    assert isinstance(log_record, logging.LogRecord)
+    assert log_record.getMessage() == 'Test info log'
+    assert log_record.extra1 == 1
+    assert plain_handler.stream.getvalue() == 'Test info log\n'
+
+
+def test_listener_sinks_from_dict_config(tmp_path):
+    import json
+
+    filename = str(tmp_path / 'app.log')
+    logging.config.dictConfig({
+        'version': 1,
+        'disable_existing_loggers': False,
+        'handlers': {
+            'default': {
+                '()': 'daiolog.QueueHandler',
+                'sinks': [
+                    {
+                        'class': 'daiolog.RotatingFileSink',
+                        'filename': filename,
+                        'max_bytes': 1 << 20,
+                        'formatter': {'()': 'daiolog.JsonFormatter', 'fields': ['logger_name', 'message']},
+                    },
+                ],
+            },
+        },
+        'loggers': {
+            'test_listener_sinks_from_dict_config': {
+                'handlers': ['default'],
+                'level': 'INFO',
+                'propagate': False,
+            },
+        },
+    })
+    listener = QueueListener()
+    try:
+        listener.start()
+        assert isinstance(listener.handlers[0], RotatingFileSink)
+        logging.getLogger('test_listener_sinks_from_dict_config').info('Test info log')
+        listener.stop()
+    finally:
+        set_sinks(None)
+
+    assert isinstance(listener.handlers[0], BatchStreamHandler)
+    with open(filename) as file:
+        assert json.loads(file.read()) == {
+            'logger_name': 'test_listener_sinks_from_dict_config',
+            'message': 'Test info log',
+        }
+
+
+def _read_json_lines(filename):
+    import json
+
+    with open(filename) as file:
+        return [json.loads(line) for line in file]
+
+
+def test_listener_process(tmp_path):
+    filename = str(tmp_path / 'app.log')
+    set_sinks([{'()': 'daiolog.RotatingFileSink', 'filename': filename}])
+    logger = logging.getLogger('test_listener_process')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers = [QueueHandler()]
+    listener = QueueListener()
+    try:
+        listener.start(process=True)
+        assert listener.process.is_alive()
+        assert daiolog.handler.transport == 'process'
+        for i in range(100):
+            logger.info('Test process %s', i)
+        listener.stop()
+    finally:
+        set_sinks(None)
+        set_transport('thread')
+
+    assert listener._thread is None
+    assert listener.process is None
+    assert [line['message'] for line in _read_json_lines(filename)] == ['Test process %s' % i for i in range(100)]
+
+
+def test_listener_process_restarts(tmp_path, mocker):
+    import time
+
+    filename = str(tmp_path / 'app.log')
+    set_sinks([{'()': 'daiolog.RotatingFileSink', 'filename': filename}])
+    mocker.patch.object(QueueListener, 'restart_delay', 0.01)
+    logger = logging.getLogger('test_listener_process_restarts')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers = [QueueHandler()]
+    listener = QueueListener()
+    mocker.patch.object(listener, 'restarts', 0)
+    try:
+        listener.start(process=True)
+        logger.info('Test before kill')
+        time.sleep(0.5)
+        child = listener.process
+        child.kill()
+        child.join()
+        while listener.process is child or not listener.process.is_alive():
+            time.sleep(0.01)
+        logger.info('Test after restart')
+        listener.stop()
+    finally:
+        set_sinks(None)
+        set_transport('thread')
+
+    assert listener.restarts == 1
+    assert [line['message'] for line in _read_json_lines(filename)] == ['Test before kill', 'Test after restart']
+
+
+def test_listener_process_replaces_reader_lock(tmp_path, mocker):
+    filename = str(tmp_path / 'app.log')
+    set_sinks([{'()': 'daiolog.RotatingFileSink', 'filename': filename}])
+    mocker.patch.object(QueueListener, 'stop_timeout', 5.0)
+    logger = logging.getLogger('test_listener_process_replaces_reader_lock')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers = [QueueHandler(transport='process')]
+    listener = QueueListener()
+    # held like by a listener process killed in get()
+    lock = logger.handlers[0].queue._rlock
+    lock.acquire()
+    try:
+        listener.start(process=True)
+        logger.info('Test process')
+        listener.stop()
+    finally:
+        lock.release()
+        set_sinks(None)
+        set_transport('thread')
+
+    assert [line['message'] for line in _read_json_lines(filename)] == ['Test process']
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_forked_listener_process_does_not_restart_listeners():
+    listener = QueueListener(channel='audit')
+
+    def child():
+        return listener._thread is None
+
+    try:
+        listener.start()
+        daiolog.listener._spawning.listener = True
+        try:
+            assert _fork(child) == 0
+        finally:
+            daiolog.listener._spawning.listener = False
+        assert _fork(lambda: not child()) == 0
+        listener.stop()
+    finally:
+        listener.stop()
+        QueueListener._instances.pop((QueueListener, 'audit'))
+        daiolog.handler.channels.pop('audit')
+
+
+def test_listener_process_requires_queue_transport():
+    listener = QueueListener()
+    set_transport('shm')
+    try:
+        with pytest.raises(ValueError):
+            listener.start(process=True)
+    finally:
+        set_transport('thread')
+    assert listener._thread is None
+
+
+def test_slow_channel_does_not_block_others(tmp_path):
+    import threading
+    import time
+
+    release = threading.Event()
+
+    class SlowSink(BatchStreamHandler):
+        def emit(self, record):
+            release.wait()
+            super().emit(record)
+
+    filename = str(tmp_path / 'app.log')
+    logging.config.dictConfig({
+        'version': 1,
+        'disable_existing_loggers': False,
+        'handlers': {
+            'default': {
+                '()': 'daiolog.QueueHandler',
+                'sinks': [{'()': 'daiolog.RotatingFileSink', 'filename': filename}],
+            },
+            'audit': {
+                '()': 'daiolog.QueueHandler',
+                'channel': 'audit',
+                'sinks': [{'()': SlowSink, 'stream': io.StringIO()}],
+            },
+        },
+        'loggers': {
+            'test_slow_channel.app': {'handlers': ['default'], 'level': 'INFO', 'propagate': False},
+            'test_slow_channel.audit': {'handlers': ['audit'], 'level': 'INFO', 'propagate': False},
+        },
+    })
+    listener, audit = QueueListener(), QueueListener(channel='audit')
+    try:
+        listener.start()
+        audit.start()
+        stream = audit.handlers[0].stream
+        logging.getLogger('test_slow_channel.audit').info('Test audit')
+        for i in range(10):
+            logging.getLogger('test_slow_channel.app').info('Test app %s', i)
+        deadline = time.monotonic() + 5
+        while len(_read_json_lines(filename)) < 10 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert stream.getvalue() == ''
+        release.set()
+        audit.stop()
+        listener.stop()
+    finally:
+        release.set()
+        audit.stop()
+        set_sinks(None)
+        QueueListener._instances.pop((QueueListener, 'audit'))
+        daiolog.handler.channels.pop('audit')
+
+    assert [line['message'] for line in _read_json_lines(filename)] == ['Test app %s' % i for i in range(10)]
+    assert json.loads(stream.getvalue())['message'] == 'Test audit'
+
+
+def _fork(child):
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            code = 0 if child() else 2
+        finally:
+            os._exit(code)
+    return os.waitpid(pid, 0)[1]
+
+
+def _fork_logger(name, filename):
+    set_sinks([{'()': 'daiolog.RotatingFileSink', 'filename': filename}])
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers = [QueueHandler()]
+    return logger
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_fork_gives_child_fresh_listener(tmp_path):
+    filename = str(tmp_path / 'app.log')
+    logger = _fork_logger('test_fork_gives_child_fresh_listener', filename)
+    listener = QueueListener()
+    parent_queue = logger.handlers[0].queue
+
+    def child():
+        if listener._thread is None or not listener._thread.is_alive():
+            return False
+        if logger.handlers[0].queue is parent_queue or logger.handlers[0].queue is not listener.queue:
+            return False
+        logger.info('Test child')
+        listener.stop()
+        return True
+
+    try:
+        listener.start()
+        logger.info('Test before fork')
+        assert _fork(child) == 0
+        logger.info('Test parent')
+        listener.stop()
+    finally:
+        set_sinks(None)
+
+    messages = [line['message'] for line in _read_json_lines(filename)]
+    assert sorted(messages) == ['Test before fork', 'Test child', 'Test parent']
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_fork_connects_child_to_parent_listener(tmp_path):
+    filename = str(tmp_path / 'app.log')
+    logger = _fork_logger('test_fork_connects_child_to_parent_listener', filename)
+    set_transport('process')
+    listener = QueueListener()
+
+    def child():
+        listener.start()
+        if listener._thread is not None:
+            return False
+        logger.info('Test child')
+        queue = logger.handlers[0].queue
+        queue.close()
+        queue.join_thread()
+        return True
+
+    try:
+        listener.start()
+        assert _fork(child) == 0
+        logger.info('Test parent')
+        listener.stop()
+    finally:
+        set_sinks(None)
+        set_transport('thread')
+
+    assert [line['message'] for line in _read_json_lines(filename)] == ['Test child', 'Test parent']
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_fork_connects_child_priority_lane_to_parent_listener(tmp_path):
+    filename = str(tmp_path / 'app.log')
+    logger = _fork_logger('test_fork_connects_child_priority_lane_to_parent_listener', filename)
+    set_transport('process')
+    daiolog.set_priority(logging.ERROR)
+    listener = QueueListener()
+
+    def child():
+        logger.error('Test child error')
+        logger.info('Test child')
+        for queue in (logger.handlers[0].priority_queue, logger.handlers[0].queue):
+            queue.close()
+            queue.join_thread()
+        return True
+
+    try:
+        listener.start()
+        # the feeder threads of the queues are started before the fork
+        logger.error('Test parent error')
+        logger.info('Test parent')
+        assert _fork(child) == 0
+        listener.stop()
+        assert listener.stats()['priority_records'] == 2
+    finally:
+        daiolog.set_priority(None)
+        set_sinks(None)
+        set_transport('thread')
+
+    assert sorted(line['message'] for line in _read_json_lines(filename)) == [
+        'Test child', 'Test child error', 'Test parent', 'Test parent error']
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_fork_policy_fresh(tmp_path):
+    filename = str(tmp_path / 'app.log')
+    logger = _fork_logger('test_fork_policy_fresh', filename)
+    logger.handlers = [QueueHandler(transport='process')]
+    daiolog.set_fork_policy('fresh')
+    listener = QueueListener()
+    parent_queue = logger.handlers[0].queue
+
+    def child():
+        if logger.handlers[0].queue is parent_queue or daiolog.handler.get_channel().remote:
+            return False
+        logger.info('Test child')
+        listener.stop()
+        return listener._thread is None
+
+    try:
+        listener.start()
+        assert _fork(child) == 0
+        logger.info('Test parent')
+        listener.stop()
+    finally:
+        daiolog.set_fork_policy('parent')
+        set_sinks(None)
+        set_transport('thread')
+
+    assert sorted(line['message'] for line in _read_json_lines(filename)) == ['Test child', 'Test parent']
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='requires os.fork')
+def test_fork_child_drops_buffer_of_parent_sinks(tmp_path):
+    filename = str(tmp_path / 'app.log')
+    logger = _fork_logger('test_fork_child_drops_buffer_of_parent_sinks', filename)
+    listener = QueueListener()
+
+    def child():
+        if listener.handlers[0]._buffer:
+            return False
+        logger.info('Test child')
+        listener.stop()
+        return True
+
+    try:
+        listener.start()
+        sink = listener.handlers[0]
+        sink.acquire()
+        try:
+            sink.write(b'{"message": "Test buffered"}\n')
+            assert _fork(child) == 0
+        finally:
+            sink.release()
+        listener.stop()
+    finally:
+        set_sinks(None)
+
+    assert sorted(line['message'] for line in _read_json_lines(filename)) == ['Test buffered', 'Test child']
+
+
+def _log_in_spawned_child(filename):
+    @daiolog.entrypoint({
+        'version': 1,
+        'disable_existing_loggers': False,
+        'handlers': {
+            'default': {
+                '()': 'daiolog.QueueHandler',
+                'sinks': [{'()': 'daiolog.RotatingFileSink', 'filename': filename}],
+            },
+        },
+        'loggers': {
+            'test_spawn': {'handlers': ['default'], 'level': 'INFO', 'propagate': False},
+        },
+    })
+    def main():
+        logging.getLogger('test_spawn').info('Test spawned child')
+
+    main()
+
+
+def test_spawn_child_has_own_listener(tmp_path):
+    import multiprocessing
+
+    filename = str(tmp_path / 'app.log')
+    child_filename = str(tmp_path / 'child.log')
+    logger = _fork_logger('test_spawn_child_has_own_listener', filename)
+    listener = QueueListener()
+    try:
+        listener.start()
+        process = multiprocessing.get_context('spawn').Process(target=_log_in_spawned_child, args=(child_filename,))
+        process.start()
+        process.join()
+        logger.info('Test parent')
+        listener.stop()
+    finally:
+        set_sinks(None)
+
+    assert process.exitcode == 0
+    assert [line['message'] for line in _read_json_lines(child_filename)] == ['Test spawned child']
+    assert [line['message'] for line in _read_json_lines(filename)] == ['Test parent']
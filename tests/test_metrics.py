@@ -0,0 +1,176 @@
+import io
+import json
+import logging
+
+import pytest
+
+from daiolog import QueueHandler, QueueListener, set_metrics, prometheus_text
+from daiolog.metrics import Histogram, ListenerMetrics
+
+
+@pytest.fixture
+def metrics():
+    set_metrics(True)
+    yield
+    set_metrics(False)
+    QueueListener().metrics = None
+
+
+def test_histogram():
+    histogram = Histogram((0.001, 0.01, 0.1))
+    for value in (0.0005, 0.002, 0.003, 0.05, 1.0):
+        histogram.observe(value)
+
+    assert histogram.counts == [1, 2, 1, 1]
+    assert histogram.count == 5
+    assert histogram.max == 1.0
+    assert histogram.quantile(0.5) == 0.01
+    assert histogram.quantile(0.99) == 1.0
+    assert histogram.cumulative() == {'0.001': 1, '0.01': 3, '0.1': 4, '+Inf': 5}
+    assert histogram.snapshot()['sum'] == pytest.approx(1.0555)
+    assert 'buckets' not in histogram.snapshot()
+
+
+def test_histogram_merge():
+    first, second = Histogram((0.1,)), Histogram((0.1,))
+    first.observe(0.05)
+    second.observe(0.5)
+
+    assert first.merge(second).counts == [1, 1]
+    assert first.max == 0.5
+
+
+def test_empty_histogram():
+    assert Histogram().snapshot() == {'count': 0, 'sum': 0.0, 'max': 0.0, 'p50': 0.0, 'p90': 0.0, 'p99': 0.0}
+
+
+def test_listener_metrics_count_bytes():
+    metrics = ListenerMetrics()
+    metrics.observe_write(0.001, 'abc\n')
+    metrics.observe_write(0.001, 'абв\n')
+    metrics.observe_write(0.001, b'abc\n')
+
+    assert metrics.bytes == 4 + 7 + 4
+    assert metrics.write_time.count == 3
+
+
+def test_metrics_disabled_by_default():
+    handler = QueueHandler()
+    listener = QueueListener()
+
+    assert handler.metrics is None
+    assert handler.stats()['enqueue_time'] is None
+    assert listener.stats()['enabled'] is False
+
+
+def test_listener_stats(metrics):
+    stream = io.StringIO()
+    listener = QueueListener()
+    listener.handlers[0].setStream(stream)
+
+    logger = logging.getLogger('test_listener_stats')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = QueueHandler()
+    logger.handlers.append(handler)
+
+    try:
+        listener.start()
+        for i in range(5):
+            logger.info('Test metrics %s', i)
+        listener.stop()
+    finally:
+        listener.handlers[0].setStream(None)
+        logger.handlers.remove(handler)
+
+    stats = listener.stats()
+    assert stats['enabled'] is True
+    assert stats['records'] == 5
+    assert stats['enqueued'] >= 5
+    assert stats['bytes'] == len(stream.getvalue().encode())
+    assert stats['latency']['count'] == 5
+    assert stats['write_time']['count'] == stats['batches']
+    assert stats['format_time_per_record'] > 0
+    assert stats['queue_depth'] == 0
+    assert stats['callsite_cache']['hits'] >= 4
+    assert stats['callsite_cache']['hit_rate'] > 0
+    assert handler.stats()['enqueued'] == 5
+
+
+def test_listener_self_report(metrics, mocker):
+    set_metrics(True, 0.0001)
+    stream = io.StringIO()
+    listener = QueueListener()
+    listener.handlers[0].setStream(stream)
+
+    logger = logging.getLogger('test_listener_self_report')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = QueueHandler()
+    logger.handlers.append(handler)
+
+    try:
+        listener.start()
+        mocker.patch('time.monotonic', return_value=listener._report_at)
+        logger.info('Test metrics')
+        listener.stop()
+    finally:
+        listener.handlers[0].setStream(None)
+        logger.handlers.remove(handler)
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [line['message'] for line in lines] == ['Test metrics', 'Logging pipeline stats']
+    assert lines[1]['logger_name'] == 'daiolog.metrics'
+    assert lines[1]['extra']['stats']['records'] == 1
+
+
+def test_prometheus_text():
+    latency = Histogram((0.1,))
+    latency.observe(0.05)
+    text = prometheus_text({
+        'records': 3,
+        'bytes': 120,
+        'queue_depth': 2,
+        'dropped': {'drop_newest': 4},
+        'latency': latency.snapshot(buckets=True),
+        'callsite_cache': {'hits': 9, 'misses': 1, 'size': 1, 'hit_rate': 0.9},
+    })
+
+    assert '# TYPE daiolog_records_total counter\ndaiolog_records_total 3\n' in text
+    assert 'daiolog_bytes_total 120\n' in text
+    assert 'daiolog_queue_depth 2\n' in text
+    assert 'daiolog_dropped_total{policy="drop_newest"} 4\n' in text
+    assert 'daiolog_latency_seconds_bucket{le="0.1"} 1\n' in text
+    assert 'daiolog_latency_seconds_bucket{le="+Inf"} 1\n' in text
+    assert 'daiolog_latency_seconds_count 1\n' in text
+    assert 'daiolog_enqueue_seconds' not in text
+    assert 'daiolog_cache_hits_total{cache="callsite"} 9\n' in text
+    assert 'daiolog_cache_misses_total{cache="callsite"} 1\n' in text
+    assert 'cache="traceback"' not in text
+
+
+def test_prometheus_text_from_listener(metrics):
+    listener = QueueListener()
+    listener.start()
+    listener.stop()
+    text = prometheus_text()
+
+    assert 'daiolog_records_total 0\n' in text
+    assert 'daiolog_latency_seconds_bucket{le="+Inf"} 0\n' in text
+
+
+def test_prometheus_text_families_are_unique(metrics):
+    listener = QueueListener()
+    listener.start()
+    listener.stop()
+
+    families = {}
+    for line in prometheus_text().splitlines():
+        if line.startswith('# TYPE '):
+            _, _, name, kind = line.split()
+            assert name not in families
+            families[name] = kind
+    for name, kind in families.items():
+        if kind == 'histogram':
+            assert not {name + suffix for suffix in ('_bucket', '_sum', '_count')} & set(families)
+    assert families['daiolog_write_seconds'] == 'histogram'
@@ -0,0 +1,119 @@
+import logging
+
+import pytest
+
+from daiolog import QueueHandler, QueueListener, RateLimiter
+from tests.conftest import make_record
+
+
+def test_rate_limiter_passes_burst():
+    limiter = RateLimiter(rate=2, burst=3)
+
+    assert [len(limiter.acquire(make_record('Test storm', logging.WARNING, created=100.0))) for _ in range(5)] == [1, 1, 1, 0, 0]
+    assert limiter.suppressed == 2
+
+
+def test_rate_limiter_collapses_repeats():
+    limiter = RateLimiter(rate=1, burst=1, window=10)
+    first = make_record('Test storm', logging.WARNING, created=100.0)
+    assert limiter.acquire(first) == [first]
+    for created in (100.1, 100.2, 100.3):
+        assert limiter.acquire(make_record('Test storm', logging.WARNING, created=created)) == []
+
+    record = make_record('Test storm', logging.WARNING, created=101.5)
+    summary, published = limiter.acquire(record)
+
+    assert published is record
+    assert summary.repeated == 3
+    assert summary.first_created == 100.1
+    assert summary.last_created == 100.3
+    assert not hasattr(record, 'repeated')
+
+
+def test_rate_limiter_collapses_after_window():
+    limiter = RateLimiter(rate=0.01, burst=1, window=1)
+    limiter.acquire(make_record('Test storm', logging.WARNING, created=100.0))
+    assert limiter.acquire(make_record('Test storm', logging.WARNING, created=100.5)) == []
+
+    summary, = limiter.acquire(make_record('Test storm', logging.WARNING, created=101.5))
+
+    assert summary.repeated == 2
+    assert summary.first_created == 100.5
+    assert summary.last_created == 101.5
+    assert limiter.flush() == []
+
+
+def test_rate_limiter_keys_by_callsite():
+    limiter = RateLimiter(rate=1, burst=1)
+
+    assert limiter.acquire(make_record('Test storm', logging.WARNING, created=100.0, lineno=1))
+    assert limiter.acquire(make_record('Test storm', logging.WARNING, created=100.0, lineno=2))
+    assert not limiter.acquire(make_record('Test storm', logging.WARNING, created=100.0, lineno=1))
+
+
+def test_rate_limiter_flush():
+    limiter = RateLimiter(rate=1, burst=1)
+    limiter.acquire(make_record('Test storm', logging.WARNING, created=100.0))
+    limiter.acquire(make_record('Test storm', logging.WARNING, created=100.1))
+
+    summary, = limiter.flush()
+
+    assert summary.repeated == 1
+    assert limiter.flush() == []
+
+
+def test_rate_limiter_evicts_callsites():
+    limiter = RateLimiter(rate=1, burst=1, max_keys=2)
+    limiter.acquire(make_record('Test storm', logging.WARNING, created=100.0, lineno=1))
+    limiter.acquire(make_record('Test storm', logging.WARNING, created=100.1, lineno=1))
+    limiter.acquire(make_record('Test storm', logging.WARNING, created=100.0, lineno=2))
+
+    summary, record = limiter.acquire(make_record('Test storm', logging.WARNING, created=100.2, lineno=3))
+
+    assert (summary.lineno, summary.repeated) == (1, 1)
+    assert record.lineno == 3
+    assert len(limiter._buckets) == 2
+
+
+def test_rate_limiter_rejects_rate():
+    with pytest.raises(ValueError):
+        RateLimiter(rate=0)
+
+
+def test_handler_rate_limit(mocker):
+    handler = QueueHandler(rate_limit=5, rate_burst=2, rate_window=60)
+    prepare = mocker.spy(handler, 'prepare')
+    records = []
+    mocker.patch.object(handler, 'enqueue', records.append)
+
+    logger = logging.getLogger('test_handler_rate_limit')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers = [handler]
+
+    for i in range(100):
+        logger.warning('Test storm %s', i)
+    handler.flush()
+
+    assert prepare.call_count == 3
+    assert [record.msg for record in records] == ['Test storm 0', 'Test storm 1', 'Test storm 99']
+    assert records[-1].extra['repeated'] == 98
+    assert handler.stats()['suppressed'] == 98
+
+
+def test_listener_stop_flushes_rate_limited_records(mocker):
+    listener = QueueListener()
+    mocker.patch.object(listener.handlers[0], 'handle_batch')
+    emit = mocker.patch.object(listener.handlers[0], 'emit')
+
+    logger = logging.getLogger('test_listener_stop_flushes_rate_limited_records')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers = [QueueHandler(rate_limit=1, rate_window=60)]
+
+    listener.start()
+    for i in range(10):
+        logger.warning('Test storm %s', i)
+    listener.stop()
+
+    assert [call.args[0].extra.get('repeated') for call in emit.call_args_list] == [None, 9]
@@ -0,0 +1,68 @@
+import gzip
+import io
+import json
+import logging
+
+import pytest
+
+from daiolog import BinaryFormatter
+from daiolog.__main__ import main
+from daiolog.binary import Packer
+from daiolog.reader import BinaryReader, read_frames, unpackb
+
+
+def make_frames(*messages):
+    formatter = BinaryFormatter(fields=['message'])
+    return formatter.header() + b''.join(
+        formatter.format_bytes(logging.LogRecord('test_reader', logging.INFO, __file__, 1, msg, None, None))
+        for msg in messages
+    )
+
+
+def test_unpackb_rejects_malformed_data():
+    with pytest.raises(ValueError):
+        unpackb(Packer().pack('text')[:-1])
+    with pytest.raises(ValueError):
+        unpackb(Packer().pack('text') + b'\x00')
+    with pytest.raises(ValueError):
+        unpackb(b'\xc1')
+    with pytest.raises(ValueError):
+        unpackb(Packer(['key']).pack({'key': 1}))
+
+
+def test_unpackb_decodes_binary():
+    assert unpackb(b'\xc4\x03abc') == b'abc'
+
+
+def test_read_frames_rejects_truncated_frame():
+    data = make_frames('one')
+
+    assert len(list(read_frames(io.BytesIO(data)))) == 2
+    with pytest.raises(ValueError):
+        list(read_frames(io.BytesIO(data[:-1])))
+
+
+def test_reader_switches_key_dictionary():
+    data = make_frames('one') + BinaryFormatter(fields=['level', 'message'], keys=['message', 'level']).header()
+    data += BinaryFormatter(fields=['level', 'message'], keys=['message', 'level']).format_bytes(
+        logging.LogRecord('test_reader', logging.ERROR, __file__, 1, 'two', None, None))
+
+    assert list(BinaryReader(io.BytesIO(data))) == [{'message': 'one'}, {'level': 'ERROR', 'message': 'two'}]
+
+
+def test_reader_rejects_unknown_version():
+    with pytest.raises(ValueError):
+        list(BinaryReader(io.BytesIO(make_frames().replace(b'\x92\x01', b'\x92\x02', 1))))
+
+
+def test_decode_command(tmp_path, capsys):
+    filename = tmp_path / 'app.log'
+    filename.write_bytes(make_frames('one', 'two'))
+    segment = tmp_path / 'app.log.1.gz'
+    with gzip.open(segment, 'wb') as file:
+        file.write(make_frames('zero'))
+
+    main(['decode', str(segment), str(filename), '--serializer', 'json'])
+
+    lines = capsys.readouterr().out.splitlines()
+    assert [json.loads(line) for line in lines] == [{'message': 'zero'}, {'message': 'one'}, {'message': 'two'}]
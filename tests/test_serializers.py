@@ -0,0 +1,131 @@
+import dataclasses
+import datetime as dt
+import enum
+import json
+import pathlib
+import typing as t
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from daiolog import UniversalJSONEncoder
+from daiolog.serializers import Serializer, StdlibSerializer, get_serializer
+
+
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+@pytest.fixture(params=['json', 'orjson'])
+def serializer(request):
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    return get_serializer(request.param)
+
+
+RECORD_SHAPES = (
+    {
+        'logger_name': 'my.packg', 'level': 'INFO', 'timestamp': '2023-01-16T09:21:43.511+00:00',
+        'message': 'Start main', 'pathname': '__main__.py', 'module': '__main__', 'function': 'main',
+        'line': 35, 'traceback': None, 'extra': {'pid': 60720},
+    },
+    {'message': 'Юникод и "кавычки"\n\t', 'extra': {'ключ': 'значение ✓'}},
+    {'extra': {'int': 1, 'float': 1.5, 'bool': True, 'none': None, 'big': 2 ** 70}},
+    {'extra': {'list': [1, 'a', None], 'tuple': (1, 2), 'nested': {'a': {'b': [{'c': 1}]}}}},
+    {'extra': {1: 'int key', 2.5: 'float key', True: 'bool key', None: 'none key'}},
+    {'extra': {'set': {3}, 'date': dt.date(2023, 1, 1), 'datetime': dt.datetime(2023, 1, 1, 1, 2, 3)}},
+    {'extra': {'aware': dt.datetime(2023, 1, 1, 1, 2, 3, tzinfo=dt.timezone.utc)}},
+    {'extra': {'decimal': Decimal('1.10'), 'object': object.__new__(Point), 'bytes': b'abc'}},
+)
+
+
+@pytest.mark.parametrize('shape', RECORD_SHAPES)
+def test_serializer_conformance(serializer, shape):
+    expected = json.loads(json.dumps(shape, cls=UniversalJSONEncoder))
+    result = json.loads(serializer.dumps(shape))
+    assert result == expected
+
+
+def test_serializer_honours_registered_converter(serializer, mocker):
+    mocker.patch.dict(UniversalJSONEncoder._encoders)
+    mocker.patch.dict(UniversalJSONEncoder._cache)
+    UniversalJSONEncoder.register_converter(Point, lambda p: {'x': p.x, 'y': p.y})
+
+    assert json.loads(serializer.dumps({'point': Point(1, 2)})) == {'point': {'x': 1, 'y': 2}}
+
+
+def test_auto_serializer():
+    try:
+        import orjson  # noqa
+    except ImportError:
+        assert isinstance(get_serializer(), StdlibSerializer)
+    else:
+        assert get_serializer().name == 'orjson'
+
+
+def test_unknown_serializer():
+    with pytest.raises(ValueError):
+        get_serializer('unknown')
+
+
+def test_serializer_requires_dumps():
+    class NoDumps(Serializer):
+        pass
+
+    with pytest.raises(TypeError):
+        NoDumps()
+
+
+class Color(enum.Enum):
+    RED = 'red'
+
+
+class Size(enum.IntEnum):
+    LARGE = 3
+
+
+class Pair(t.NamedTuple):
+    left: int
+    right: str
+
+
+@dataclasses.dataclass
+class Item:
+    name: str
+    tags: list
+
+
+@pytest.mark.parametrize('value', (
+    uuid.UUID(int=1),
+    Color.RED,
+    Size.LARGE,
+    pathlib.PurePosixPath('/var/log/app.log'),
+    Pair(1, 'a'),
+    Item('name', ['a', 'b']),
+    b'bytes',
+    Decimal('10.50'),
+    frozenset(['a']),
+    dt.time(1, 2, 3),
+))
+def test_serializer_conformance_converters(serializer, value):
+    shape = {'extra': {'key': value, 'nested': [value]}}
+    expected = json.loads(json.dumps(shape, cls=UniversalJSONEncoder))
+    assert json.loads(serializer.dumps(shape)) == expected
+
+
+def test_orjson_serializer_falls_back_for_native_type_converter(mocker):
+    pytest.importorskip('orjson')
+    serializer = get_serializer('orjson')
+    fallback = mocker.spy(serializer._fallback, 'dumps')
+    serializer.dumps({'key': uuid.UUID(int=1)})
+    assert fallback.call_count == 0
+
+    mocker.patch.dict(UniversalJSONEncoder._encoders)
+    mocker.patch.dict(UniversalJSONEncoder._cache)
+    UniversalJSONEncoder.register_converter(uuid.UUID, lambda x: x.int)
+
+    assert json.loads(serializer.dumps({'key': uuid.UUID(int=1)})) == {'key': 1}
+    assert fallback.call_count == 1
@@ -0,0 +1,181 @@
+import logging
+import os
+import subprocess
+import sys
+import time
+from multiprocessing import Process
+from queue import Empty, Full
+
+import pytest
+
+from daiolog import QueueHandler, QueueListener, set_transport
+from daiolog.aggregator import RecordTooLarge
+from daiolog.shm import SharedMemoryQueue, SharedMemoryRing
+from tests.conftest import make_envelope
+
+
+@pytest.fixture
+def ring():
+    ring = SharedMemoryRing(64)
+    yield ring
+    ring.close(unlink=True)
+
+
+def test_ring_write_read(ring):
+    assert ring.read() is None
+    assert ring.write(b'first')
+    assert ring.write(b'second')
+    assert ring.read() == b'first'
+    assert ring.read() == b'second'
+    assert ring.read() is None
+
+
+def test_ring_wraps_around(ring):
+    for i in range(20):
+        payload = b'%02d' % i * 10
+        assert ring.write(payload)
+        assert ring.read() == payload
+
+
+def test_ring_full(ring):
+    assert ring.write(b'x' * 30)
+    assert ring.write(b'x' * 26)
+    assert not ring.write(b'')
+    assert ring.read() == b'x' * 30
+    assert ring.write(b'y' * 20)
+
+
+def test_ring_attach_by_name(ring):
+    reader = SharedMemoryRing(name=ring.name)
+    ring.write(b'data')
+    assert reader.size == 64
+    assert reader.read() == b'data'
+    reader.close()
+
+
+def test_queue_put_get():
+    queue = SharedMemoryQueue(1024)
+    queue.put(make_envelope('first'))
+    queue.put_nowait(make_envelope('second'))
+
+    assert queue.get().msg == 'first'
+    assert queue.get_nowait().msg == 'second'
+    with pytest.raises(Empty):
+        queue.get_nowait()
+    with pytest.raises(Empty):
+        queue.get(True, 0.01)
+
+
+def test_queue_full():
+    queue = SharedMemoryQueue(512)
+    with pytest.raises(Full):
+        for _ in range(100):
+            queue.put_nowait(make_envelope('record'))
+    with pytest.raises(Full):
+        queue.put(make_envelope('record'), True, 0.01)
+    with pytest.raises(RecordTooLarge):
+        queue.put_nowait(make_envelope('x' * 1024))
+
+
+def test_queue_rejects_malformed_records():
+    queue = SharedMemoryQueue(1024)
+    queue.put(make_envelope('first'))
+    queue._get_producer_ring().write(b'garbage')
+    queue.put(make_envelope('second'))
+
+    assert [queue.get_nowait().msg for _ in range(2)] == ['first', 'second']
+    assert queue.rejected == 1
+
+
+def _put_from_child_process(queue):
+    queue.put(make_envelope('child'))
+
+
+def test_queue_unmaps_rings_of_exited_producers(mocker):
+    mocker.patch('daiolog.shm.REAP_INTERVAL', 0)
+    queue = SharedMemoryQueue(1024)
+    queue.put(make_envelope('parent'))
+    process = Process(target=_put_from_child_process, args=(queue,))
+    process.start()
+    process.join()
+
+    assert sorted(queue.get_nowait().msg for _ in range(2)) == ['child', 'parent']
+    assert len(queue._rings) == 2
+    with pytest.raises(Empty):
+        queue.get_nowait()
+    assert [ring.pid for ring in queue._rings] == [os.getpid()]
+
+
+_NEVER_ATTACHED = '''
+import logging
+from daiolog import QueueHandler
+from daiolog.shm import SharedMemoryQueue
+
+queue = SharedMemoryQueue(1024)
+queue.put(QueueHandler().prepare(logging.LogRecord('test_shm', logging.INFO, '', 1, 'record', None, None)))
+print(queue._producer.name)
+'''
+
+
+@pytest.mark.skipif(not os.path.isdir('/dev/shm'), reason='requires /dev/shm')
+def test_ring_without_consumer_is_unlinked():
+    result = subprocess.run([sys.executable, '-c', _NEVER_ATTACHED], capture_output=True, text=True,
+                            env={**os.environ, 'PYTHONPATH': os.pathsep.join(sys.path)}, check=True)
+    path = os.path.join('/dev/shm', result.stdout.strip().lstrip('/'))
+    deadline = time.monotonic() + 5
+    while os.path.exists(path) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert not os.path.exists(path)
+
+
+def test_queue_returns_sentinel_after_all_rings():
+    from daiolog.aggregator import pack
+
+    queue = SharedMemoryQueue(1024)
+    rings = [SharedMemoryRing(1024) for _ in range(3)]
+    queue._announcements.put((rings[0].name, os.getpid()))
+    queue.put(None)
+    for index, ring in enumerate(rings[1:]):
+        queue._announcements.put((ring.name, os.getpid()))
+        ring.write(pack(make_envelope('record %s' % index)))
+
+    assert sorted(queue.get_nowait().msg for _ in range(2)) == ['record 0', 'record 1']
+    assert queue.get_nowait() is None
+    for ring in rings:
+        ring.close()
+
+
+def _log_from_child_process(index):
+    logger = logging.getLogger('test_shm_transport')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers.append(QueueHandler())
+    for i in range(100):
+        logger.info('Child %s record %s', index, i)
+
+
+def test_shm_transport(mocker):
+    records = []
+
+    def mock_emit(rec):
+        records.append(rec)
+
+    listener = QueueListener()
+    mocker.patch.object(listener.handlers[0], 'emit', mock_emit)
+
+    set_transport('shm')
+    try:
+        listener.start()
+        processes = [Process(target=_log_from_child_process, args=(index,)) for index in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        listener.stop()
+    finally:
+        set_transport('thread')
+
+    for index in range(3):
+        messages = [rec.msg for rec in records if rec.msg.startswith('Child %s ' % index)]
+        assert messages == ['Child %s record %s' % (index, i) for i in range(100)]
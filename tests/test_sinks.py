@@ -0,0 +1,205 @@
+import glob
+import gzip
+import io
+import json
+import logging
+import time
+
+import pytest
+
+import daiolog.sinks
+from daiolog import BatchStreamHandler, JsonFormatter, RotatingFileSink
+from daiolog.sinks import write_fd
+from tests.conftest import make_record
+
+
+def test_handle_batch_writes_once(mocker):
+    stream = io.StringIO()
+    handler = BatchStreamHandler(stream)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    write = mocker.spy(stream, 'write')
+    flush = mocker.spy(stream, 'flush')
+
+    handler.handle_batch([make_record('one'), make_record('two'), make_record('three')])
+
+    assert write.call_count == 1
+    assert flush.call_count == 1
+    assert stream.getvalue() == 'one\ntwo\nthree\n'
+
+
+def test_handle_batch_respects_filters():
+    stream = io.StringIO()
+    handler = BatchStreamHandler(stream)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    handler.addFilter(lambda record: record.msg != 'skip')
+
+    handler.handle_batch([make_record('one'), make_record('skip'), make_record('two')])
+
+    assert stream.getvalue() == 'one\ntwo\n'
+
+
+def test_handle_batch_skips_write_for_empty_batch(mocker):
+    stream = io.StringIO()
+    handler = BatchStreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    write = mocker.spy(stream, 'write')
+
+    handler.handle_batch([])
+
+    assert write.call_count == 0
+
+
+def test_write_fd_retries_partial_writes(mocker):
+    written = []
+    blocked = []
+
+    def partial_write(fd, data):
+        if len(written) == 1 and not blocked:
+            blocked.append(fd)
+            raise BlockingIOError
+        written.append(bytes(data[:3]))
+        return len(written[-1])
+
+    mocker.patch('os.write', side_effect=partial_write)
+    select = mocker.patch('select.select')
+
+    write_fd(5, bytearray(b'abcdefgh'))
+
+    assert b''.join(written) == b'abcdefgh'
+    assert select.call_count == 1
+
+
+def test_handle_batch_writes_bytes_to_fd(tmp_path, mocker):
+    filename = str(tmp_path / 'app.log')
+    with open(filename, 'w', encoding='utf-8') as stream:
+        handler = BatchStreamHandler(stream)
+        handler.setFormatter(JsonFormatter(fields=['message']))
+        format_bytes = mocker.spy(handler.formatter, 'format_bytes')
+        stream.write('text\n')
+
+        handler.handle_batch([make_record('one'), make_record('двa')])
+
+    assert format_bytes.call_count == 2
+    with open(filename, encoding='utf-8') as file:
+        lines = file.read().splitlines()
+    assert lines[0] == 'text'
+    assert [json.loads(line)['message'] for line in lines[1:]] == ['one', 'двa']
+
+
+def test_handle_batch_writes_str_to_other_encodings(tmp_path, mocker):
+    filename = str(tmp_path / 'app.log')
+    with open(filename, 'w', encoding='utf-16') as stream:
+        handler = BatchStreamHandler(stream)
+        handler.setFormatter(JsonFormatter(fields=['message']))
+        format_bytes = mocker.spy(handler.formatter, 'format_bytes')
+
+        handler.handle_batch([make_record('one')])
+
+    assert format_bytes.call_count == 0
+    with open(filename, encoding='utf-16') as file:
+        assert json.loads(file.read()) == {'message': 'one'}
+
+
+def read_lines(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt') as file:
+        return file.read().splitlines()
+
+
+def test_rotating_file_sink_writes_records(tmp_path):
+    filename = str(tmp_path / 'app.log')
+    sink = RotatingFileSink(filename)
+    sink.setFormatter(logging.Formatter('%(message)s'))
+
+    sink.handle(make_record('one'))
+    sink.handle_batch([make_record('two'), make_record('three')])
+    sink.close()
+
+    assert read_lines(filename) == ['one', 'two', 'three']
+
+
+def test_rotating_file_sink_buffers_batches(tmp_path, mocker):
+    filename = str(tmp_path / 'app.log')
+    sink = RotatingFileSink(filename, buffer_size=64)
+    sink.setFormatter(logging.Formatter('%(message)s'))
+    write = mocker.spy(daiolog.sinks, 'write_fd')
+
+    sink.handle_batch([make_record('one'), make_record('two')])
+    assert read_lines(filename) == []
+    sink.handle_batch([make_record('x' * 64)])
+    assert read_lines(filename) == ['one', 'two', 'x' * 64]
+    sink.handle(make_record('three'))
+    sink.flush()
+    sink.close()
+
+    assert read_lines(filename) == ['one', 'two', 'x' * 64, 'three']
+    assert write.call_count == 2
+
+
+def test_rotating_file_sink_rotates_by_size(tmp_path):
+    filename = str(tmp_path / 'app.log')
+    sink = RotatingFileSink(filename, max_bytes=10, compress=False)
+    sink.setFormatter(logging.Formatter('%(message)s'))
+
+    for msg in ('first', 'second', 'third'):
+        sink.handle(make_record(msg))
+    sink.close()
+
+    segments = sorted(glob.glob(filename + '.*'), key=lambda name: name[:-3] if name.endswith('.gz') else name)
+    assert [read_lines(segment) for segment in segments] == [['first'], ['second']]
+    assert read_lines(filename) == ['third']
+
+
+def test_rotating_file_sink_rotates_by_time(tmp_path, mocker):
+    filename = str(tmp_path / 'app.log')
+    now = time.time()
+    mocker.patch('time.time', return_value=now)
+    sink = RotatingFileSink(filename, interval=60, compress=False)
+    sink.setFormatter(logging.Formatter('%(message)s'))
+
+    sink.handle(make_record('first'))
+    time.time.return_value = now + 61
+    sink.handle(make_record('second'))
+    sink.close()
+
+    assert [read_lines(segment) for segment in glob.glob(filename + '.*')] == [['first']]
+    assert read_lines(filename) == ['second']
+
+
+def test_rotating_file_sink_compresses_segments(tmp_path):
+    filename = str(tmp_path / 'app.log')
+    sink = RotatingFileSink(filename, max_bytes=10, backup_count=2)
+    sink.setFormatter(logging.Formatter('%(message)s'))
+
+    for msg in ('first', 'second', 'third', 'fourth'):
+        sink.handle(make_record(msg))
+    sink.close()
+
+    segments = sorted(glob.glob(filename + '.*'), key=lambda name: name[:-3] if name.endswith('.gz') else name)
+    assert all(segment.endswith('.gz') for segment in segments)
+    assert [read_lines(segment) for segment in segments] == [['second'], ['third']]
+    assert read_lines(filename) == ['fourth']
+
+
+def test_rotating_file_sink_writes_bytes(tmp_path, mocker):
+    filename = str(tmp_path / 'app.log')
+    sink = RotatingFileSink(filename, max_bytes=40, compress=False)
+    sink.setFormatter(JsonFormatter(fields=['message']))
+    format_bytes = mocker.spy(sink.formatter, 'format_bytes')
+
+    sink.handle_batch([make_record('first'), make_record('second')])
+    sink.handle_batch([make_record('third')])
+    sink.close()
+
+    assert format_bytes.call_count == 3
+    segments = glob.glob(filename + '.*')
+    assert [json.loads(line)['message'] for line in read_lines(segments[0])] == ['first', 'second']
+    assert [json.loads(line)['message'] for line in read_lines(filename)] == ['third']
+
+
+def test_batch_handler_requires_write():
+    class Sink(daiolog.sinks.BatchHandlerMixin, logging.Handler):
+        pass
+
+    with pytest.raises(TypeError):
+        Sink()
@@ -0,0 +1,134 @@
+import io
+import json
+import logging
+import pickle
+import sys
+
+import pytest
+
+from daiolog import QueueHandler, QueueListener
+from daiolog.aggregator import pack, unpack
+from daiolog.tracebacks import TracebackRenderer, capture_traceback, primitive_traceback
+
+
+def fail(depth=0):
+    if depth:
+        return fail(depth - 1)
+    return {}['missing']
+
+
+def recurse(depth):
+    return recurse(depth + 1)
+
+
+def raise_chained():
+    try:
+        fail()
+    except KeyError as exc:
+        raise ValueError('wrapped') from exc
+
+
+def raise_in_handler():
+    try:
+        fail()
+    except KeyError:
+        1 / 0
+
+
+def raise_suppressed():
+    try:
+        fail()
+    except KeyError:
+        raise ValueError('suppressed') from None
+
+
+def raise_recursion():
+    recurse(0)
+
+
+def raise_syntax_error():
+    compile('a = (1,', '<string>', 'exec')
+
+
+def exc_info_of(func):
+    try:
+        func()
+    except BaseException:
+        return sys.exc_info()
+
+
+@pytest.mark.parametrize('func', [
+    lambda: fail(3), raise_chained, raise_in_handler, raise_suppressed, raise_recursion, raise_syntax_error,
+])
+def test_render_matches_format_exception(func):
+    exc_info = exc_info_of(func)
+
+    assert TracebackRenderer().render(capture_traceback(exc_info)) == logging.Formatter().formatException(exc_info)
+
+
+def test_render_exception_without_traceback():
+    exc_info = (ValueError, ValueError('no traceback'), None)
+
+    assert TracebackRenderer().render(capture_traceback(exc_info)) == logging.Formatter().formatException(exc_info)
+
+
+def test_exception_outside_of_except_block_is_formatted_eagerly():
+    record = logging.LogRecord('test_tracebacks', logging.ERROR, __file__, 1, 'msg', None, (None, None, None))
+
+    envelope = QueueHandler().prepare(record)
+
+    assert capture_traceback((None, None, None)) is None
+    assert envelope.exc_frames is None
+    assert envelope.exc_text == logging.Formatter().formatException((None, None, None)) == 'NoneType: None'
+
+
+@pytest.mark.skipif(sys.version_info < (3, 11), reason='exception groups')
+def test_exception_groups_are_not_captured():
+    exc_info = exc_info_of(lambda: exec("raise ExceptionGroup('group', [ValueError('a')])"))
+
+    assert capture_traceback(exc_info) is None
+
+
+def test_packed_traceback_is_primitive():
+    exc_info = exc_info_of(raise_chained)
+    record = QueueHandler().prepare(logging.LogRecord('test_tracebacks', logging.ERROR, __file__, 1, 'msg', None, exc_info))
+
+    packed = unpack(pack(record)).exc_frames
+    pickled = pickle.loads(pickle.dumps(record)).exc_frames
+
+    assert packed == pickled == primitive_traceback(record.exc_frames)
+    assert TracebackRenderer().render(packed) == logging.Formatter().formatException(exc_info)
+
+
+def test_renderer_caches_stacks():
+    renderer = TracebackRenderer(maxsize=2)
+    texts = []
+    for i in range(3):
+        try:
+            fail()
+        except KeyError:
+            texts.append(renderer.render(capture_traceback(sys.exc_info())))
+
+    assert texts[0] == texts[1] == texts[2]
+    assert renderer.cache_info() == {'hits': 2, 'misses': 1, 'size': 1, 'maxsize': 2}
+
+
+def test_listener_renders_tracebacks(mocker):
+    stream = io.StringIO()
+    listener = QueueListener()
+    listener.handlers[0].setStream(stream)
+
+    logger = logging.getLogger('test_listener_renders_tracebacks')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.handlers = [QueueHandler()]
+
+    exc_info = exc_info_of(raise_chained)
+    try:
+        listener.start()
+        logger.error('Test error', exc_info=exc_info)
+        listener.stop()
+    finally:
+        listener.handlers[0].setStream(None)
+
+    assert json.loads(stream.getvalue())['traceback'] == logging.Formatter().formatException(exc_info)